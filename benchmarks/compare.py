@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Compare two benchmark result files level by level
+
+    python benchmarks/compare.py benchmarks/results/base.json benchmarks/results/head.json
+
+Exits with status 1 when throughput drops or p95 latency grows by more than --threshold.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# (label, path into a level, whether a higher value is better)
+METRICS: List[Tuple[str, Tuple[str, ...], bool]] = [
+    ("throughput_rps", ("throughput_rps",), True),
+    ("latency_p50", ("latency_seconds", "p50"), False),
+    ("latency_p95", ("latency_seconds", "p95"), False),
+    ("latency_p99", ("latency_seconds", "p99"), False),
+    ("ttft_p50", ("ttft_seconds", "p50"), False),
+    ("ttft_p95", ("ttft_seconds", "p95"), False),
+    ("peak_rss_bytes", ("peak_rss_bytes",), False),
+]
+GATED = {"throughput_rps", "latency_p95"}
+
+
+def lookup(level: Dict, path: Tuple[str, ...]) -> Optional[float]:
+    value = level
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare(base: Dict, head: Dict, threshold: float) -> Tuple[List[str], List[str]]:
+    """Return report lines and regressions for the concurrency levels both runs share"""
+    base_levels = {level["concurrency"]: level for level in base["levels"]}
+    lines = [f"{base.get('revision')} -> {head.get('revision')}"]
+    regressions = []
+
+    for level in head["levels"]:
+        concurrency = level["concurrency"]
+        if concurrency not in base_levels:
+            continue
+        lines.append(f"concurrency={concurrency}")
+        for label, path, higher_is_better in METRICS:
+            before = lookup(base_levels[concurrency], path)
+            after = lookup(level, path)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            lines.append(f"  {label:<15} {before:>14.4f} {after:>14.4f} {change:+8.1%}")
+            worse = -change if higher_is_better else change
+            if label in GATED and worse > threshold:
+                regressions.append(f"concurrency={concurrency} {label} {change:+.1%}")
+
+    return lines, regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base", type=Path)
+    parser.add_argument("head", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed regression ratio")
+    args = parser.parse_args(argv)
+
+    base = json.loads(args.base.read_text())
+    head = json.loads(args.head.read_text())
+    lines, regressions = compare(base, head, args.threshold)
+    print("\n".join(lines))
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
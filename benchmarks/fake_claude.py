@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""Stand-in for the claude CLI with configurable timing, for benchmarks and tests
+
+Understands the options the provider passes (-p, --output-format text|json|stream-json,
+--input-format stream-json, --session-id, --resume, ...) and answers every prompt with a
+fixed number of tokens. Behaviour is tuned with environment variables:
+
+    FAKE_CLAUDE_STARTUP_DELAY   seconds before the process is ready (default 0)
+    FAKE_CLAUDE_TOKEN_DELAY     seconds between output tokens (default 0)
+    FAKE_CLAUDE_OUTPUT_TOKENS   tokens per answer (default 20)
+    FAKE_CLAUDE_FAILURE_RATE    probability in [0, 1] that a prompt fails (default 0)
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+STARTUP_DELAY = env_float("FAKE_CLAUDE_STARTUP_DELAY", 0.0)
+TOKEN_DELAY = env_float("FAKE_CLAUDE_TOKEN_DELAY", 0.0)
+OUTPUT_TOKENS = int(env_float("FAKE_CLAUDE_OUTPUT_TOKENS", 20))
+FAILURE_RATE = env_float("FAKE_CLAUDE_FAILURE_RATE", 0.0)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="claude", add_help=False)
+    parser.add_argument("-p", "--print", dest="print_mode", action="store_true")
+    parser.add_argument("--output-format", default="text")
+    parser.add_argument("--input-format", default="text")
+    parser.add_argument("--session-id")
+    parser.add_argument("--resume")
+    parser.add_argument("--version", action="store_true")
+    parser.add_argument("prompt", nargs="?")
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+
+def emit(event):
+    sys.stdout.write(json.dumps(event) + "\n")
+    sys.stdout.flush()
+
+
+def tokens_for(prompt):
+    words = prompt.split() or ["empty"]
+    return [f"{words[i % len(words)]} " for i in range(OUTPUT_TOKENS)]
+
+
+def result_event(session_id, text, prompt, started, is_error=False):
+    return {
+        "type": "result",
+        "subtype": "error_during_execution" if is_error else "success",
+        "is_error": is_error,
+        "result": text,
+        "session_id": session_id,
+        "duration_ms": int((time.monotonic() - started) * 1000),
+        "num_turns": 1,
+        "total_cost_usd": 0.0,
+        "usage": {
+            "input_tokens": len(prompt.split()),
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+            "output_tokens": 0 if is_error else OUTPUT_TOKENS,
+        },
+    }
+
+
+def answer(prompt, output_format, session_id):
+    """Answer one prompt; returns False if it failed"""
+    started = time.monotonic()
+    failed = random.random() < FAILURE_RATE
+
+    if output_format == "stream-json":
+        if failed:
+            emit(result_event(session_id, "Simulated failure", prompt, started, is_error=True))
+            return False
+        tokens = tokens_for(prompt)
+        for token in tokens:
+            time.sleep(TOKEN_DELAY)
+            emit(
+                {
+                    "type": "stream_event",
+                    "event": {
+                        "type": "content_block_delta",
+                        "delta": {"type": "text_delta", "text": token},
+                    },
+                }
+            )
+        text = "".join(tokens)
+        emit({"type": "assistant", "message": {"content": [{"type": "text", "text": text}]}})
+        emit(result_event(session_id, text, prompt, started))
+        return True
+
+    if failed:
+        sys.stderr.write("Error: simulated failure\n")
+        return False
+
+    tokens = tokens_for(prompt)
+    if output_format == "json":
+        time.sleep(TOKEN_DELAY * len(tokens))
+        emit(result_event(session_id, "".join(tokens), prompt, started))
+        return True
+
+    for token in tokens:
+        time.sleep(TOKEN_DELAY)
+        sys.stdout.write(token)
+        sys.stdout.flush()
+    sys.stdout.write("\n")
+    return True
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.version:
+        print("0.0.0 (Fake Claude Code)")
+        return 0
+
+    time.sleep(STARTUP_DELAY)
+    session_id = args.resume or args.session_id or str(uuid.uuid4())
+
+    if args.input_format == "stream-json":
+        # Warm worker mode: one user message per line until stdin closes
+        if args.output_format == "stream-json":
+            emit({"type": "system", "subtype": "init", "session_id": session_id})
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            content = json.loads(line)["message"]["content"]
+            prompt = "".join(part.get("text", "") for part in content)
+            answer(prompt, args.output_format, session_id)
+        return 0
+
+    prompt = args.prompt if args.prompt is not None else sys.stdin.read()
+    if args.output_format == "stream-json":
+        emit({"type": "system", "subtype": "init", "session_id": session_id})
+    return 0 if answer(prompt, args.output_format, session_id) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""Load-test the LiteLLM proxy against the fake claude CLI
+
+Boots ``litellm --config litellm_config.yaml`` with ``benchmarks/fake_claude.py`` first on
+PATH, drives it with concurrent OpenAI clients at each concurrency level and writes
+throughput, latency percentiles, TTFT and proxy RSS to a JSON file that can be compared
+between commits with ``benchmarks/compare.py``.
+
+    python benchmarks/run_benchmark.py --concurrency 1 4 16 --requests 64 --stream \
+        --env CLAUDE_CODE_POOL_SIZE=4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+FAKE_CLAUDE = Path(__file__).resolve().parent / "fake_claude.py"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+MASTER_KEY = "sk-1234"
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Linearly interpolated percentile of ``values``, or None when empty"""
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def process_tree_rss(pid: int) -> int:
+    """Resident memory in bytes of ``pid`` and all its descendants, read from /proc"""
+    children: Dict[int, List[int]] = {}
+    rss: Dict[int, int] = {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for entry in Path("/proc").iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            statm = (entry / "statm").read_text()
+        except OSError:
+            continue
+        # The command name may contain spaces, so split after its closing parenthesis
+        fields = stat.rsplit(")", 1)[1].split()
+        children.setdefault(int(fields[1]), []).append(int(entry.name))
+        rss[int(entry.name)] = int(statm.split()[1]) * page_size
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += rss.get(current, 0)
+        pending.extend(children.get(current, []))
+    return total
+
+
+def write_claude_shim(directory: Path) -> None:
+    """Put a ``claude`` executable in ``directory`` that runs the fake CLI"""
+    shim = directory / "claude"
+    shim.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_CLAUDE}" "$@"\n')
+    shim.chmod(0o755)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def log_tail(log_path: Path, lines: int = 20) -> str:
+    return "\n".join(log_path.read_text(errors="replace").splitlines()[-lines:])
+
+
+def start_proxy(port: int, env: Dict[str, str], log_path: Path, timeout: float) -> subprocess.Popen:
+    with open(log_path, "wb") as log_file:
+        process = subprocess.Popen(
+            ["litellm", "--config", "litellm_config.yaml", "--port", str(port)],
+            cwd=ROOT_DIR,
+            env=env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+        )
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(
+                f"Proxy exited with code {process.returncode}:\n{log_tail(log_path)}"
+            )
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}", timeout=1.0).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+
+    process.terminate()
+    raise RuntimeError(f"Proxy failed to start within {timeout} seconds")
+
+
+async def send_request(client: AsyncOpenAI, args, index: int) -> Dict:
+    messages = [{"role": "user", "content": f"Benchmark request {index}: say hello"}]
+    started = time.perf_counter()
+    ttft = None
+    try:
+        if args.stream:
+            stream = await client.chat.completions.create(
+                model=args.model, messages=messages, stream=True
+            )
+            async for chunk in stream:
+                if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+                    ttft = time.perf_counter() - started
+        else:
+            await client.chat.completions.create(model=args.model, messages=messages)
+    except Exception as e:
+        return {"ok": False, "latency": time.perf_counter() - started, "error": type(e).__name__}
+    return {"ok": True, "latency": time.perf_counter() - started, "ttft": ttft}
+
+
+async def run_level(port: int, proxy_pid: int, concurrency: int, args) -> Dict:
+    client = AsyncOpenAI(
+        api_key=MASTER_KEY,
+        base_url=f"http://127.0.0.1:{port}/v1",
+        max_retries=0,
+        timeout=args.request_timeout,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        ),
+    )
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(args.requests):
+        queue.put_nowait(index)
+    results: List[Dict] = []
+    peak_rss = process_tree_rss(proxy_pid)
+
+    async def worker():
+        while not queue.empty():
+            results.append(await send_request(client, args, queue.get_nowait()))
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, process_tree_rss(proxy_pid))
+            await asyncio.sleep(0.25)
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+        await client.close()
+
+    succeeded = [r for r in results if r["ok"]]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "succeeded": len(succeeded),
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(succeeded) / elapsed if elapsed else 0.0,
+        "latency_seconds": summarize([r["latency"] for r in succeeded]),
+        "ttft_seconds": summarize([r["ttft"] for r in succeeded if r.get("ttft") is not None]),
+        "peak_rss_bytes": max(peak_rss, process_tree_rss(proxy_pid)),
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    parser.add_argument("--model", default="claude-sonnet-4")
+    parser.add_argument("--stream", action="store_true", help="stream responses to measure TTFT")
+    parser.add_argument("--startup-delay", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--output-tokens", type=int, default=50)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="extra environment for the proxy, e.g. CLAUDE_CODE_POOL_SIZE=4",
+    )
+    parser.add_argument("--output", type=Path, help="result file (default: benchmarks/results/)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    revision = git_revision()
+    extra_env = dict(item.split("=", 1) for item in args.env)
+
+    with tempfile.TemporaryDirectory(prefix="claude-bench-") as tmp:
+        write_claude_shim(Path(tmp))
+        env = {
+            **os.environ,
+            **extra_env,
+            "PATH": f"{tmp}{os.pathsep}{os.environ.get('PATH', '')}",
+            "FAKE_CLAUDE_STARTUP_DELAY": str(args.startup_delay),
+            "FAKE_CLAUDE_TOKEN_DELAY": str(args.token_delay),
+            "FAKE_CLAUDE_OUTPUT_TOKENS": str(args.output_tokens),
+            "FAKE_CLAUDE_FAILURE_RATE": str(args.failure_rate),
+        }
+        port = free_port()
+        proxy = start_proxy(port, env, Path(tmp) / "proxy.log", args.startup_timeout)
+        try:
+            levels = []
+            for concurrency in args.concurrency:
+                level = asyncio.run(run_level(port, proxy.pid, concurrency, args))
+                levels.append(level)
+                latency = level["latency_seconds"]
+                print(
+                    f"concurrency={concurrency:<4} ok={level['succeeded']}/{level['requests']}"
+                    f" rps={level['throughput_rps']:.2f} p50={latency['p50'] or 0:.3f}s"
+                    f" p99={latency['p99'] or 0:.3f}s"
+                    f" rss={level['peak_rss_bytes'] / 2**20:.0f}MiB"
+                )
+        finally:
+            proxy.terminate()
+            try:
+                proxy.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proxy.kill()
+
+    report = {
+        "revision": revision,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": {
+            "model": args.model,
+            "stream": args.stream,
+            "requests": args.requests,
+            "startup_delay": args.startup_delay,
+            "token_delay": args.token_delay,
+            "output_tokens": args.output_tokens,
+            "failure_rate": args.failure_rate,
+            "env": extra_env,
+        },
+        "levels": levels,
+    }
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = RESULTS_DIR / f"{revision}-{stamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,470 @@
+import asyncio
+import collections
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional
+
+import httpx
+import litellm
+
+from claude_code_server.config import get_env_bool, get_env_float, get_env_int
+from claude_code_server.process import interrupt_child
+from claude_code_server.store import MemoryStore, StateStore
+
+logger = logging.getLogger(__name__)
+
+# Weight given to the latest execution time when estimating Retry-After
+DURATION_SMOOTHING = 0.2
+
+# Name of the slots counted in the state store
+ADMISSION_SLOTS = "admission"
+
+# Seconds between checks of a shared store for slots freed by other workers
+SLOT_POLL_INTERVAL = 0.05
+
+# Priority classes, most urgent first
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+
+def parse_priority(value: Any) -> Optional[str]:
+    """The priority class a header, API key or model alias names, or None if it names none
+
+    Raises:
+        ValueError: the value isn't one of PRIORITIES
+    """
+    if value is None or str(value).strip() == "":
+        return None
+    priority = str(value).strip().lower()
+    if priority not in PRIORITIES:
+        raise ValueError(
+            f"Unknown priority class {value!r}; expected one of {', '.join(PRIORITIES)}"
+        )
+    return priority
+
+
+class AdmissionRejectedError(litellm.RateLimitError):
+    """Raised when a request can't be admitted; carries a Retry-After header for the proxy"""
+
+    def __init__(self, message: str, retry_after: int):
+        headers = {"retry-after": str(retry_after)}
+        super().__init__(
+            message=message,
+            llm_provider="claude-code-server",
+            model="claude-code-server/claude-code",
+            response=httpx.Response(status_code=429, headers=headers),
+        )
+        self.retry_after = retry_after
+        # LiteLLM proxy copies exception headers onto the error response
+        self.headers = headers
+
+
+class PreemptedError(AdmissionRejectedError):
+    """Raised when a request's execution was stopped to free its slot for a more urgent one"""
+
+
+class Ticket:
+    """A request holding, or waiting for, an execution slot, and the claude-code children
+    it runs
+
+    Preempting a ticket terminates its children, and any it starts afterwards, so the
+    request fails and frees its slot.
+    """
+
+    def __init__(self, key: str, priority: str = INTERACTIVE):
+        self.key = key
+        self.priority = priority
+        self.preempted = False
+        self._lock = threading.Lock()
+        self._children: List[Any] = []
+
+    def adopt(self, process: Any) -> None:
+        """Record a child started for the request, terminating it at once if preempted"""
+        with self._lock:
+            self._children.append(process)
+            preempted = self.preempted
+        if preempted:
+            interrupt_child(process)
+
+    def preempt(self) -> None:
+        with self._lock:
+            self.preempted = True
+            children = list(self._children)
+        for process in children:
+            interrupt_child(process)
+
+
+class _Waiter:
+    """A queued request waiting for a free slot, from either a thread or an event loop"""
+
+    def __init__(self, ticket: Ticket, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.ticket = ticket
+        self.granted = False
+        self._event = threading.Event() if loop is None else None
+        self._loop = loop
+        self._future: Optional[asyncio.Future] = loop.create_future() if loop else None
+
+    def wake(self) -> None:
+        if self._event is not None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._resolve)
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        return self._event.wait(timeout)
+
+    async def await_wake(self, timeout: Optional[float]) -> None:
+        await asyncio.wait_for(asyncio.shield(self._future), timeout=timeout)
+
+    def _resolve(self) -> None:
+        if not self._future.done():
+            self._future.set_result(None)
+
+
+class _FairQueue:
+    """The waiters of one priority class, in per-key FIFO queues served by weighted round
+    robin"""
+
+    def __init__(self, weight: Callable[[str], int]):
+        self._weight = weight
+        # Keys in round robin order, each with its own FIFO queue
+        self._queues: "collections.OrderedDict[str, Deque[_Waiter]]" = collections.OrderedDict()
+        self._credits: Dict[str, int] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, waiter: _Waiter) -> None:
+        key = waiter.ticket.key
+        if key not in self._queues:
+            self._queues[key] = collections.deque()
+            self._credits[key] = self._weight(key)
+        self._queues[key].append(waiter)
+        self._size += 1
+
+    def remove(self, waiter: _Waiter) -> None:
+        key = waiter.ticket.key
+        queue = self._queues.get(key)
+        if queue is None or waiter not in queue:
+            return
+
+        queue.remove(waiter)
+        self._size -= 1
+        if not queue:
+            del self._queues[key]
+            del self._credits[key]
+
+    def popleft(self) -> _Waiter:
+        # Weighted round robin: the key at the head serves up to its weight, then rotates
+        key, queue = next(iter(self._queues.items()))
+        waiter = queue.popleft()
+        self._size -= 1
+        self._credits[key] -= 1
+
+        if not queue:
+            del self._queues[key]
+            del self._credits[key]
+        elif self._credits[key] <= 0:
+            self._queues.move_to_end(key)
+            self._credits[key] = self._weight(key)
+
+        return waiter
+
+
+class AdmissionController:
+    """Bound concurrent claude-code executions with a fair, bounded wait queue
+
+    Requests beyond ``max_concurrency`` wait in per-key queues that are served by weighted
+    round robin, so one API key flooding the proxy can't starve the others. When the queue
+    is full, or a request waits longer than its deadline, it is rejected with a 429 and a
+    Retry-After estimated from recent execution times.
+
+    Each request belongs to a priority class. Queued interactive requests are served before
+    any batch request, and batch requests never take the last ``reserved_slots`` slots, so
+    interactive traffic finds room however much batch work is queued. With ``preempt``, an
+    interactive request that has to queue stops the most recently admitted batch execution
+    of this worker; that request fails with a PreemptedError (a 429) and its slot is handed
+    over.
+
+    Slots are taken from ``store``. With a store shared by several proxy workers the limit is
+    global: a freed slot goes to this worker's queue first, and queued requests poll the
+    store for slots freed by other workers.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int = 100,
+        queue_timeout: Optional[float] = 60.0,
+        key_weights: Optional[Dict[str, int]] = None,
+        reserved_slots: int = 0,
+        preempt: bool = False,
+        store: Optional[StateStore] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.key_weights = key_weights or {}
+        self.reserved_slots = reserved_slots
+        self.preempt = preempt
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queues = {priority: _FairQueue(self._weight) for priority in PRIORITIES}
+        # Requests of this worker holding a slot, in the order they were admitted
+        self._running: List[Ticket] = []
+        self._avg_duration = 1.0
+        self._store = store or MemoryStore()
+
+    @classmethod
+    def from_env(cls, store: Optional[StateStore] = None) -> Optional["AdmissionController"]:
+        """Create a controller from CLAUDE_CODE_* environment variables, or None if unlimited"""
+        max_concurrency = get_env_int("CLAUDE_CODE_MAX_CONCURRENCY", 0)
+        if max_concurrency <= 0:
+            return None
+
+        return cls(
+            max_concurrency,
+            max_queue=get_env_int("CLAUDE_CODE_MAX_QUEUE", 100),
+            queue_timeout=get_env_float("CLAUDE_CODE_QUEUE_TIMEOUT", 60.0),
+            key_weights=json.loads(os.environ.get("CLAUDE_CODE_KEY_WEIGHTS") or "{}"),
+            reserved_slots=get_env_int("CLAUDE_CODE_RESERVED_SLOTS", 0),
+            preempt=get_env_bool("CLAUDE_CODE_PREEMPT", False),
+            store=store,
+        )
+
+    @property
+    def active(self) -> int:
+        """Number of requests of this worker currently holding a slot"""
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """Number of requests waiting for a slot"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    @contextmanager
+    def slot(
+        self, key: str, timeout: Optional[float] = None, priority: str = INTERACTIVE
+    ) -> Iterator[Ticket]:
+        """Hold an execution slot for the duration of the block, blocking the thread to wait"""
+        ticket = self.acquire(key, timeout, priority)
+        started = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self.release(time.monotonic() - started, ticket)
+
+    @asynccontextmanager
+    async def aslot(
+        self, key: str, timeout: Optional[float] = None, priority: str = INTERACTIVE
+    ) -> AsyncIterator[Ticket]:
+        """Hold an execution slot for the duration of the block, awaiting to wait"""
+        ticket = await self.aacquire(key, timeout, priority)
+        started = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            self.release(time.monotonic() - started, ticket)
+
+    def acquire(
+        self, key: str, timeout: Optional[float] = None, priority: str = INTERACTIVE
+    ) -> Ticket:
+        """Take a slot, waiting in the queue for at most the request deadline"""
+        ticket = Ticket(key, priority)
+        waiter = self._admit_or_enqueue(ticket, loop=None)
+        if waiter is None:
+            return ticket
+
+        deadline = self._deadline(timeout)
+        while not waiter.wait(self._poll_timeout(deadline)):
+            if self._expired(deadline):
+                self._abandon(waiter)
+                return ticket
+            self._poll()
+        return ticket
+
+    async def aacquire(
+        self, key: str, timeout: Optional[float] = None, priority: str = INTERACTIVE
+    ) -> Ticket:
+        """Take a slot without blocking the event loop"""
+        ticket = Ticket(key, priority)
+        waiter = self._admit_or_enqueue(ticket, loop=asyncio.get_running_loop())
+        if waiter is None:
+            return ticket
+
+        deadline = self._deadline(timeout)
+        try:
+            while True:
+                try:
+                    await waiter.await_wake(self._poll_timeout(deadline))
+                    return ticket
+                except asyncio.TimeoutError:
+                    if self._expired(deadline):
+                        self._abandon(waiter)
+                        return ticket
+                    self._poll()
+        except asyncio.CancelledError:
+            # Client went away while queued: give the slot on if it was already handed over
+            with self._lock:
+                if not waiter.granted:
+                    self._queues[priority].remove(waiter)
+                    raise
+            self.release(ticket=ticket)
+            raise
+
+    def release(self, duration: Optional[float] = None, ticket: Optional[Ticket] = None) -> None:
+        """Free a slot, handing it straight to the next queued request if there is one"""
+        with self._lock:
+            if duration is not None:
+                self._avg_duration += DURATION_SMOOTHING * (duration - self._avg_duration)
+            if ticket in self._running:
+                self._running.remove(ticket)
+
+            waiter = self._next_waiter()
+            if waiter is None:
+                self._active -= 1
+                self._store.release_slot(ADMISSION_SLOTS)
+                return
+
+        waiter.wake()
+
+    def preempted_error(self) -> PreemptedError:
+        """The error a preempted request fails with"""
+        with self._lock:
+            retry_after = self._retry_after()
+        return PreemptedError(
+            "claude-code request was preempted by a more urgent one", retry_after=retry_after
+        )
+
+    def _admit_or_enqueue(
+        self, ticket: Ticket, loop: Optional[asyncio.AbstractEventLoop]
+    ) -> Optional[_Waiter]:
+        with self._lock:
+            if not self._queued_before(ticket.priority) and self._store.acquire_slot(
+                ADMISSION_SLOTS, self._limit(ticket.priority)
+            ):
+                self._active += 1
+                self._running.append(ticket)
+                return None
+
+            queue = self._queues[ticket.priority]
+            if len(queue) >= self.max_queue:
+                logger.warning(f"Rejecting claude-code request from {ticket.key}: queue is full")
+                raise AdmissionRejectedError(
+                    f"claude-code queue is full ({len(queue)} requests waiting)",
+                    retry_after=self._retry_after(),
+                )
+
+            waiter = _Waiter(ticket, loop)
+            queue.append(waiter)
+            victim = self._victim(ticket.priority)
+
+        if victim is not None:
+            logger.warning(
+                f"Preempting {victim.priority} claude-code request from {victim.key} "
+                f"for a queued {ticket.priority} one"
+            )
+            victim.preempt()
+        return waiter
+
+    def _poll(self) -> None:
+        """Hand slots freed by other workers to queued requests"""
+        woken = []
+        with self._lock:
+            for priority in PRIORITIES:
+                queue = self._queues[priority]
+                while queue and self._store.acquire_slot(ADMISSION_SLOTS, self._limit(priority)):
+                    self._active += 1
+                    woken.append(self._grant(queue.popleft()))
+        for waiter in woken:
+            waiter.wake()
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self._lock:
+            # The slot may have been handed over right as the deadline passed
+            if waiter.granted:
+                return
+            self._queues[waiter.ticket.priority].remove(waiter)
+            retry_after = self._retry_after()
+
+        logger.warning(
+            f"Rejecting claude-code request from {waiter.ticket.key}: queue deadline passed"
+        )
+        raise AdmissionRejectedError(
+            "claude-code request timed out waiting in queue", retry_after=retry_after
+        )
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """The most urgent queued request allowed to take the slot being freed"""
+        # The freed slot is still counted, so a class may take it up to its own limit
+        taken = self._store.slots(ADMISSION_SLOTS)
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            if queue and taken <= self._limit(priority):
+                return self._grant(queue.popleft())
+        return None
+
+    def _grant(self, waiter: _Waiter) -> _Waiter:
+        waiter.granted = True
+        self._running.append(waiter.ticket)
+        return waiter
+
+    def _victim(self, priority: str) -> Optional[Ticket]:
+        """The running request to preempt for a request of ``priority`` that had to queue"""
+        if not self.preempt:
+            return None
+
+        # One preemption per queued request is enough; the preempted ones are still ending
+        ending = sum(1 for ticket in self._running if ticket.preempted)
+        if ending >= len(self._queues[priority]):
+            return None
+
+        rank = PRIORITIES.index(priority)
+        candidates = [
+            ticket
+            for ticket in self._running
+            if PRIORITIES.index(ticket.priority) > rank and not ticket.preempted
+        ]
+        # The most recently admitted one has done the least work that is thrown away
+        return candidates[-1] if candidates else None
+
+    def _queued_before(self, priority: str) -> bool:
+        """Whether requests at least as urgent as ``priority`` are waiting"""
+        rank = PRIORITIES.index(priority)
+        return any(self._queues[p] for p in PRIORITIES[: rank + 1])
+
+    def _limit(self, priority: str) -> int:
+        """Slots requests of a class may fill: all of them, or all but the reserved ones"""
+        if priority == INTERACTIVE:
+            return self.max_concurrency
+        return max(1, self.max_concurrency - self.reserved_slots)
+
+    def _weight(self, key: str) -> int:
+        return max(1, int(self.key_weights.get(key, 1)))
+
+    def _deadline(self, timeout: Optional[float]) -> Optional[float]:
+        """When a queued request gives up, on the monotonic clock"""
+        timeouts = [t for t in (timeout, self.queue_timeout) if t]
+        return time.monotonic() + min(timeouts) if timeouts else None
+
+    def _poll_timeout(self, deadline: Optional[float]) -> Optional[float]:
+        """How long to wait for a handed-over slot before giving up or polling the store"""
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not self._store.shared:
+            return remaining
+        return SLOT_POLL_INTERVAL if remaining is None else min(remaining, SLOT_POLL_INTERVAL)
+
+    def _expired(self, deadline: Optional[float]) -> bool:
+        return deadline is not None and time.monotonic() >= deadline
+
+    def _retry_after(self) -> int:
+        # Time for the queue ahead to drain through the available slots
+        backlog = (self.queued + 1) * self._avg_duration / self.max_concurrency
+        return max(1, math.ceil(backlog))
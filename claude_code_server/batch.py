@@ -0,0 +1,667 @@
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Type
+from urllib.parse import parse_qs, urlsplit
+
+import litellm
+
+from claude_code_server.admission import BATCH
+from claude_code_server.breaker import CircuitOpenError
+from claude_code_server.config import get_env_int
+from claude_code_server.models import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+# The only endpoint batch requests may target
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Attempts for a request rejected with 429 (queue full, every credential cooling down)
+RATE_LIMIT_ATTEMPTS = 5
+
+# Seconds between checks for the proxy's router while a batch waits to resolve its models
+MODELS_POLL_INTERVAL = 0.5
+
+# Bytes copied per write when serving file contents
+COPY_CHUNK_SIZE = 1 << 16
+
+
+class BatchError(Exception):
+    """A batch API request that can't be served, reported as an OpenAI error object"""
+
+    def __init__(self, message: str, status_code: int = 400, param: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.param = param
+
+    def to_dict(self) -> Dict[str, Any]:
+        error_type = "invalid_request_error" if self.status_code < 500 else "server_error"
+        return {
+            "error": {"message": str(self), "type": error_type, "param": self.param, "code": None}
+        }
+
+
+class BatchStore:
+    """Files and batch jobs on local disk: OpenAI objects in sqlite, file contents as files"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._files_dir = os.path.join(directory, "files")
+        os.makedirs(self._files_dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(
+            os.path.join(directory, "batches.sqlite3"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        for table in ("files", "batches"):
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(id TEXT PRIMARY KEY, created_at INTEGER NOT NULL, data TEXT NOT NULL)"
+            )
+
+    def file_path(self, file_id: str) -> str:
+        return os.path.join(self._files_dir, f"{file_id}.jsonl")
+
+    def create_file(self, filename: str, purpose: str, content: bytes = b"") -> Dict[str, Any]:
+        """Store file contents and register the file object"""
+        file = {
+            "id": f"file-{uuid.uuid4().hex}",
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+        }
+        with open(self.file_path(file["id"]), "wb") as f:
+            f.write(content)
+        self._put("files", file)
+        return file
+
+    def get_file(self, file_id: str) -> Optional[Dict[str, Any]]:
+        file = self._get("files", file_id)
+        if file is not None and os.path.exists(self.file_path(file_id)):
+            # Output files grow while their batch runs
+            file["bytes"] = os.path.getsize(self.file_path(file_id))
+        return file
+
+    def create_batch(
+        self,
+        input_file_id: str,
+        endpoint: str,
+        completion_window: str,
+        metadata: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        now = int(time.time())
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": endpoint,
+            "errors": None,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": now,
+            "in_progress_at": None,
+            "expires_at": None,
+            "finalizing_at": None,
+            "completed_at": None,
+            "failed_at": None,
+            "expired_at": None,
+            "cancelling_at": None,
+            "cancelled_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": metadata,
+        }
+        self._put("batches", batch)
+        return batch
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        return self._get("batches", batch_id)
+
+    def update_batch(self, batch_id: str, **fields: Any) -> Dict[str, Any]:
+        """Change fields of a stored batch and return it"""
+        with self._lock:
+            batch = self._get("batches", batch_id)
+            batch.update(fields)
+            self._put("batches", batch)
+        return batch
+
+    def list_batches(self, limit: int = 20, after: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Batches newest first, starting after the batch ``after``"""
+        query = "SELECT data FROM batches"
+        params: Tuple[Any, ...] = ()
+        if after is not None:
+            anchor = self.get_batch(after)
+            if anchor is not None:
+                query += " WHERE (created_at, id) < (?, ?)"
+                params = (anchor["created_at"], anchor["id"])
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(query, (*params, limit)).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def unfinished_batches(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM batches ORDER BY created_at").fetchall()
+        batches = [json.loads(data) for (data,) in rows]
+        return [b for b in batches if b["status"] not in TERMINAL_STATUSES]
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _get(self, table: str, item_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(f"SELECT data FROM {table} WHERE id = ?", (item_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, table: str, item: Dict[str, Any]) -> None:
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {table} (id, created_at, data) VALUES (?, ?, ?)",
+                (item["id"], item["created_at"], json.dumps(item)),
+            )
+
+
+class BatchRunner:
+    """Run batches by fanning their lines out to the provider with bounded parallelism
+
+    Input files are read line by line and at most ``parallelism`` requests run at once
+    across all batches. A line's model is a model_name of the proxy's model_list, resolved
+    to its claude-code deployment as LiteLLM's router would; batches wait for the router,
+    which the proxy creates after loading the provider. Results are appended to the output
+    and error files as each request finishes, so a batch interrupted by a crash resumes with
+    the lines it has no result for.
+    """
+
+    def __init__(
+        self,
+        store: BatchStore,
+        completion: Callable[..., Any],
+        parallelism: int = 4,
+        models: Optional[ModelRegistry] = None,
+    ):
+        self.store = store
+        self.parallelism = parallelism
+        self._completion = completion
+        self._models = models or ModelRegistry()
+        self._slots = threading.BoundedSemaphore(parallelism)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=parallelism, thread_name_prefix="claude-code-batch"
+        )
+        self._threads: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def resume(self) -> None:
+        """Restart batches left unfinished by a previous process"""
+        for batch in self.store.unfinished_batches():
+            logger.info(f"Resuming batch {batch['id']} ({batch['status']})")
+            self.submit(batch["id"])
+
+    def submit(self, batch_id: str) -> None:
+        """Start running a batch in the background"""
+        with self._lock:
+            if batch_id in self._threads or self._closed.is_set():
+                return
+            thread = threading.Thread(target=self._run, args=(batch_id,), daemon=True)
+            self._threads[batch_id] = thread
+        thread.start()
+
+    def cancel(self, batch_id: str) -> Dict[str, Any]:
+        """Stop sending a batch's remaining lines; requests already running finish"""
+        batch = self.store.get_batch(batch_id)
+        if batch["status"] in TERMINAL_STATUSES or batch["status"] == "cancelling":
+            return batch
+
+        batch = self.store.update_batch(
+            batch_id, status="cancelling", cancelling_at=int(time.time())
+        )
+        with self._lock:
+            running = batch_id in self._threads
+        if not running:
+            batch = self._finish(batch_id)
+        return batch
+
+    def join(self, batch_id: str, timeout: Optional[float] = None) -> None:
+        """Wait for a running batch to finish"""
+        with self._lock:
+            thread = self._threads.get(batch_id)
+        if thread is not None:
+            thread.join(timeout)
+
+    def close(self) -> None:
+        """Stop taking lines; unfinished batches stay in progress and resume on restart"""
+        self._closed.set()
+        with self._lock:
+            threads = list(self._threads.values())
+        for thread in threads:
+            thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self, batch_id: str) -> None:
+        try:
+            while not self._models.loaded:
+                if self._closed.wait(MODELS_POLL_INTERVAL):
+                    return
+            self._process(batch_id)
+        except Exception as e:
+            logger.exception(f"Batch {batch_id} failed: {e}")
+            errors = {"object": "list", "data": [{"code": "batch_failed", "message": str(e)}]}
+            self.store.update_batch(
+                batch_id, status="failed", failed_at=int(time.time()), errors=errors
+            )
+        finally:
+            with self._lock:
+                self._threads.pop(batch_id, None)
+
+    def _process(self, batch_id: str) -> None:
+        batch = self.store.get_batch(batch_id)
+        input_path = self.store.file_path(batch["input_file_id"])
+        if batch["output_file_id"] is None:
+            output = self.store.create_file(f"{batch_id}_output.jsonl", "batch_output")
+            errors = self.store.create_file(f"{batch_id}_error.jsonl", "batch_output")
+            batch = self.store.update_batch(
+                batch_id,
+                status="in_progress" if batch["status"] == "validating" else batch["status"],
+                in_progress_at=int(time.time()),
+                output_file_id=output["id"],
+                error_file_id=errors["id"],
+                request_counts={"total": _count_lines(input_path), "completed": 0, "failed": 0},
+            )
+
+        output_path = self.store.file_path(batch["output_file_id"])
+        error_path = self.store.file_path(batch["error_file_id"])
+        completed = _recover_results(output_path)
+        failed = _recover_results(error_path)
+        done = completed | failed
+        counts = {
+            "total": batch["request_counts"]["total"],
+            "completed": len(completed),
+            "failed": len(failed),
+        }
+        self.store.update_batch(batch_id, request_counts=counts)
+
+        write_lock = threading.Lock()
+        pending: Set[concurrent.futures.Future] = set()
+
+        def run(custom_id: str, request: Optional[Dict[str, Any]], problem: Optional[str]) -> None:
+            # Written from the task itself: done callbacks may still be running after wait()
+            try:
+                result, ok = self._execute(custom_id, request, problem)
+                with write_lock:
+                    f = output_file if ok else error_file
+                    f.write(json.dumps(result) + "\n")
+                    f.flush()
+                    counts["completed" if ok else "failed"] += 1
+                    self.store.update_batch(batch_id, request_counts=dict(counts))
+            finally:
+                self._slots.release()
+
+        with (
+            open(input_path, "rb") as input_file,
+            open(output_path, "a") as output_file,
+            open(error_path, "a") as error_file,
+        ):
+            for index, raw in enumerate(input_file):
+                if not raw.strip():
+                    continue
+                if self._closed.is_set() or self._is_cancelling(batch_id):
+                    break
+
+                custom_id, request, problem = _parse_line(raw, index)
+                if custom_id in done:
+                    continue
+
+                self._slots.acquire()
+                pending.add(self._executor.submit(run, custom_id, request, problem))
+                pending = {f for f in pending if not f.done()}
+
+            concurrent.futures.wait(pending)
+
+        if not self._closed.is_set():
+            self._finish(batch_id)
+
+    def _finish(self, batch_id: str) -> Dict[str, Any]:
+        batch = self.store.get_batch(batch_id)
+        now = int(time.time())
+        if batch["status"] == "cancelling":
+            return self.store.update_batch(batch_id, status="cancelled", cancelled_at=now)
+
+        logger.info(f"Batch {batch_id} completed: {batch['request_counts']}")
+        return self.store.update_batch(
+            batch_id, status="completed", finalizing_at=now, completed_at=now
+        )
+
+    def _is_cancelling(self, batch_id: str) -> bool:
+        return self.store.get_batch(batch_id)["status"] == "cancelling"
+
+    def _execute(
+        self, custom_id: str, request: Optional[Dict[str, Any]], problem: Optional[str]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Run one batch line; returns its result line and whether it succeeded"""
+        result: Dict[str, Any] = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": custom_id,
+            "response": None,
+            "error": None,
+        }
+        if problem is not None:
+            result["error"] = {"code": "invalid_request", "message": problem}
+            return result, False
+
+        body = dict(request["body"])
+        model = body.pop("model", None)
+        messages = body.pop("messages")
+        body.pop("stream", None)
+        deployment = self._models.resolve(model) if isinstance(model, str) else None
+        if deployment is None:
+            message = f"Model {model!r} is not a claude-code model of this proxy"
+            result["error"] = {"code": "model_not_found", "message": message}
+            return result, False
+
+        request_id = uuid.uuid4().hex
+        try:
+            response = self._complete(deployment, messages, body)
+            body = {**response.model_dump(warnings=False), "model": model}
+        except Exception as e:
+            status_code = getattr(e, "status_code", None) or 500
+            error = {"message": str(e), "type": type(e).__name__}
+            result["response"] = {
+                "status_code": status_code,
+                "request_id": request_id,
+                "body": {"error": error},
+            }
+            return result, False
+
+        result["response"] = {"status_code": 200, "request_id": request_id, "body": body}
+        return result, True
+
+    def _complete(
+        self, deployment: Dict[str, Any], messages: List[Dict[str, Any]], params: Dict[str, Any]
+    ):
+        """Call the provider, backing off while it rejects requests (429) or fails fast (503)"""
+        # Batch lines are queued under their own key and in the batch priority class, behind
+        # interactive requests. model_info tells the provider which deployment's options apply.
+        litellm_params = {
+            "metadata": {
+                "user_api_key_alias": "batch",
+                "user_api_key_metadata": {"priority_class": BATCH},
+                "model_info": deployment.get("model_info") or {},
+            }
+        }
+        for attempt in range(RATE_LIMIT_ATTEMPTS):
+            try:
+                return self._completion(
+                    model=deployment["litellm_params"]["model"],
+                    messages=messages,
+                    optional_params=params,
+                    litellm_params=litellm_params,
+                )
+            except (litellm.RateLimitError, CircuitOpenError) as e:
+                if attempt + 1 == RATE_LIMIT_ATTEMPTS or self._closed.is_set():
+                    raise
+                time.sleep(getattr(e, "retry_after", None) or 2**attempt)
+
+
+class BatchServer:
+    """Serve the OpenAI Files and Batches API for chat completions from a background thread"""
+
+    def __init__(
+        self,
+        runner: BatchRunner,
+        port: int,
+        host: str = "0.0.0.0",
+        api_key: Optional[str] = None,
+    ):
+        self.runner = runner
+        handler = self._make_handler(runner, api_key)
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @classmethod
+    def from_env(
+        cls, completion: Callable[..., Any], models: Optional[ModelRegistry] = None
+    ) -> Optional["BatchServer"]:
+        """Start a server if CLAUDE_CODE_BATCH_PORT is set, or return None"""
+        port = get_env_int("CLAUDE_CODE_BATCH_PORT", 0)
+        if port <= 0:
+            return None
+
+        host = os.environ.get("CLAUDE_CODE_BATCH_HOST") or "0.0.0.0"
+        store = BatchStore(os.environ.get("CLAUDE_CODE_BATCH_DIR") or "batches")
+        runner = BatchRunner(
+            store,
+            completion,
+            parallelism=get_env_int("CLAUDE_CODE_BATCH_CONCURRENCY", 4),
+            models=models,
+        )
+        try:
+            server = cls(runner, port, host, api_key=os.environ.get("LITELLM_MASTER_KEY"))
+        except OSError as e:
+            # Another proxy worker in this container already runs the batches
+            logger.warning(f"Batch endpoint not started on {host}:{port}: {e}")
+            store.close()
+            return None
+
+        server.start()
+        logger.info(f"Serving the claude-code batch API on http://{host}:{server.port}/v1")
+        return server
+
+    @property
+    def port(self) -> int:
+        """Port the server is bound to"""
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        self._thread.start()
+        self.runner.resume()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self.runner.close()
+        self.runner.store.close()
+
+    @staticmethod
+    def _make_handler(runner: BatchRunner, api_key: Optional[str]) -> Type[BaseHTTPRequestHandler]:
+        store = runner.store
+
+        def create_file(handler: "Handler") -> Dict[str, Any]:
+            fields = handler.read_form()
+            upload = fields.get("file")
+            purpose = fields.get("purpose", (None, b""))[1].decode("utf-8")
+            if upload is None:
+                raise BatchError("Missing file", param="file")
+            if purpose != "batch":
+                raise BatchError("Only files with purpose 'batch' are supported", param="purpose")
+            return store.create_file(upload[0] or "upload.jsonl", purpose, upload[1])
+
+        def create_batch(handler: "Handler") -> Dict[str, Any]:
+            body = handler.read_json()
+            input_file_id = body.get("input_file_id")
+            if store.get_file(input_file_id or "") is None:
+                raise BatchError(f"No such file: {input_file_id}", param="input_file_id")
+            if body.get("endpoint") != BATCH_ENDPOINT:
+                raise BatchError(f"Only {BATCH_ENDPOINT} is supported", param="endpoint")
+
+            batch = store.create_batch(
+                input_file_id,
+                BATCH_ENDPOINT,
+                body.get("completion_window", "24h"),
+                body.get("metadata"),
+            )
+            runner.submit(batch["id"])
+            return batch
+
+        def list_batches(handler: "Handler") -> Dict[str, Any]:
+            query = parse_qs(urlsplit(handler.path).query)
+            limit = int(query.get("limit", ["20"])[0])
+            after = query.get("after", [None])[0]
+            batches = store.list_batches(limit + 1, after)
+            data = batches[:limit]
+            return {
+                "object": "list",
+                "data": data,
+                "first_id": data[0]["id"] if data else None,
+                "last_id": data[-1]["id"] if data else None,
+                "has_more": len(batches) > limit,
+            }
+
+        def found(item: Optional[Dict[str, Any]], item_id: str) -> Dict[str, Any]:
+            if item is None:
+                raise BatchError(f"No such object: {item_id}", status_code=404)
+            return item
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                self.dispatch("GET")
+
+            def do_POST(self) -> None:
+                self.dispatch("POST")
+
+            def dispatch(self, method: str) -> None:
+                try:
+                    if api_key and self.headers.get("Authorization") != f"Bearer {api_key}":
+                        raise BatchError("Invalid API key", status_code=401)
+                    parts = urlsplit(self.path).path.strip("/").split("/")
+                    if parts[:1] != ["v1"]:
+                        raise BatchError("Not found", status_code=404)
+                    self.route(method, parts[1:])
+                except BatchError as e:
+                    self.send_json(e.to_dict(), status=e.status_code)
+                except Exception as e:
+                    logger.exception(f"Batch API request failed: {e}")
+                    self.send_json(BatchError(str(e), status_code=500).to_dict(), status=500)
+
+            def route(self, method: str, parts: List[str]) -> None:
+                if method == "POST" and parts == ["files"]:
+                    self.send_json(create_file(self))
+                elif method == "GET" and len(parts) == 2 and parts[0] == "files":
+                    self.send_json(found(store.get_file(parts[1]), parts[1]))
+                elif method == "GET" and len(parts) == 3 and parts[::2] == ["files", "content"]:
+                    self.send_file(found(store.get_file(parts[1]), parts[1]))
+                elif method == "POST" and parts == ["batches"]:
+                    self.send_json(create_batch(self))
+                elif method == "GET" and parts == ["batches"]:
+                    self.send_json(list_batches(self))
+                elif method == "GET" and len(parts) == 2 and parts[0] == "batches":
+                    self.send_json(found(store.get_batch(parts[1]), parts[1]))
+                elif method == "POST" and len(parts) == 3 and parts[::2] == ["batches", "cancel"]:
+                    found(store.get_batch(parts[1]), parts[1])
+                    self.send_json(runner.cancel(parts[1]))
+                else:
+                    raise BatchError("Not found", status_code=404)
+
+            def read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def read_json(self) -> Dict[str, Any]:
+                try:
+                    body = json.loads(self.read_body() or b"{}")
+                except json.JSONDecodeError as e:
+                    raise BatchError(f"Invalid JSON body: {e}")
+                if not isinstance(body, dict):
+                    raise BatchError("Request body must be a JSON object")
+                return body
+
+            def read_form(self) -> Dict[str, Tuple[Optional[str], bytes]]:
+                """Parse a multipart/form-data body into name -> (filename, content)"""
+                content_type = self.headers.get("Content-Type", "")
+                if not content_type.startswith("multipart/form-data"):
+                    raise BatchError("Expected multipart/form-data")
+                header = f"Content-Type: {content_type}\r\n\r\n".encode("utf-8")
+                message = BytesParser(policy=default_policy).parsebytes(header + self.read_body())
+                fields = {}
+                for part in message.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    fields[name] = (part.get_filename(), part.get_payload(decode=True) or b"")
+                return fields
+
+            def send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_file(self, file: Dict[str, Any]) -> None:
+                # Serve what has been written so far; a running batch keeps appending
+                size = file["bytes"]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(size))
+                self.end_headers()
+                with open(store.file_path(file["id"]), "rb") as f:
+                    while size > 0:
+                        chunk = f.read(min(COPY_CHUNK_SIZE, size))
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        size -= len(chunk)
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(format % args)
+
+        return Handler
+
+
+def _parse_line(raw: bytes, index: int) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    """Parse an input line into (custom_id, request, problem); problem is None if valid"""
+    fallback_id = f"line-{index + 1}"
+    try:
+        request = json.loads(raw)
+    except json.JSONDecodeError as e:
+        return fallback_id, None, f"Line {index + 1} is not valid JSON: {e}"
+    if not isinstance(request, dict):
+        return fallback_id, None, f"Line {index + 1} is not a JSON object"
+
+    custom_id = str(request.get("custom_id") or fallback_id)
+    if request.get("url") != BATCH_ENDPOINT:
+        return custom_id, None, f"Only {BATCH_ENDPOINT} is supported"
+    body = request.get("body")
+    if not isinstance(body, dict) or not isinstance(body.get("messages"), list):
+        return custom_id, None, "Request body must contain messages"
+    return custom_id, request, None
+
+
+def _count_lines(path: str) -> int:
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def _recover_results(path: str) -> Set[str]:
+    """custom_ids with a result in an output file, dropping a line cut short by a crash"""
+    custom_ids = set()
+    good_size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            # Without its newline even a parseable line is truncated below, so it isn't done
+            if not line.endswith(b"\n"):
+                break
+            try:
+                custom_ids.add(json.loads(line)["custom_id"])
+            except (json.JSONDecodeError, KeyError, TypeError):
+                break
+            good_size += len(line)
+
+    if good_size != os.path.getsize(path):
+        logger.warning(f"Discarding a partial result line in {path}")
+        with open(path, "r+b") as f:
+            f.truncate(good_size)
+    return custom_ids
@@ -0,0 +1,162 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import httpx
+import litellm
+
+from claude_code_server.config import get_env_float, get_env_int
+from claude_code_server.errors import (
+    DEADLINE,
+    INVALID_OUTPUT,
+    INVALID_REQUEST,
+    OUTPUT_LIMIT,
+    RATE_LIMITED,
+    SESSION_NOT_FOUND,
+)
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Failures that say something about the request or the account's quota, not about claude-code
+# being able to serve requests at all
+IGNORED_KINDS = frozenset(
+    {DEADLINE, INVALID_OUTPUT, INVALID_REQUEST, OUTPUT_LIMIT, RATE_LIMITED, SESSION_NOT_FOUND}
+)
+
+
+def is_breaker_failure(error: BaseException) -> bool:
+    """Whether a failed execution counts towards opening the circuit"""
+    kind = getattr(error, "kind", None)
+    if isinstance(error, litellm.Timeout):
+        return kind not in IGNORED_KINDS
+    return kind is not None and kind not in IGNORED_KINDS
+
+
+class CircuitOpenError(litellm.ServiceUnavailableError):
+    """Raised while the circuit is open; a 503 the LiteLLM router can fall back on"""
+
+    def __init__(self, message: str, retry_after: int):
+        headers = {"retry-after": str(retry_after)}
+        super().__init__(
+            message=message,
+            llm_provider="claude-code-server",
+            model="claude-code-server/claude-code",
+            response=httpx.Response(status_code=503, headers=headers),
+        )
+        self.retry_after = retry_after
+        # LiteLLM proxy copies exception headers onto the error response
+        self.headers = headers
+
+
+class CircuitBreaker:
+    """Stop starting claude-code while it keeps failing
+
+    After ``failure_threshold`` consecutive failed executions the circuit opens and requests
+    fail at once with a 503 instead of each spawning a process that fails. After
+    ``reset_timeout`` seconds it half-opens: ``probes`` executions are let through, and the
+    circuit closes if they succeed or opens again if they fail.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, probes: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.state = CLOSED
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._opened_until = 0.0
+        self._probing = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["CircuitBreaker"]:
+        """Create a breaker from CLAUDE_CODE_BREAKER_THRESHOLD, or None if it is 0"""
+        failure_threshold = get_env_int("CLAUDE_CODE_BREAKER_THRESHOLD", 5)
+        if failure_threshold <= 0:
+            return None
+
+        return cls(
+            failure_threshold,
+            reset_timeout=get_env_float("CLAUDE_CODE_BREAKER_RESET", 30.0),
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != CLOSED
+
+    def acquire(self) -> bool:
+        """Let an execution through; returns whether it is a half-open probe
+
+        Raises:
+            CircuitOpenError: the circuit is open, or the half-open probes are taken
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+
+            now = time.monotonic()
+            if self.state == OPEN and now >= self._opened_until:
+                self.state = HALF_OPEN
+                self._probing = 0
+                logger.info("claude-code circuit half-open; probing with a request")
+
+            if self.state == HALF_OPEN and self._probing < self.probes:
+                self._probing += 1
+                return True
+
+            retry_after = max(1, math.ceil(self._opened_until - now))
+            raise CircuitOpenError(
+                f"claude-code is failing ({self.failures} consecutive failures, last: "
+                f"{self.last_error}); not starting it for {retry_after} seconds",
+                retry_after=retry_after,
+            )
+
+    def release(self, probe: bool, error: Optional[BaseException] = None) -> None:
+        """Record how an execution let through by acquire() ended"""
+        failed = error is not None and is_breaker_failure(error)
+        with self._lock:
+            if probe:
+                self._probing -= 1
+            elif self.state != CLOSED:
+                # Started before the circuit opened; the probes decide from here
+                return
+
+            if error is not None and not failed:
+                # Neither proof that claude-code works nor that it doesn't
+                return
+
+            if not failed:
+                if self.state != CLOSED:
+                    logger.info("claude-code circuit closed")
+                self.state = CLOSED
+                self.failures = 0
+                return
+
+            self.failures += 1
+            self.last_error = getattr(error, "kind", None) or type(error).__name__
+            if probe or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_until = time.monotonic() + self.reset_timeout
+                logger.warning(
+                    f"claude-code circuit open after {self.failures} consecutive failures "
+                    f"(last: {self.last_error}); failing fast for {self.reset_timeout} seconds"
+                )
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Hold the circuit for the duration of an execution"""
+        probe = self.acquire()
+        try:
+            yield
+        except BaseException as e:
+            # Including a cancelled or closed request, which frees a probe without a verdict
+            self.release(probe, e)
+            raise
+        self.release(probe)
@@ -0,0 +1,199 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from claude_code_server.config import get_env_float, get_env_int
+from claude_code_server.store import SqliteStore, StateStore
+
+logger = logging.getLogger(__name__)
+
+# Request params that don't change what claude-code answers
+NON_SEMANTIC_PARAMS = {"stream", "stream_options", "user", "metadata", "extra_headers"}
+
+# Message fields besides role and content that change the conversation: a function call, the
+# call a tool message answers, or the participant's name
+MESSAGE_FIELDS = ("name", "tool_calls", "tool_call_id")
+
+# Namespace of the shared tier's entries in the state store
+CACHE_NAMESPACE = "responses"
+
+
+class CacheDirectives(NamedTuple):
+    """Per-request cache bypass parsed from a Cache-Control header"""
+
+    no_cache: bool = False
+    no_store: bool = False
+
+
+def parse_cache_control(value: Optional[str]) -> CacheDirectives:
+    """Parse a Cache-Control header value into the directives the response cache honors"""
+    if not value:
+        return CacheDirectives()
+
+    directives = {part.strip().lower() for part in value.split(",")}
+    return CacheDirectives(no_cache="no-cache" in directives, no_store="no-store" in directives)
+
+
+def make_cache_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    params: Dict[str, Any],
+    options: Sequence[str] = (),
+) -> str:
+    """Hash the normalized messages, the params that affect the response and the CLI options
+    of the deployment the request was routed to"""
+    normalized = [_normalize_message(message) for message in messages]
+    relevant = {k: v for k, v in params.items() if k not in NON_SEMANTIC_PARAMS}
+    payload = json.dumps(
+        {"model": model, "messages": normalized, "params": relevant, "options": list(options)},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of a message that identify it, with surrounding whitespace stripped"""
+    content = message.get("content")
+    normalized = {
+        "role": message.get("role"),
+        "content": content.strip() if isinstance(content, str) else content,
+    }
+    for field in MESSAGE_FIELDS:
+        if message.get(field) is not None:
+            normalized[field] = message[field]
+    return normalized
+
+
+class ResponseCache:
+    """Two-tier cache of claude-code responses
+
+    An in-memory LRU bounded by the serialized size of its entries sits in front of an
+    optional shared tier: a sqlite file at ``disk_path`` that survives restarts, or else a
+    ``store`` shared with other proxy workers. Entries expire ``ttl`` seconds after they are
+    stored, in both tiers.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: float = 3600.0,
+        disk_path: Optional[str] = None,
+        store: Optional[StateStore] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = (
+            collections.OrderedDict()
+        )
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0}
+        self._shared: Optional[StateStore] = None
+        if disk_path:
+            logger.info(f"Using response cache disk tier at {disk_path}")
+            self._shared = SqliteStore(disk_path)
+        elif store is not None and store.shared:
+            self._shared = store
+
+    @classmethod
+    def from_env(cls, store: Optional[StateStore] = None) -> Optional["ResponseCache"]:
+        """Create a cache from CLAUDE_CODE_CACHE_* environment variables, or None if disabled
+
+        A shared ``store`` backs the second tier unless CLAUDE_CODE_CACHE_PATH names a file.
+        """
+        max_bytes = get_env_int("CLAUDE_CODE_CACHE_MAX_BYTES", 0)
+        disk_path = os.environ.get("CLAUDE_CODE_CACHE_PATH")
+        if max_bytes <= 0 and not disk_path:
+            return None
+
+        return cls(
+            max_bytes,
+            ttl=get_env_float("CLAUDE_CODE_CACHE_TTL", 3600.0),
+            disk_path=disk_path,
+            store=store,
+        )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached response for a key, or None if it is missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, _, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._record_hit("memory_hits")
+                    return value
+                self._evict(key)
+
+            value = self._disk_get(key)
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+
+            # Promote to memory with the remaining lifetime of the disk entry
+            self._record_hit("disk_hits")
+            self._memory_set(key, value[0], value[1])
+            return value[1]
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a response in every tier"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._memory_set(key, expires_at, value)
+            self._disk_set(key, expires_at, value)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current memory usage"""
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._bytes}
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._shared is not None:
+                self._shared.clear(CACHE_NAMESPACE)
+
+    def _record_hit(self, tier: str) -> None:
+        self._stats["hits"] += 1
+        self._stats[tier] += 1
+
+    def _memory_set(self, key: str, expires_at: float, value: Dict[str, Any]) -> None:
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def _evict(self, key: str) -> None:
+        self._bytes -= self._entries.pop(key)[1]
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        if self._shared is None:
+            return None
+
+        entry = self._shared.get(CACHE_NAMESPACE, key)
+        if entry is None:
+            return None
+        return entry.expires_at, entry.value
+
+    def _disk_set(self, key: str, expires_at: float, value: Dict[str, Any]) -> None:
+        if self._shared is not None:
+            self._shared.set(CACHE_NAMESPACE, key, value, expires_at)
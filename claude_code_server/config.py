@@ -0,0 +1,22 @@
+import os
+from typing import Optional
+
+
+def get_env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment"""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def get_env_float(name: str, default: Optional[float]) -> Optional[float]:
+    """Read a float setting from the environment"""
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def get_env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting from the environment"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,128 @@
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from claude_code_server.admission import AdmissionRejectedError
+from claude_code_server.config import get_env_float
+from claude_code_server.errors import is_rate_limited
+
+logger = logging.getLogger(__name__)
+
+
+class CredentialProfile:
+    """One account claude-code can run under, as environment overrides for the child
+
+    A value of None removes the variable, so a login profile isn't shadowed by an API key
+    the proxy itself was started with.
+    """
+
+    def __init__(self, name: str, env: Dict[str, Optional[str]]):
+        self.name = name
+        self.env = env
+        self.outstanding = 0
+        self.cooldown_until = 0.0
+
+    def environ(self) -> Dict[str, str]:
+        """The proxy's environment with this profile's overrides applied"""
+        env = dict(os.environ)
+        for name, value in self.env.items():
+            if value is None:
+                env.pop(name, None)
+            else:
+                env[name] = value
+        return env
+
+
+class CredentialPool:
+    """Spread claude-code executions over several accounts to add up their rate limits
+
+    Each execution leases the profile with the fewest executions in flight. A profile whose
+    execution fails with a rate-limit error cools down for ``cooldown`` seconds, during which
+    it gets no new work; when every profile is cooling down, requests are rejected with a 429
+    until the first one recovers.
+    """
+
+    def __init__(self, profiles: List[CredentialProfile], cooldown: float = 60.0):
+        self.profiles = profiles
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["CredentialPool"]:
+        """Create a pool from CLAUDE_CODE_API_KEYS / CLAUDE_CODE_CONFIG_DIRS, or None if unset
+
+        Both take a comma-separated list; each entry becomes one profile.
+        """
+        profiles = []
+        api_keys = _split_list(os.environ.get("CLAUDE_CODE_API_KEYS"))
+        for i, api_key in enumerate(api_keys, start=1):
+            profiles.append(CredentialProfile(f"api-key-{i}", {"ANTHROPIC_API_KEY": api_key}))
+
+        config_dirs = _split_list(os.environ.get("CLAUDE_CODE_CONFIG_DIRS"))
+        for i, config_dir in enumerate(config_dirs, start=1):
+            env = {"CLAUDE_CONFIG_DIR": os.path.expanduser(config_dir), "ANTHROPIC_API_KEY": None}
+            profiles.append(CredentialProfile(f"config-dir-{i}", env))
+
+        if not profiles:
+            return None
+
+        logger.info(f"Spreading claude-code executions over {len(profiles)} credential profiles")
+        return cls(profiles, cooldown=get_env_float("CLAUDE_CODE_CREDENTIAL_COOLDOWN", 60.0))
+
+    def get(self, name: Optional[str]) -> Optional[CredentialProfile]:
+        """Look up a profile by name"""
+        return next((p for p in self.profiles if p.name == name), None)
+
+    def acquire(self, preferred: Optional[str] = None) -> CredentialProfile:
+        """Lease a profile, keeping ``preferred`` if it is available
+
+        Raises:
+            AdmissionRejectedError: every profile is cooling down
+        """
+        with self._lock:
+            now = time.monotonic()
+            available = [p for p in self.profiles if p.cooldown_until <= now]
+            if not available:
+                retry_after = min(p.cooldown_until for p in self.profiles) - now
+                raise AdmissionRejectedError(
+                    "claude-code rate limited on every credential profile",
+                    retry_after=max(1, math.ceil(retry_after)),
+                )
+
+            profile = next((p for p in available if p.name == preferred), None)
+            if profile is None:
+                profile = min(available, key=lambda p: p.outstanding)
+            profile.outstanding += 1
+            return profile
+
+    def release(self, profile: CredentialProfile, error: Optional[BaseException] = None) -> None:
+        """Return a leased profile, starting its cool-down if the execution was rate limited"""
+        with self._lock:
+            profile.outstanding -= 1
+            if error is None or not is_rate_limited(str(error)):
+                return
+            profile.cooldown_until = time.monotonic() + self.cooldown
+
+        logger.warning(
+            f"Credential profile {profile.name} is rate limited; "
+            f"cooling down for {self.cooldown} seconds"
+        )
+
+    @contextmanager
+    def lease(self, preferred: Optional[str] = None) -> Iterator[CredentialProfile]:
+        """Hold a profile for the duration of an execution"""
+        profile = self.acquire(preferred)
+        try:
+            yield profile
+        except BaseException as e:
+            self.release(profile, e)
+            raise
+        self.release(profile)
+
+
+def _split_list(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
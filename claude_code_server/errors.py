@@ -0,0 +1,122 @@
+import random
+import re
+from typing import Optional
+
+from claude_code_server.config import get_env_float, get_env_int
+
+# Error classes of a failed claude-code execution
+AUTH = "auth"
+RATE_LIMITED = "rate_limited"
+OVERLOADED = "overloaded"
+NETWORK = "network"
+INVALID_REQUEST = "invalid_request"
+INVALID_OUTPUT = "invalid_output"
+SESSION_NOT_FOUND = "session_not_found"
+NOT_FOUND = "not_found"
+OUTPUT_LIMIT = "output_limit"
+# A timeout the client asked for ran out, shorter than the server's own
+DEADLINE = "deadline"
+EXIT = "exit"
+
+# Failures of the upstream service or the connection to it, which may pass on their own
+RETRYABLE = frozenset({OVERLOADED, NETWORK})
+
+# How the CLI and the API report an account-level limit
+RATE_LIMIT_PATTERN = re.compile(r"rate[ _-]?limit|usage limit|\b429\b", re.IGNORECASE)
+
+# Checked in order; the first match decides the class
+ERROR_PATTERNS = (
+    (
+        AUTH,
+        re.compile(
+            r"invalid api key|please run /login|authentication_error|oauth token has expired",
+            re.IGNORECASE,
+        ),
+    ),
+    (RATE_LIMITED, RATE_LIMIT_PATTERN),
+    (SESSION_NOT_FOUND, re.compile(r"no conversation found", re.IGNORECASE)),
+    # The CLI gave up on producing an answer matching --json-schema
+    (INVALID_OUTPUT, re.compile(r"structured_output", re.IGNORECASE)),
+    (
+        INVALID_REQUEST,
+        re.compile(
+            r"api error:? 4(?:00|13|22)\b|invalid_request_error|prompt is too long", re.IGNORECASE
+        ),
+    ),
+    (
+        OVERLOADED,
+        re.compile(
+            r"overloaded|api error:? 5\d\d\b|internal server error|service unavailable"
+            r"|bad gateway|gateway timeout",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        NETWORK,
+        re.compile(
+            r"econnreset|econnrefused|etimedout|enotfound|eai_again|socket hang up|fetch failed"
+            r"|network error|connection (?:error|reset|refused)",
+            re.IGNORECASE,
+        ),
+    ),
+)
+
+
+def is_rate_limited(error_msg: str) -> bool:
+    """Whether a claude-code failure means the account ran into its rate limit"""
+    return bool(RATE_LIMIT_PATTERN.search(error_msg))
+
+
+def classify_message(error_msg: str) -> str:
+    """Error class of a claude-code failure, from what the CLI printed"""
+    return next((kind for kind, pattern in ERROR_PATTERNS if pattern.search(error_msg)), EXIT)
+
+
+class ClaudeCodeError(RuntimeError):
+    """A failed claude-code execution, with the class of failure it was"""
+
+    def __init__(self, message: str, kind: str = EXIT):
+        super().__init__(message)
+        self.kind = kind
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE
+
+
+class RetryPolicy:
+    """Retry transient claude-code failures with jittered exponential backoff
+
+    The n-th retry waits a random time between 0 and ``base_delay * 2**n`` seconds, capped at
+    ``max_delay``, so requests that failed together don't all come back at the same moment.
+    """
+
+    def __init__(self, attempts: int = 2, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Create a policy from CLAUDE_CODE_RETRY_ATTEMPTS / _BASE_DELAY / _MAX_DELAY"""
+        return cls(
+            attempts=get_env_int("CLAUDE_CODE_RETRY_ATTEMPTS", 2),
+            base_delay=get_env_float("CLAUDE_CODE_RETRY_BASE_DELAY", 0.5),
+            max_delay=get_env_float("CLAUDE_CODE_RETRY_MAX_DELAY", 8.0),
+        )
+
+    def delay(
+        self, error: BaseException, attempt: int, time_left: Optional[float] = None
+    ) -> Optional[float]:
+        """Seconds to wait before retrying after failed attempt ``attempt`` (0-based)
+
+        Returns None if the error isn't transient, the retries are used up or the wait
+        would run past the request's deadline.
+        """
+        if attempt >= self.attempts or not getattr(error, "retryable", False):
+            return None
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if time_left is not None and delay >= time_left:
+            return None
+        return delay
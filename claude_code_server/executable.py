@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from claude_code_server.config import get_env_bool, get_env_float
+from claude_code_server.errors import AUTH, NOT_FOUND, ClaudeCodeError, classify_message
+from claude_code_server.process import run_process
+
+logger = logging.getLogger(__name__)
+
+# Seconds each startup check (version, auth status, warm-up) may take
+CHECK_TIMEOUT = 60.0
+
+# Seconds after a failed check before the readiness probe runs the checks again
+RECHECK_INTERVAL = 30.0
+
+# Prompt of the optional warm-up execution; the answer is thrown away
+WARMUP_PROMPT = "Reply with OK."
+
+# Readiness states
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+
+
+class ClaudeExecutable:
+    """The claude-code CLI, found once and checked before requests arrive
+
+    The executable is ``path`` if given, or else looked up on PATH the first time it is needed;
+    either way the result is kept, so requests don't search PATH. ``check()`` runs
+    ``claude --version`` and ``claude auth status`` (once per environment in ``envs``) and,
+    with ``warmup``, a one-line prompt that loads the CLI into the page cache and proves the
+    credentials work. Its outcome is the proxy's readiness. A failed check is run again in the
+    background when readiness is asked for at least ``recheck_interval`` seconds later, so the
+    proxy becomes ready once the CLI is installed or logged in without a restart.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        warmup: bool = False,
+        envs: Optional[List[Dict[str, str]]] = None,
+        timeout: float = CHECK_TIMEOUT,
+        recheck_interval: float = RECHECK_INTERVAL,
+    ):
+        self.configured_path = path
+        self.warmup = warmup
+        self.envs = envs or [dict(os.environ)]
+        self.timeout = timeout
+        self.recheck_interval = recheck_interval
+        self.state = STARTING
+        self.version: Optional[str] = None
+        self.error: Optional[str] = None
+        self._path: Optional[str] = None
+        self._checked = False
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, envs: Optional[List[Dict[str, str]]] = None) -> "ClaudeExecutable":
+        """Configure from CLAUDE_CODE_PATH / CLAUDE_CODE_WARMUP and start the startup checks
+
+        The checks run in the background unless CLAUDE_CODE_STARTUP_CHECKS is false, in which
+        case the proxy is ready as soon as the executable is found.
+        """
+        executable = cls(
+            os.environ.get("CLAUDE_CODE_PATH") or None,
+            warmup=get_env_bool("CLAUDE_CODE_WARMUP", False),
+            envs=envs,
+            timeout=get_env_float("CLAUDE_CODE_CHECK_TIMEOUT", CHECK_TIMEOUT),
+            recheck_interval=get_env_float("CLAUDE_CODE_RECHECK_INTERVAL", RECHECK_INTERVAL),
+        )
+        if get_env_bool("CLAUDE_CODE_STARTUP_CHECKS", True):
+            executable.start()
+        return executable
+
+    @property
+    def path(self) -> str:
+        """Absolute path of the claude executable
+
+        Raises:
+            ClaudeCodeError: it isn't installed, or CLAUDE_CODE_PATH isn't an executable
+        """
+        if self._path is None:
+            self._path = self._resolve()
+        return self._path
+
+    @property
+    def ready(self) -> bool:
+        if self._thread is None and not self._checked:
+            # No startup checks: ready as soon as the executable can be found
+            try:
+                self.path
+            except ClaudeCodeError as e:
+                self.state, self.error = FAILED, str(e)
+                return False
+            self.state, self.error = READY, None
+        elif self.state == FAILED and self._checked:
+            self._recheck()
+        return self.state == READY
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness details for the health endpoint"""
+        ready = self.ready
+        status: Dict[str, Any] = {"status": self.state, "ready": ready}
+        if self._path is not None:
+            status["path"] = self._path
+        if self.version is not None:
+            status["version"] = self.version
+        if self.error is not None:
+            status["error"] = self.error
+        return status
+
+    def start(self) -> None:
+        """Run the startup checks in a background thread"""
+        self._thread = threading.Thread(target=self.check, daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the startup checks to finish; returns whether the CLI is ready"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def check(self) -> bool:
+        """Find the executable, check its version and credentials and warm it up"""
+        with self._lock:
+            try:
+                self._path = self._resolve()
+                self.version = self._check_version()
+                for env in self.envs:
+                    self._check_auth(env)
+                if self.warmup:
+                    self._warm_up()
+            except (ClaudeCodeError, OSError, subprocess.SubprocessError) as e:
+                self.state, self.error = FAILED, str(e)
+                logger.error(f"claude-code is not usable: {e}")
+            else:
+                self.state, self.error = READY, None
+                logger.info(f"claude-code {self.version} at {self._path} is ready")
+            self._checked = True
+            self._checked_at = time.monotonic()
+        return self.state == READY
+
+    def _recheck(self) -> None:
+        """Run the failed checks again in the background once the recheck interval has passed"""
+        if time.monotonic() - self._checked_at < self.recheck_interval:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        logger.info("Checking claude-code again after the last check failed")
+        # Don't start another re-check until this one has finished
+        self._checked_at = time.monotonic()
+        self.start()
+
+    def _resolve(self) -> str:
+        if self.configured_path is None:
+            path = shutil.which("claude")
+            if not path:
+                raise ClaudeCodeError(
+                    "claude command not found. Please install claude-code CLI.", NOT_FOUND
+                )
+            return path
+
+        path = os.path.abspath(os.path.expanduser(self.configured_path))
+        if not os.path.isfile(path) or not os.access(path, os.X_OK):
+            raise ClaudeCodeError(
+                f"claude command not found: CLAUDE_CODE_PATH {path} is not an executable file",
+                NOT_FOUND,
+            )
+        return path
+
+    def _check_version(self) -> str:
+        result = run_process([self._path, "--version"], timeout=self.timeout)
+        version = result.stdout.strip().split(" ", 1)[0]
+        if not version:
+            raise ClaudeCodeError(f"{self._path} --version printed no version")
+        return version
+
+    def _check_auth(self, env: Dict[str, str]) -> None:
+        try:
+            result = run_process([self._path, "auth", "status", "--json"], self.timeout, env)
+            status = json.loads(result.stdout)
+        except subprocess.TimeoutExpired:
+            # A hanging auth check says nothing about the credentials; don't fail on it
+            logger.warning(
+                f"claude-code auth status did not finish in {self.timeout:g}s; "
+                "skipping the authentication check"
+            )
+            return
+        except (subprocess.CalledProcessError, ValueError) as e:
+            # CLIs before `claude auth status` existed; the warm-up or first request will tell
+            logger.warning(f"Could not check claude-code authentication: {e}")
+            return
+
+        if not status.get("loggedIn"):
+            config_dir = (
+                status.get("configDirectory") or env.get("CLAUDE_CONFIG_DIR") or "~/.claude"
+            )
+            raise ClaudeCodeError(
+                f"claude-code is not logged in (config directory {config_dir}). Set "
+                "ANTHROPIC_API_KEY or run 'claude /login' to authenticate.",
+                AUTH,
+            )
+
+    def _warm_up(self) -> None:
+        cmd = [self._path, "-p", "--output-format", "json"]
+        try:
+            result = run_process(
+                cmd, self.timeout, self.envs[0], input=WARMUP_PROMPT.encode("utf-8")
+            )
+            output = result.stdout
+            failed = bool(json.loads(output).get("is_error"))
+        except subprocess.CalledProcessError as e:
+            output = (e.stderr or e.stdout or "").strip()
+            failed = True
+        except (ValueError, AttributeError):
+            # Not the JSON result, but the CLI ran and exited cleanly
+            failed = False
+
+        if failed:
+            raise ClaudeCodeError(f"claude-code warm-up failed: {output}", classify_message(output))
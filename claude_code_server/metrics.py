@@ -0,0 +1,545 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+import litellm
+
+from claude_code_server.admission import PreemptedError
+from claude_code_server.breaker import CircuitOpenError
+from claude_code_server.config import get_env_int
+from claude_code_server.errors import ClaudeCodeError
+from claude_code_server.store import StateStore
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a warm worker answering in milliseconds to multi-turn agent runs
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Bytes of answer text
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LABELS = ("model", "key")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Namespace of each worker's samples in a shared state store
+METRICS_NAMESPACE = "metrics"
+
+# Seconds between a worker's writes of its samples to a shared store; a worker that hasn't
+# written for three intervals has exited and drops out of the totals
+METRICS_PUBLISH_INTERVAL = 5.0
+
+LabelValues = Tuple[str, ...]
+
+# Whether the provider can serve requests, and details to show on the health endpoint
+HealthCheck = Callable[[], Tuple[bool, Dict[str, Any]]]
+
+MetricT = TypeVar("MetricT", bound="_Metric")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """A metric family with a fixed set of label names"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Dict[LabelValues, Any]:
+        """The current value of each label set"""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, samples: Iterable[Dict[LabelValues, Any]]) -> Dict[LabelValues, Any]:
+        """Combine the samples of several workers into the family's totals"""
+        merged: Dict[LabelValues, Any] = {}
+        for worker_samples in samples:
+            for key, value in worker_samples.items():
+                merged[key] = value if key not in merged else self._combine(merged[key], value)
+        return merged
+
+    def render(self, samples: Optional[Dict[LabelValues, Any]] = None) -> List[str]:
+        """Exposition lines of the family, with ``samples`` instead of its own values if given"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in (self.samples() if samples is None else samples).items():
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: LabelValues, value: Any) -> List[str]:
+        labels = _format_labels(self.label_names, key)
+        return [f"{self.name}{labels} {_format_value(value)}"]
+
+    def _combine(self, a: Any, b: Any) -> Any:
+        return a + b
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+
+class Counter(_Metric):
+    """A monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from a callback at scrape time
+
+    The values of several workers are added up, or combined with ``combine`` instead.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+        combine: Optional[Callable[[float, float], float]] = None,
+    ):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._function = function
+        if combine is not None:
+            self._combine = combine  # type: ignore[method-assign]
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Dict[LabelValues, Any]:
+        if self._function is not None:
+            return {(): self._function()}
+        return super().samples()
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (non-cumulative, last is +Inf), sum
+        self._values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def sum(self, **labels: str) -> float:
+        entry = self._values.get(self._key(labels))
+        return entry[1] if entry else 0.0
+
+    def samples(self) -> Dict[LabelValues, Any]:
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    def _render_sample(self, key: LabelValues, value: Any) -> List[str]:
+        counts, total = value
+        names = (*self.label_names, "le")
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), counts):
+            cumulative += count
+            labels = _format_labels(names, (*key, _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def _combine(self, a: Any, b: Any) -> Any:
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1]
+
+
+class MetricsRegistry:
+    """A set of metrics rendered together in the Prometheus text exposition format
+
+    Once shared through a state store, each worker writes its samples to the store and
+    whichever worker serves /metrics renders the totals of every live worker.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._store: Optional[StateStore] = None
+        self._publisher: Optional[threading.Thread] = None
+
+    def register(self, metric: MetricT) -> MetricT:
+        self._metrics.append(metric)
+        return metric
+
+    def share(self, store: StateStore, interval: float = METRICS_PUBLISH_INTERVAL) -> None:
+        """Publish this worker's samples to a shared store every ``interval`` seconds"""
+        self._store = store
+        self._publisher = threading.Thread(
+            target=self._publish_forever, args=(interval,), daemon=True
+        )
+        self._publisher.start()
+
+    def publish(self, ttl: float = 3 * METRICS_PUBLISH_INTERVAL) -> None:
+        """Write this worker's samples to the shared store"""
+        snapshot = {
+            metric.name: [[list(key), value] for key, value in metric.samples().items()]
+            for metric in self._metrics
+        }
+        self._store.set(METRICS_NAMESPACE, self._store.worker, snapshot, time.time() + ttl)
+
+    def render(self) -> str:
+        if self._store is None:
+            workers = None
+        else:
+            self.publish()
+            workers = list(self._store.items(METRICS_NAMESPACE).values())
+
+        lines: List[str] = []
+        for metric in self._metrics:
+            if workers is None:
+                lines.extend(metric.render())
+                continue
+            samples = (
+                {tuple(key): value for key, value in worker.get(metric.name, [])}
+                for worker in workers
+            )
+            lines.extend(metric.render(metric.merge(samples)))
+        return "\n".join(lines) + "\n"
+
+    def _publish_forever(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.publish()
+            except Exception as e:
+                logger.warning(f"Failed to publish claude-code metrics: {e}")
+
+
+def classify_error(error: BaseException) -> str:
+    """Bucket a failed execution for the errors counter"""
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    if isinstance(error, litellm.Timeout):
+        return "timeout"
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, ClaudeCodeError):
+        return error.kind
+    if isinstance(error, PreemptedError):
+        return "preempted"
+    if isinstance(error, litellm.RateLimitError):
+        return "rejected"
+    return "other"
+
+
+class ProviderMetrics:
+    """The metrics the provider records for each claude-code execution"""
+
+    def __init__(self, store: Optional[StateStore] = None):
+        self.registry = MetricsRegistry()
+        if store is not None and store.shared:
+            self.registry.share(store)
+        register = self.registry.register
+        self.queue_wait = register(
+            Histogram(
+                "claude_code_queue_wait_seconds",
+                "Time spent waiting for an admission slot",
+                REQUEST_LABELS,
+            )
+        )
+        self.spawn = register(
+            Histogram(
+                "claude_code_spawn_seconds",
+                "Time from starting a claude CLI process to its first line of stream-json output",
+                REQUEST_LABELS,
+            )
+        )
+        self.time_to_first_byte = register(
+            Histogram(
+                "claude_code_time_to_first_byte_seconds",
+                "Time from the start of an execution to the first text it streamed",
+                REQUEST_LABELS,
+            )
+        )
+        self.duration = register(
+            Histogram(
+                "claude_code_request_duration_seconds",
+                "Time from the start of an execution to its end, including queueing",
+                REQUEST_LABELS,
+            )
+        )
+        self.output_size = register(
+            Histogram(
+                "claude_code_output_bytes",
+                "Size of the answer text",
+                REQUEST_LABELS,
+                buckets=SIZE_BUCKETS,
+            )
+        )
+        self.errors = register(
+            Counter(
+                "claude_code_errors_total",
+                "Failed executions by error class",
+                (*REQUEST_LABELS, "error"),
+            )
+        )
+        self.retries = register(
+            Counter(
+                "claude_code_retries_total",
+                "Executions run again after a transient failure",
+                REQUEST_LABELS,
+            )
+        )
+        self.live_children = register(
+            Gauge(
+                "claude_code_live_children",
+                "claude CLI processes currently running for a request",
+                REQUEST_LABELS,
+            )
+        )
+
+    def track_pool(self, idle_count: Callable[[], float]) -> None:
+        """Expose the number of idle warm workers"""
+        self.registry.register(
+            Gauge(
+                "claude_code_pool_idle_workers",
+                "Warm claude workers waiting for a prompt",
+                function=idle_count,
+            )
+        )
+
+    def track_breaker(self, is_open: Callable[[], float]) -> None:
+        """Expose whether the circuit breaker is failing requests fast"""
+        self.registry.register(
+            Gauge(
+                "claude_code_circuit_open",
+                "1 while the circuit breaker is open or half-open, 0 while it is closed",
+                function=is_open,
+                combine=max,
+            )
+        )
+
+    def trace(self, model: str, key: str) -> "RequestTrace":
+        """Start timing one execution"""
+        return RequestTrace(self, model, key)
+
+
+class RequestTrace:
+    """Timings of one execution, recorded into ProviderMetrics
+
+    Used as a context manager around the execution: leaving it records the duration, or
+    the error class if the execution failed.
+    """
+
+    def __init__(self, metrics: ProviderMetrics, model: str, key: str):
+        self.labels = {"model": model, "key": key}
+        self._metrics = metrics
+        self._started = time.monotonic()
+        self._process_started: Optional[float] = None
+        self._first_output = False
+
+    def __enter__(self) -> "RequestTrace":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self._metrics.duration.observe(time.monotonic() - self._started, **self.labels)
+        if exc is not None:
+            self._metrics.errors.inc(**self.labels, error=classify_error(exc))
+
+    def queued(self, seconds: float) -> None:
+        """Record the time spent waiting for an admission slot"""
+        self._metrics.queue_wait.observe(seconds, **self.labels)
+
+    def process_started(self) -> None:
+        """Record that a claude CLI process was started for this execution"""
+        self._process_started = time.monotonic()
+        self._metrics.live_children.inc(**self.labels)
+
+    def process_ready(self) -> None:
+        """Record that the process produced its first line of output, timing its startup"""
+        if self._process_started is not None:
+            elapsed = time.monotonic() - self._process_started
+            self._process_started = None
+            self._metrics.spawn.observe(elapsed, **self.labels)
+
+    def process_exited(self) -> None:
+        """Record that the process started for this execution is gone"""
+        self._process_started = None
+        self._metrics.live_children.dec(**self.labels)
+
+    def output(self) -> None:
+        """Record that text arrived, timing the first one"""
+        if not self._first_output:
+            self._first_output = True
+            elapsed = time.monotonic() - self._started
+            self._metrics.time_to_first_byte.observe(elapsed, **self.labels)
+
+    def retried(self) -> None:
+        """Record that the execution failed transiently and is run again"""
+        self._metrics.retries.inc(**self.labels)
+
+    def finished(self, content: str) -> None:
+        """Record the size of the answer"""
+        self._metrics.output_size.observe(len(content.encode("utf-8")), **self.labels)
+
+
+class MetricsServer:
+    """Serve a registry on /metrics from a background thread
+
+    With a ``health`` check it also serves /health/liveliness, which answers 200 while the
+    process runs, and /health/readiness, which answers 503 until the check passes.
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry,
+        port: int,
+        host: str = "0.0.0.0",
+        health: Optional[HealthCheck] = None,
+    ):
+        handler = self._make_handler(registry, health)
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @classmethod
+    def from_env(
+        cls, registry: MetricsRegistry, health: Optional[HealthCheck] = None
+    ) -> Optional["MetricsServer"]:
+        """Start a server if CLAUDE_CODE_METRICS_PORT is set, or return None"""
+        port = get_env_int("CLAUDE_CODE_METRICS_PORT", 0)
+        if port <= 0:
+            return None
+
+        host = os.environ.get("CLAUDE_CODE_METRICS_HOST") or "0.0.0.0"
+        try:
+            server = cls(registry, port, host, health)
+        except OSError as e:
+            # Another proxy worker in this container already serves the port
+            logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+            return None
+
+        server.start()
+        logger.info(f"Serving claude-code metrics on http://{host}:{server.port}/metrics")
+        return server
+
+    @property
+    def port(self) -> int:
+        """Port the server is bound to"""
+        return self._server.server_address[1]
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def _make_handler(
+        registry: MetricsRegistry, health: Optional[HealthCheck]
+    ) -> Type[BaseHTTPRequestHandler]:
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    self._send(200, CONTENT_TYPE, registry.render().encode("utf-8"))
+                elif path == "/health/liveliness" and health is not None:
+                    self._send(200, "application/json", b'{"status": "alive"}')
+                elif path == "/health/readiness" and health is not None:
+                    ready, details = health()
+                    body = json.dumps(details).encode("utf-8")
+                    self._send(200 if ready else 503, "application/json", body)
+                else:
+                    self.send_error(404)
+
+            def _send(self, status: int, content_type: str, body: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(format % args)
+
+        return Handler
@@ -0,0 +1,136 @@
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# LiteLLM model prefix routing requests to this provider
+PROVIDER_PREFIX = "claude-code-server/"
+
+# Model name that runs whatever model the CLI is configured with
+DEFAULT_MODEL = "claude-code"
+
+
+def model_name(model: str) -> str:
+    """The claude model a LiteLLM model string names, without the provider prefix"""
+    name = model[len(PROVIDER_PREFIX) :] if model.startswith(PROVIDER_PREFIX) else model
+    return name or DEFAULT_MODEL
+
+
+class ModelOptions(NamedTuple):
+    """CLI options of a model alias, from its ``litellm_params`` in litellm_config.yaml
+
+    The model itself comes from the deployment's ``model``: ``claude-code-server/sonnet``
+    runs ``claude --model sonnet``, while ``claude-code-server/claude-code`` leaves the
+    choice to the CLI. The options are read from the deployment in ModelRegistry, never
+    from the request: they decide what the claude process may do on this host.
+    """
+
+    name: str = DEFAULT_MODEL
+    max_turns: Optional[int] = None
+    allowed_tools: Tuple[str, ...] = ()
+    disallowed_tools: Tuple[str, ...] = ()
+    system_prompt: Optional[str] = None
+    permission_mode: Optional[str] = None
+
+    @classmethod
+    def from_params(cls, model: str, params: Dict[str, Any]) -> "ModelOptions":
+        """Read the options from a deployment's litellm_params
+
+        Raises:
+            ValueError: max_turns isn't a positive integer
+        """
+        max_turns = params.get("max_turns")
+        if max_turns is not None and (not str(max_turns).isdigit() or int(max_turns) < 1):
+            raise ValueError(f"max_turns must be a positive integer, got {max_turns!r}")
+
+        return cls(
+            name=model_name(model),
+            max_turns=None if max_turns is None else int(max_turns),
+            allowed_tools=_tool_list(params.get("allowed_tools")),
+            disallowed_tools=_tool_list(params.get("disallowed_tools")),
+            system_prompt=params.get("system_prompt") or None,
+            permission_mode=params.get("permission_mode") or None,
+        )
+
+    @property
+    def args(self) -> List[str]:
+        """CLI options selecting the model and restricting what it may do"""
+        args = []
+        if self.name != DEFAULT_MODEL:
+            args.extend(["--model", self.name])
+        if self.max_turns is not None:
+            args.extend(["--max-turns", str(self.max_turns)])
+        if self.allowed_tools:
+            args.extend(["--allowedTools", ",".join(self.allowed_tools)])
+        if self.disallowed_tools:
+            args.extend(["--disallowedTools", ",".join(self.disallowed_tools)])
+        if self.system_prompt:
+            args.extend(["--system-prompt", self.system_prompt])
+        if self.permission_mode:
+            args.extend(["--permission-mode", self.permission_mode])
+        return args
+
+
+def _tool_list(value: Any) -> Tuple[str, ...]:
+    """Tool names from a YAML list or a comma-separated string"""
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = value.split(",")
+    return tuple(tool.strip() for tool in value if tool and tool.strip())
+
+
+class ModelRegistry:
+    """The deployments of the proxy's model_list, the trusted source of per-model options
+
+    LiteLLM merges the request body over a deployment's litellm_params before calling the
+    provider, so anything read from the params a request arrives with can be set by the
+    client. The deployment a request was routed to is found here by the id LiteLLM puts in
+    its metadata instead.
+
+    Without a ``model_list`` the running proxy's router is consulted on every lookup, as it
+    is only created after the provider is loaded and is rebuilt when models are edited.
+    """
+
+    def __init__(self, model_list: Optional[List[Dict[str, Any]]] = None):
+        self._model_list = model_list
+
+    @property
+    def model_list(self) -> List[Dict[str, Any]]:
+        if self._model_list is not None:
+            return self._model_list
+        return list(getattr(_proxy_router(), "model_list", None) or [])
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the model_list is known yet
+
+        The proxy imports the provider while it loads its config and creates the router
+        only afterwards; until then no model can be resolved. Outside the proxy there is no
+        router to wait for.
+        """
+        if self._model_list is not None:
+            return True
+        return "litellm.proxy.proxy_server" not in sys.modules or _proxy_router() is not None
+
+    def params(self, model_id: Optional[str]) -> Dict[str, Any]:
+        """litellm_params of the deployment with a model_info id, or none if it isn't listed"""
+        if not model_id:
+            return {}
+        for deployment in self.model_list:
+            if (deployment.get("model_info") or {}).get("id") == model_id:
+                return dict(deployment.get("litellm_params") or {})
+        return {}
+
+    def resolve(self, model_name: str) -> Optional[Dict[str, Any]]:
+        """The first claude-code deployment listed under a model_name, or None"""
+        for deployment in self.model_list:
+            model = (deployment.get("litellm_params") or {}).get("model") or ""
+            if deployment.get("model_name") == model_name and model.startswith(PROVIDER_PREFIX):
+                return deployment
+        return None
+
+
+def _proxy_router() -> Any:
+    """The running proxy's router, or None before it is created or outside the proxy"""
+    # Only loaded when running inside the proxy; importing it here would start one
+    proxy = sys.modules.get("litellm.proxy.proxy_server")
+    return getattr(proxy, "llm_router", None)
@@ -0,0 +1,285 @@
+import asyncio
+import atexit
+import collections
+import json
+import logging
+import os
+import signal
+from typing import Callable, Deque, List, Optional, Set
+
+from claude_code_server.config import get_env_float, get_env_int
+from claude_code_server.process import child_env, track_child
+
+logger = logging.getLogger(__name__)
+
+# Lines of stderr kept per worker for error reporting
+STDERR_TAIL_LINES = 50
+
+# Seconds a finished worker gets to exit on its own before it is killed
+RETIRE_GRACE_PERIOD = 5.0
+
+
+class PooledWorker:
+    """A pre-spawned claude CLI process waiting for prompts on stdin"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.requests = 0
+        self.returning = False
+        self._stderr: Deque[str] = collections.deque(maxlen=STDERR_TAIL_LINES)
+        self._stderr_task = asyncio.ensure_future(self._drain_stderr())
+
+    @property
+    def alive(self) -> bool:
+        """Whether the process is still running"""
+        return self.process.returncode is None
+
+    @property
+    def stderr(self) -> str:
+        """Last lines the process wrote to stderr"""
+        return "".join(self._stderr)
+
+    async def kill(self) -> None:
+        """Kill the process, reap it and close its stdin"""
+        if self.alive:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+        await self.process.wait()
+        # An idle worker's stdin is still open; don't leave it to the garbage collector
+        self.process.stdin.close()
+
+    def kill_now(self) -> None:
+        """Kill the process without waiting for it, for when the event loop is gone"""
+        if self.alive:
+            try:
+                os.kill(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    async def _drain_stderr(self) -> None:
+        # Keep the pipe flowing while the worker sits idle
+        while True:
+            line = await self.process.stderr.readline()
+            if not line:
+                return
+            self._stderr.append(line.decode("utf-8", errors="replace"))
+
+
+class WorkerPool:
+    """Keep claude CLI processes spawned ahead of demand so requests skip process startup
+
+    Workers run in stream-json input mode and block on stdin until a prompt arrives, so
+    Node.js startup and CLI bootstrap happen while the worker is idle. A worker serves up
+    to ``max_requests_per_worker`` prompts before it is recycled; since prompts sent to the
+    same worker share one conversation, the default of 1 keeps requests isolated.
+    """
+
+    def __init__(
+        self,
+        command_factory: Callable[[], List[str]],
+        size: int,
+        max_requests_per_worker: int = 1,
+        health_check_interval: float = 30.0,
+        stream_limit: int = 2**16,
+    ):
+        self.size = size
+        self.max_requests_per_worker = max_requests_per_worker
+        self.health_check_interval = health_check_interval
+        self._command_factory = command_factory
+        self._stream_limit = stream_limit
+        self._idle: Deque[PooledWorker] = collections.deque()
+        self._spawning = 0
+        self._returning = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._maintenance: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Future] = set()
+        self._spawns: Set[asyncio.Future] = set()
+        self._retiring: Set[PooledWorker] = set()
+        self._closed = False
+
+    @classmethod
+    def from_env(
+        cls, command_factory: Callable[[], List[str]], stream_limit: int = 2**16
+    ) -> Optional["WorkerPool"]:
+        """Create a pool from CLAUDE_CODE_POOL_* environment variables, or None if disabled
+
+        The pool's workers are killed when the process exits.
+        """
+        size = get_env_int("CLAUDE_CODE_POOL_SIZE", 0)
+        if size <= 0:
+            return None
+
+        pool = cls(
+            command_factory,
+            size=size,
+            max_requests_per_worker=get_env_int("CLAUDE_CODE_POOL_MAX_REQUESTS", 1),
+            health_check_interval=get_env_float("CLAUDE_CODE_POOL_HEALTH_CHECK_INTERVAL", 30.0),
+            stream_limit=stream_limit,
+        )
+        atexit.register(pool.shutdown)
+        return pool
+
+    @property
+    def idle_count(self) -> int:
+        """Number of workers ready to accept a prompt"""
+        return len(self._idle)
+
+    def start(self) -> None:
+        """Spawn workers and start health checks on the running event loop"""
+        if self._loop is not None or self._closed:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._maintenance = self._loop.create_task(self._maintain())
+        self._replenish()
+
+    def acquire(self) -> Optional[PooledWorker]:
+        """Take a healthy idle worker, or None if none is ready on this event loop"""
+        self.start()
+        if self._closed or self._loop is not asyncio.get_running_loop():
+            return None
+
+        worker = None
+        while self._idle:
+            candidate = self._idle.popleft()
+            if candidate.alive:
+                worker = candidate
+                break
+            self._discard(candidate)
+
+        if worker is not None and worker.requests + 1 < self.max_requests_per_worker:
+            # The worker comes back after this request, so it still counts towards the pool size
+            worker.returning = True
+            self._returning += 1
+
+        self._replenish()
+        return worker
+
+    async def submit(self, worker: PooledWorker, prompt: str) -> None:
+        """Send a prompt to a worker as a stream-json user message"""
+        worker.requests += 1
+        message = {
+            "type": "user",
+            "message": {"role": "user", "content": [{"type": "text", "text": prompt}]},
+        }
+        worker.process.stdin.write((json.dumps(message) + "\n").encode("utf-8"))
+        await worker.process.stdin.drain()
+
+        if worker.requests >= self.max_requests_per_worker:
+            # Last prompt for this worker: EOF lets the CLI exit once it has answered
+            worker.process.stdin.close()
+
+    def release(self, worker: PooledWorker, reusable: bool = True) -> None:
+        """Return a worker after a request, recycling it if it can't serve another one"""
+        if worker.returning:
+            worker.returning = False
+            self._returning -= 1
+
+        exhausted = worker.requests >= self.max_requests_per_worker
+        if reusable and worker.alive and not exhausted and not self._closed:
+            self._idle.append(worker)
+            return
+
+        self._retiring.add(worker)
+        self._track(asyncio.ensure_future(self._retire(worker, graceful=reusable)))
+        self._replenish()
+
+    async def close(self) -> None:
+        """Stop health checks, cancel pending spawns, kill all idle workers and wait for
+        retiring ones"""
+        self._closed = True
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+        for task in self._spawns:
+            task.cancel()
+
+        workers = list(self._idle)
+        self._idle.clear()
+        await asyncio.gather(*(worker.kill() for worker in workers))
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def shutdown(self) -> None:
+        """Close the pool from outside its event loop, as at interpreter exit
+
+        Health checks and pending spawns are cancelled on the loop if it still exists, and
+        idle and retiring workers are killed without waiting. Nothing is awaited, so exit
+        can't hang on a loop that no longer runs.
+        """
+        self._closed = True
+        if self._loop is not None and not self._loop.is_closed():
+            for task in [self._maintenance, *self._spawns]:
+                if task is not None:
+                    self._loop.call_soon_threadsafe(task.cancel)
+
+        workers = [*self._idle, *self._retiring]
+        self._idle.clear()
+        for worker in workers:
+            worker.kill_now()
+
+    def _replenish(self) -> None:
+        if self._loop is None or self._closed:
+            return
+
+        for _ in range(self.size - len(self._idle) - self._spawning - self._returning):
+            self._spawning += 1
+            task = self._loop.create_task(self._spawn())
+            self._spawns.add(task)
+            task.add_done_callback(self._spawns.discard)
+            self._track(task)
+
+    async def _spawn(self) -> None:
+        try:
+            cmd = self._command_factory()
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=self._stream_limit,
+                env=child_env(),
+            )
+            track_child(process)
+        except Exception as e:
+            logger.error(f"Failed to spawn claude worker: {e}")
+            return
+        finally:
+            self._spawning -= 1
+
+        worker = PooledWorker(process)
+        if self._closed:
+            await worker.kill()
+            return
+
+        logger.info(f"Spawned claude worker (pid {process.pid})")
+        self._idle.append(worker)
+
+    async def _retire(self, worker: PooledWorker, graceful: bool) -> None:
+        if graceful:
+            try:
+                await asyncio.wait_for(worker.process.wait(), timeout=RETIRE_GRACE_PERIOD)
+            except asyncio.TimeoutError:
+                pass
+        await worker.kill()
+        # A retirement cut short by the loop's teardown leaves the worker to shutdown()
+        self._retiring.discard(worker)
+
+    async def _maintain(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+
+            for worker in [w for w in self._idle if not w.alive]:
+                self._idle.remove(worker)
+                self._discard(worker)
+            self._replenish()
+
+    def _discard(self, worker: PooledWorker) -> None:
+        logger.warning(
+            f"claude worker (pid {worker.process.pid}) exited with code "
+            f"{worker.process.returncode}: {worker.stderr[-500:]}"
+        )
+
+    def _track(self, task: asyncio.Future) -> None:
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
@@ -0,0 +1,466 @@
+import asyncio
+import collections
+import logging
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from claude_code_server.config import get_env_float
+
+logger = logging.getLogger(__name__)
+
+# Set on every claude-code child to the pid of the proxy process that spawned it
+MARKER_ENV = "CLAUDE_CODE_SERVER_PID"
+
+# Seconds a child gets to exit after SIGTERM before it is killed
+TERMINATE_GRACE = 5.0
+
+# Processes younger than this are never reaped, so a child is tracked before it is judged
+MIN_ORPHAN_AGE = 10.0
+
+# Bytes of a child's stderr kept for error messages; what came before is dropped
+STDERR_LIMIT = 64 * 1024
+
+# Bytes read from a pipe at a time
+READ_SIZE = 64 * 1024
+
+# Children this process is running, for telling them apart from orphans
+_children: "weakref.WeakSet[Any]" = weakref.WeakSet()
+_children_lock = threading.Lock()
+
+# Told about each child the request running in this thread or task starts
+_child_watcher: ContextVar[Optional[Callable[[Any], None]]] = ContextVar(
+    "claude_code_child_watcher", default=None
+)
+
+
+def child_env(env: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Environment for a claude-code child, marked so its orphans can be found"""
+    return {**(env if env is not None else os.environ), MARKER_ENV: str(os.getpid())}
+
+
+def track_child(process: Any) -> None:
+    """Remember a running child (subprocess.Popen or asyncio Process)"""
+    with _children_lock:
+        _children.add(process)
+    claim_child(process)
+
+
+def claim_child(process: Any) -> None:
+    """Report a child running for the request in this thread or task to its watcher, if any"""
+    watcher = _child_watcher.get()
+    if watcher is not None:
+        watcher(process)
+
+
+@contextmanager
+def watch_children(watcher: Callable[[Any], None]) -> Iterator[None]:
+    """Report the children started in this thread or task to ``watcher`` until the block ends"""
+    previous = _child_watcher.get()
+    _child_watcher.set(watcher)
+    try:
+        yield
+    finally:
+        # Not reset(): a generator may be resumed from another thread's context
+        _child_watcher.set(previous)
+
+
+class TailBuffer:
+    """The last ``limit`` bytes written to it, like a ring buffer over a child's stderr"""
+
+    def __init__(self, limit: int = STDERR_LIMIT):
+        self.limit = limit
+        self._chunks: Deque[bytes] = collections.deque()
+        self._size = 0
+
+    def write(self, data: bytes) -> None:
+        self._chunks.append(data)
+        self._size += len(data)
+        # Drop whole chunks while the rest still holds the last `limit` bytes
+        while len(self._chunks) > 1 and self._size - len(self._chunks[0]) >= self.limit:
+            self._size -= len(self._chunks.popleft())
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._chunks)[-self.limit :] if self.limit > 0 else b""
+
+    def decode(self) -> str:
+        return self.getvalue().decode("utf-8", errors="replace")
+
+
+class OutputLimitExceeded(subprocess.SubprocessError):
+    """Raised when a child writes more than ``max_output`` bytes to stdout"""
+
+    def __init__(self, cmd: Sequence[str], limit: int, stderr: str = ""):
+        super().__init__(f"Command wrote more than {limit} bytes to stdout")
+        self.cmd = cmd
+        self.limit = limit
+        self.stderr = stderr
+
+
+def run_process(
+    cmd: Sequence[str],
+    timeout: Optional[float] = None,
+    env: Optional[Dict[str, str]] = None,
+    grace: float = TERMINATE_GRACE,
+    max_output: Optional[int] = None,
+    stderr_limit: int = STDERR_LIMIT,
+    input: Optional[bytes] = None,
+    cwd: Optional[str] = None,
+) -> subprocess.CompletedProcess:
+    """Run a claude-code child to completion and return its text output
+
+    Like ``subprocess.run(check=True)``, but the child leads its own process group and the
+    whole group is terminated if the timeout passes or the caller is interrupted. ``input``
+    is written to stdin while the output is read, so neither side blocks on a full pipe.
+    stdout is read into a single buffer and decoded once; only the last ``stderr_limit``
+    bytes of stderr are kept.
+
+    Raises:
+        subprocess.CalledProcessError: the child exited with a non-zero status
+        subprocess.TimeoutExpired: the child ran longer than ``timeout``
+        OutputLimitExceeded: the child wrote more than ``max_output`` bytes to stdout
+    """
+    with subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=child_env(env),
+        cwd=cwd,
+        start_new_session=True,
+    ) as process:
+        track_child(process)
+        try:
+            output, error_output = _capture(process, timeout, max_output, stderr_limit, input)
+        except BaseException:
+            terminate_process(process, grace)
+            raise
+
+    stdout = output.decode("utf-8", errors="replace")
+    stderr = error_output.decode("utf-8", errors="replace")
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def _capture(
+    process: subprocess.Popen,
+    timeout: Optional[float],
+    max_output: Optional[int],
+    stderr_limit: int,
+    input: Optional[bytes] = None,
+) -> Tuple[bytearray, bytes]:
+    """Feed a child its stdin and read its stdout and stderr as they are written until it exits"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    stdout = bytearray()
+    stderr = TailBuffer(stderr_limit)
+
+    with selectors.DefaultSelector() as selector:
+        if process.stdin is not None:
+            if input:
+                os.set_blocking(process.stdin.fileno(), False)
+                selector.register(process.stdin, selectors.EVENT_WRITE, memoryview(input))
+            else:
+                process.stdin.close()
+        selector.register(process.stdout, selectors.EVENT_READ, stdout.extend)
+        selector.register(process.stderr, selectors.EVENT_READ, stderr.write)
+        while selector.get_map():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise subprocess.TimeoutExpired(process.args, timeout)
+
+            for key, _ in selector.select(remaining):
+                if key.fileobj is process.stdin:
+                    _write_input(selector, key)
+                    continue
+
+                data = os.read(key.fd, READ_SIZE)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                key.data(data)
+
+            if max_output is not None and len(stdout) > max_output:
+                raise OutputLimitExceeded(process.args, max_output, stderr.decode())
+
+    # Both pipes are closed, so the child is exiting
+    remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+    process.wait(timeout=remaining)
+    return stdout, stderr.getvalue()
+
+
+def _write_input(selector: selectors.BaseSelector, key: selectors.SelectorKey) -> None:
+    """Write what the child's stdin pipe takes of the pending input, closing it at the end"""
+    pending = key.data
+    try:
+        pending = pending[os.write(key.fd, pending[:READ_SIZE]) :]
+    except BlockingIOError:
+        return
+    except BrokenPipeError:
+        # The child stopped reading; its exit status and output tell what went wrong
+        pending = pending[len(pending) :]
+
+    if pending:
+        selector.modify(key.fileobj, selectors.EVENT_WRITE, pending)
+    else:
+        selector.unregister(key.fileobj)
+        key.fileobj.close()
+
+
+async def acapture(
+    process: asyncio.subprocess.Process,
+    cmd: Sequence[str],
+    max_output: Optional[int] = None,
+    stderr_limit: int = STDERR_LIMIT,
+    input: Optional[bytes] = None,
+) -> Tuple[bytearray, bytes]:
+    """Async counterpart of run_process's capture: feed a child its input and read its
+    output until it exits
+
+    Raises:
+        OutputLimitExceeded: the child wrote more than ``max_output`` bytes to stdout
+    """
+    stdout = bytearray()
+    stderr = TailBuffer(stderr_limit)
+    stderr_task = asyncio.ensure_future(adrain(process.stderr, stderr))
+    input_task = None if input is None else asyncio.ensure_future(afeed(process.stdin, input))
+    try:
+        while True:
+            data = await process.stdout.read(READ_SIZE)
+            if not data:
+                break
+            stdout.extend(data)
+            if max_output is not None and len(stdout) > max_output:
+                raise OutputLimitExceeded(cmd, max_output, stderr.decode())
+
+        await stderr_task
+        await process.wait()
+    finally:
+        stderr_task.cancel()
+        if input_task is not None:
+            input_task.cancel()
+    return stdout, stderr.getvalue()
+
+
+def feed(stream: IO[bytes], data: bytes) -> None:
+    """Write ``data`` to a child's stdin and close it, for a thread next to the reader"""
+    try:
+        stream.write(data)
+        stream.close()
+    except (BrokenPipeError, ValueError):
+        # The child exited, or was terminated and its pipes closed, before reading it all
+        pass
+
+
+async def afeed(stream: asyncio.StreamWriter, data: bytes) -> None:
+    """Async counterpart of feed"""
+    try:
+        stream.write(data)
+        await stream.drain()
+        stream.close()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+
+
+def drain(stream: IO[bytes], buffer: TailBuffer) -> None:
+    """Read a pipe to its end into ``buffer``, so the child never blocks on it"""
+    while True:
+        data = stream.read(READ_SIZE)
+        if not data:
+            return
+        buffer.write(data)
+
+
+async def adrain(stream: asyncio.StreamReader, buffer: TailBuffer) -> None:
+    """Async counterpart of drain"""
+    while True:
+        data = await stream.read(READ_SIZE)
+        if not data:
+            return
+        buffer.write(data)
+
+
+def terminate_process(process: subprocess.Popen, grace: float = TERMINATE_GRACE) -> None:
+    """SIGTERM a child's process group, then SIGKILL it if it outlives ``grace`` seconds"""
+    if process.poll() is None:
+        _signal_group(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"claude-code process {process.pid} ignored SIGTERM; killing it")
+    # Also clears out anything the child spawned that is still running
+    _signal_group(process.pid, signal.SIGKILL)
+    process.wait()
+
+
+async def aterminate_process(
+    process: asyncio.subprocess.Process, grace: float = TERMINATE_GRACE
+) -> None:
+    """Async counterpart of terminate_process"""
+    if process.returncode is None:
+        _signal_group(process.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=grace)
+        except asyncio.TimeoutError:
+            logger.warning(f"claude-code process {process.pid} ignored SIGTERM; killing it")
+    _signal_group(process.pid, signal.SIGKILL)
+    await process.wait()
+    if process.stdin is not None:
+        # Left open, the pipe is closed by the garbage collector, possibly after its loop closed
+        process.stdin.close()
+
+
+def interrupt_child(process: Any) -> None:
+    """SIGTERM a running child's process group without waiting; whoever runs it sees it fail"""
+    # An exited child that hasn't been waited for keeps its pid, so it can't be reused yet
+    if process.returncode is None:
+        _signal_group(process.pid, signal.SIGTERM)
+
+
+def _signal_group(pid: int, sig: int) -> None:
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _live_children() -> Set[int]:
+    with _children_lock:
+        return {p.pid for p in _children if p.returncode is None}
+
+
+def _read_processes() -> Dict[int, Tuple[int, float, Optional[str]]]:
+    """pid -> (parent pid, age in seconds, MARKER_ENV value) for processes we can inspect"""
+    clock_ticks = os.sysconf("SC_CLK_TCK")
+    with open("/proc/uptime") as f:
+        uptime = float(f.read().split()[0])
+
+    processes = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            with open(f"/proc/{entry}/environ", "rb") as f:
+                environ = f.read().split(b"\0")
+        except OSError:
+            # Exited, or owned by another user
+            continue
+
+        # The command name may contain spaces, so split after its closing parenthesis
+        fields = stat.rsplit(")", 1)[1].split()
+        age = uptime - int(fields[19]) / clock_ticks
+        prefix = f"{MARKER_ENV}=".encode("utf-8")
+        marker = next((v[len(prefix) :].decode() for v in environ if v.startswith(prefix)), None)
+        processes[int(entry)] = (int(fields[1]), age, marker)
+    return processes
+
+
+def find_orphans() -> List[int]:
+    """Marked claude-code processes that no live proxy is managing
+
+    That is a process whose proxy has exited, or one of ours that is neither a child we
+    are running nor spawned by one (a grandchild left behind when its parent was killed).
+    """
+    processes = _read_processes()
+    own_pid = os.getpid()
+    live = _live_children()
+
+    orphans = []
+    for pid, (ppid, age, marker) in processes.items():
+        if marker is None or pid == own_pid or age < MIN_ORPHAN_AGE:
+            continue
+        if marker != str(own_pid):
+            if not marker.isdigit() or int(marker) not in processes:
+                orphans.append(pid)
+            continue
+
+        ancestor: Optional[int] = pid
+        while ancestor is not None and ancestor not in live:
+            parent = processes.get(ancestor, (None,))[0]
+            ancestor = parent if parent not in (None, 0, ancestor) else None
+        if ancestor is None:
+            orphans.append(pid)
+    return orphans
+
+
+def reap_orphans(grace: float = TERMINATE_GRACE) -> int:
+    """SIGTERM orphaned claude-code processes, then SIGKILL the ones still running"""
+    orphans = find_orphans()
+    if not orphans:
+        return 0
+
+    logger.warning(f"Terminating {len(orphans)} orphaned claude-code processes: {orphans}")
+    for pid in orphans:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    deadline = time.monotonic() + grace
+    remaining = set(orphans)
+    while remaining and time.monotonic() < deadline:
+        time.sleep(0.1)
+        remaining = {pid for pid in remaining if os.path.exists(f"/proc/{pid}")}
+
+    for pid in remaining:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    return len(orphans)
+
+
+class OrphanReaper:
+    """Kill orphaned claude-code processes at startup and then every ``interval`` seconds"""
+
+    def __init__(self, interval: float, grace: float = TERMINATE_GRACE):
+        self.interval = interval
+        self.grace = grace
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["OrphanReaper"]:
+        """Start a reaper unless CLAUDE_CODE_REAPER_INTERVAL is 0 or /proc is unavailable"""
+        interval = get_env_float("CLAUDE_CODE_REAPER_INTERVAL", 60.0)
+        if not interval or interval <= 0 or not os.path.isdir("/proc/self"):
+            return None
+
+        reaper = cls(interval, grace=get_env_float("CLAUDE_CODE_TERMINATE_GRACE", TERMINATE_GRACE))
+        reaper.start()
+        return reaper
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                reap_orphans(self.grace)
+            except Exception as e:
+                logger.error(f"Failed to reap orphaned claude-code processes: {e}")
+            self._stopped.wait(self.interval)
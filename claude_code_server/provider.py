@@ -1,53 +1,188 @@
+import asyncio
+import errno
+import hashlib
+import itertools
+import json
 import logging
+import os
 import subprocess
+import tempfile
+import threading
+import time
 import uuid
+from contextlib import ExitStack, asynccontextmanager, contextmanager
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NoReturn,
+    Optional,
+    Tuple,
+)
 
+import httpx
+import litellm
 from litellm import Choices, CustomLLM, Message, ModelResponse
+from litellm.types.utils import GenericStreamingChunk
+
+from claude_code_server.admission import (
+    INTERACTIVE,
+    PRIORITIES,
+    AdmissionController,
+    AdmissionRejectedError,
+    Ticket,
+    parse_priority,
+)
+from claude_code_server.batch import BatchServer
+from claude_code_server.breaker import CircuitBreaker
+from claude_code_server.cache import (
+    CacheDirectives,
+    ResponseCache,
+    make_cache_key,
+    parse_cache_control,
+)
+from claude_code_server.config import get_env_float, get_env_int
+from claude_code_server.credentials import CredentialPool
+from claude_code_server.errors import (
+    AUTH,
+    DEADLINE,
+    INVALID_REQUEST,
+    OUTPUT_LIMIT,
+    ClaudeCodeError,
+    RetryPolicy,
+    classify_message,
+)
+from claude_code_server.executable import ClaudeExecutable
+from claude_code_server.metrics import MetricsServer, ProviderMetrics, RequestTrace
+from claude_code_server.models import PROVIDER_PREFIX, ModelOptions, ModelRegistry, model_name
+from claude_code_server.pool import WorkerPool
+from claude_code_server.process import (
+    STDERR_LIMIT,
+    TERMINATE_GRACE,
+    OrphanReaper,
+    OutputLimitExceeded,
+    TailBuffer,
+    acapture,
+    adrain,
+    afeed,
+    aterminate_process,
+    child_env,
+    claim_child,
+    drain,
+    feed,
+    run_process,
+    terminate_process,
+    track_child,
+    watch_children,
+)
+from claude_code_server.sessions import (
+    SYSTEM_ROLES,
+    ConversationTurn,
+    SessionIndex,
+    message_text,
+    render_tool_results,
+    render_transcript,
+    session_key,
+)
+from claude_code_server.singleflight import SingleFlight
+from claude_code_server.store import store_from_env
+from claude_code_server.structured import OutputFormat
+from claude_code_server.workspace import (
+    Attachment,
+    WorkspacePool,
+    attachment_note,
+    parse_attachment,
+)
 
 logger = logging.getLogger(__name__)
 
+# Incremental JSON events, one per line, including partial text deltas
+STREAM_JSON_ARGS = ["--output-format", "stream-json", "--verbose", "--include-partial-messages"]
+
+# One JSON document with the answer, usage, cost and session once the run is over
+JSON_OUTPUT_ARGS = ["--output-format", "json"]
+
+# Result event fields surfaced through hidden params
+RESULT_DETAILS = ("total_cost_usd", "duration_ms", "duration_api_ms", "num_turns", "session_id")
+
+# Request header a client sets to lower the priority class of its request
+PRIORITY_HEADER = "x-claude-code-priority"
+
+# A single stream-json line can carry a whole assistant message or tool result
+STREAM_LINE_LIMIT = 32 * 1024 * 1024
+
+# Bytes of answer text returned at most; the rest is cut off with finish_reason "length"
+MAX_OUTPUT_BYTES = 4 * 1024 * 1024
+
+# Room for the JSON output's escaping and envelope around an answer of MAX_OUTPUT_BYTES
+JSON_OUTPUT_OVERHEAD = 1024 * 1024
+
+# Bytes of system prompt passed as an argument; longer ones go through a file, as Linux
+# refuses any single argument over 128 KiB
+SYSTEM_PROMPT_ARG_LIMIT = 32 * 1024
+
+# Characters of a prompt (or any other long argument) written to the debug log
+LOGGED_PROMPT_CHARS = 200
+
 
 class ClaudeCodeProvider(CustomLLM):
     """Custom LiteLLM provider for claude-code CLI"""
 
     def __init__(self):
         super().__init__()
+        self._default_timeout = get_env_float("CLAUDE_CODE_TIMEOUT", None)
+        self._terminate_grace = get_env_float("CLAUDE_CODE_TERMINATE_GRACE", TERMINATE_GRACE)
+        self._max_output = get_env_int("CLAUDE_CODE_MAX_OUTPUT_BYTES", MAX_OUTPUT_BYTES) or None
+        self._stderr_limit = get_env_int("CLAUDE_CODE_STDERR_LIMIT", STDERR_LIMIT)
+        self._credentials = CredentialPool.from_env()
+        self._workspaces = WorkspacePool.from_env()
+        self._claude = ClaudeExecutable.from_env(self._credential_envs())
+        self._pool = WorkerPool.from_env(self._build_pool_command, stream_limit=STREAM_LINE_LIMIT)
+        if self._pool is not None and self._credentials is not None:
+            # Warm workers are spawned before a request picks its credential profile
+            logger.warning("CLAUDE_CODE_POOL_SIZE is ignored when credential profiles are set")
+            self._pool = None
+        self._models = ModelRegistry()
+        self._store = store_from_env()
+        self._admission = AdmissionController.from_env(self._store)
+        self._cache = ResponseCache.from_env(self._store)
+        # Rejected, preempted or timed out: followers run on their own instead
+        self._flights = SingleFlight.from_env(
+            private_errors=(AdmissionRejectedError, litellm.Timeout)
+        )
+        self._sessions = SessionIndex.from_env(self._store)
+        self._retry = RetryPolicy.from_env()
+        self._breaker = CircuitBreaker.from_env()
+        self._metrics = ProviderMetrics(self._store)
+        if self._pool is not None:
+            self._metrics.track_pool(lambda: self._pool.idle_count)
+        if self._breaker is not None:
+            self._metrics.track_breaker(lambda: float(self._breaker.is_open))
+        self._metrics_server = MetricsServer.from_env(self._metrics.registry, health=self._health)
+        self._batch_server = BatchServer.from_env(self.completion, self._models)
+        self._reaper = OrphanReaper.from_env()
 
     def completion(self, model: str, messages: List[Dict[str, Any]], **kwargs) -> ModelResponse:
         """Handle completion requests by calling claude-code CLI"""
         logger.info(f"ClaudeCodeProvider.completion called with model: {model}")
 
-        # Extract the last user message
-        user_messages = [m for m in messages if m.get("role") == "user"]
-        if not user_messages:
-            raise ValueError("No user messages found")
+        self._split_conversation(messages)
 
-        prompt = user_messages[-1].get("content", "")
+        request_key = self._get_request_key(model, messages, kwargs)
+        cached = self._cache_get(request_key, kwargs)
+        if cached is not None:
+            return self._build_model_response(model, cached)
 
-        # Execute claude command
+        # Execute claude command, once for all identical requests in flight
         try:
-            result = self._execute_claude_code(prompt)
-
-            # Create response in LiteLLM format
-            response_message = Message(content=result, role="assistant")
-            response_choice = Choices(index=0, message=response_message, finish_reason="stop")
-
-            model_response = ModelResponse(
-                id=str(uuid.uuid4()),
-                choices=[response_choice],
-                model="claude-code-server/claude-code",  # Use actual provider model name
-                object="chat.completion",
-                created=int(datetime.now().timestamp()),
-                usage={
-                    "prompt_tokens": len(prompt.split()),
-                    "completion_tokens": len(result.split()),
-                    "total_tokens": len(prompt.split()) + len(result.split()),
-                },
+            outcome = self._share(
+                request_key, kwargs, lambda: self._complete(model, messages, request_key, kwargs)
             )
-
-            return model_response
+            return self._build_model_response(model, outcome)
 
         except Exception as e:
             logger.error(f"Error executing claude-code: {e}")
@@ -57,70 +192,1426 @@ class ClaudeCodeProvider(CustomLLM):
         self, model: str, messages: List[Dict[str, Any]], **kwargs
     ) -> ModelResponse:
         """Handle async completion requests by calling claude-code CLI"""
-        import asyncio
-
         logger.info(f"ClaudeCodeProvider.acompletion called with model: {model}")
 
-        # Define a wrapper function that accepts the correct arguments
-        def completion_wrapper():
-            return self.completion(model, messages, **kwargs)
+        self._split_conversation(messages)
+
+        request_key = self._get_request_key(model, messages, kwargs)
+        cached = self._cache_get(request_key, kwargs)
+        if cached is not None:
+            return self._build_model_response(model, cached)
+
+        # Execute claude command without blocking a thread for the lifetime of the child
+        try:
+            outcome = await self._ashare(
+                request_key, kwargs, lambda: self._acomplete(model, messages, request_key, kwargs)
+            )
+            return self._build_model_response(model, outcome)
+
+        except Exception as e:
+            logger.error(f"Error executing claude-code: {e}")
+            raise
+
+    def streaming(
+        self, model: str, messages: List[Dict[str, Any]], **kwargs
+    ) -> Iterator[GenericStreamingChunk]:
+        """Handle streaming requests by reading claude-code stream-json events as they arrive"""
+        logger.info(f"ClaudeCodeProvider.streaming called with model: {model}")
+
+        self._split_conversation(messages)
+
+        request_key = self._get_request_key(model, messages, kwargs)
+        cached = self._cache_get(request_key, kwargs)
+        if cached is not None:
+            items: Iterator[Any] = iter([cached])
+        else:
+            items = self._share_stream(
+                request_key, kwargs, lambda: self._stream(model, messages, request_key, kwargs)
+            )
+
+        try:
+            streamed = False
+            for item in items:
+                if isinstance(item, str):
+                    streamed = True
+                    yield self._build_text_chunk(item)
+                else:
+                    yield from self._build_closing_chunks(item, streamed)
+
+        except Exception as e:
+            logger.error(f"Error executing claude-code: {e}")
+            raise
+
+    async def astreaming(
+        self, model: str, messages: List[Dict[str, Any]], **kwargs
+    ) -> AsyncIterator[GenericStreamingChunk]:
+        """Handle async streaming requests by reading claude-code stream-json events as they arrive"""
+        logger.info(f"ClaudeCodeProvider.astreaming called with model: {model}")
+
+        self._split_conversation(messages)
+
+        request_key = self._get_request_key(model, messages, kwargs)
+        cached = self._cache_get(request_key, kwargs)
+        if cached is not None:
+            for chunk in self._build_closing_chunks(cached, streamed=False):
+                yield chunk
+            return
+
+        try:
+            streamed = False
+            items = self._ashare_stream(
+                request_key, kwargs, lambda: self._astream(model, messages, request_key, kwargs)
+            )
+            async for item in items:
+                if isinstance(item, str):
+                    streamed = True
+                    yield self._build_text_chunk(item)
+                else:
+                    for chunk in self._build_closing_chunks(item, streamed):
+                        yield chunk
+
+        except Exception as e:
+            logger.error(f"Error executing claude-code: {e}")
+            raise
+
+    def _complete(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        request_key: Optional[str],
+        kwargs: Dict[str, Any],
+    ) -> Dict:
+        """Run claude-code for a completion and return its outcome (content and usage)"""
+        turn = self._start_turn(model, messages, kwargs)
+        deadline = self._get_deadline(kwargs)
+        with self._trace(model, kwargs) as trace, self._admit(kwargs, trace) as ticket:
+            with self._lease(turn) as turn:
+                for attempt in itertools.count():
+                    timeout = self._time_left(deadline)
+                    try:
+                        with (
+                            self._guard(kwargs),
+                            self._preemptible(ticket),
+                            self._command_line_limit(),
+                        ):
+                            result_event = self._execute_claude_code(turn, trace, timeout)
+                        break
+                    except RuntimeError as e:
+                        turn, delay = self._retry_turn(
+                            e, turn, attempt, deadline, trace, model, messages, kwargs
+                        )
+                        time.sleep(delay)
+
+        budget = self._output_budget(kwargs)
+        content = budget.take(result_event["result"])
+        trace.finished(content)
+        outcome = self._finish(
+            turn.prompt, content, result_event, request_key, kwargs, budget.exhausted
+        )
+        self._remember_session(model, messages, turn, outcome["content"], kwargs)
+        return outcome
+
+    async def _acomplete(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        request_key: Optional[str],
+        kwargs: Dict[str, Any],
+    ) -> Dict:
+        """Run claude-code for an async completion and return its outcome"""
+        turn = self._start_turn(model, messages, kwargs)
+        deadline = self._get_deadline(kwargs)
+        with self._trace(model, kwargs) as trace:
+            async with self._aadmit(kwargs, trace) as ticket, self._alease(turn) as turn:
+                for attempt in itertools.count():
+                    timeout = self._time_left(deadline)
+                    try:
+                        with (
+                            self._guard(kwargs),
+                            self._preemptible(ticket),
+                            self._command_line_limit(),
+                        ):
+                            result_event = await self._aexecute_claude_code(turn, trace, timeout)
+                        break
+                    except RuntimeError as e:
+                        turn, delay = self._retry_turn(
+                            e, turn, attempt, deadline, trace, model, messages, kwargs
+                        )
+                        await asyncio.sleep(delay)
+
+        budget = self._output_budget(kwargs)
+        content = budget.take(result_event["result"])
+        trace.finished(content)
+        outcome = self._finish(
+            turn.prompt, content, result_event, request_key, kwargs, budget.exhausted
+        )
+        self._remember_session(model, messages, turn, outcome["content"], kwargs)
+        return outcome
+
+    def _stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        request_key: Optional[str],
+        kwargs: Dict[str, Any],
+    ) -> Iterator[Any]:
+        """Run claude-code for a stream: yield text deltas, then the outcome"""
+        turn = self._start_turn(model, messages, kwargs)
+        deadline = self._get_deadline(kwargs)
+        parser = self._stream_parser(kwargs)
+        with self._trace(model, kwargs) as trace, self._admit(kwargs, trace) as ticket:
+            with self._lease(turn) as turn:
+                for attempt in itertools.count():
+                    timeout = self._time_left(deadline)
+                    try:
+                        with (
+                            self._guard(kwargs),
+                            self._preemptible(ticket),
+                            self._command_line_limit(),
+                        ):
+                            yield from self._stream_claude_code(turn, parser, trace, timeout)
+                        break
+                    except RuntimeError as e:
+                        if parser.text:
+                            # Part of the answer already reached the client
+                            raise
+                        turn, delay = self._retry_turn(
+                            e, turn, attempt, deadline, trace, model, messages, kwargs
+                        )
+                        parser = self._stream_parser(kwargs)
+                        time.sleep(delay)
+
+        trace.finished(parser.text)
+        outcome = self._finish(
+            turn.prompt, parser.text, parser.result, request_key, kwargs, parser.truncated
+        )
+        self._remember_session(model, messages, turn, outcome["content"], kwargs)
+        yield outcome
+
+    async def _astream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        request_key: Optional[str],
+        kwargs: Dict[str, Any],
+    ) -> AsyncIterator[Any]:
+        """Run claude-code for an async stream: yield text deltas, then the outcome"""
+        turn = self._start_turn(model, messages, kwargs)
+        deadline = self._get_deadline(kwargs)
+        parser = self._stream_parser(kwargs)
+        with self._trace(model, kwargs) as trace:
+            async with self._aadmit(kwargs, trace) as ticket, self._alease(turn) as turn:
+                for attempt in itertools.count():
+                    timeout = self._time_left(deadline)
+                    try:
+                        with (
+                            self._guard(kwargs),
+                            self._preemptible(ticket),
+                            self._command_line_limit(),
+                        ):
+                            stream = self._astream_claude_code(turn, parser, trace, timeout)
+                            async for text in stream:
+                                yield text
+                        break
+                    except RuntimeError as e:
+                        if parser.text:
+                            # Part of the answer already reached the client
+                            raise
+                        turn, delay = self._retry_turn(
+                            e, turn, attempt, deadline, trace, model, messages, kwargs
+                        )
+                        parser = self._stream_parser(kwargs)
+                        await asyncio.sleep(delay)
+
+        trace.finished(parser.text)
+        outcome = self._finish(
+            turn.prompt, parser.text, parser.result, request_key, kwargs, parser.truncated
+        )
+        self._remember_session(model, messages, turn, outcome["content"], kwargs)
+        yield outcome
+
+    def _finish(
+        self,
+        prompt: str,
+        content: Optional[str],
+        result_event: Optional[Dict[str, Any]],
+        request_key: Optional[str],
+        kwargs: Dict[str, Any],
+        truncated: bool = False,
+    ) -> Dict[str, Any]:
+        """Package a finished execution as an outcome and store it in the cache
+
+        The outcome carries the content, the usage, the finish reason and, under ``details``,
+        what the CLI reported about the run (cost, duration, turns). Details aren't cached: a
+        cache hit costs nothing. A request for JSON or function calls takes its content and
+        ``tool_calls`` from the structured output instead of the answer text.
+
+        Raises:
+            ClaudeCodeError: the structured output doesn't match what the request asked for
+        """
+        output_format = self._get_output_format(kwargs)
+        tool_calls: List[Dict[str, Any]] = []
+        if output_format is not None:
+            content, tool_calls = output_format.parse(result_event or {})
+            truncated = False
+
+        outcome = {
+            "content": content,
+            "usage": self._build_usage(prompt, content or "", result_event),
+            "finish_reason": "tool_calls" if tool_calls else "length" if truncated else "stop",
+        }
+        if tool_calls:
+            outcome["tool_calls"] = tool_calls
+        self._cache_set(request_key, kwargs, outcome)
+        return {**outcome, "details": self._build_details(result_event)}
+
+    def _split_conversation(
+        self, messages: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Split OpenAI format messages into the history and the newest user message
+
+        A conversation ending in ``tool`` messages carries the results of the functions the
+        last answer called; they become the newest message.
+        """
+        user_indexes = [i for i, m in enumerate(messages) if m.get("role") == "user"]
+        if not user_indexes:
+            raise ValueError("No user messages found")
+
+        start = len(messages)
+        while messages[start - 1].get("role") == "tool":
+            start -= 1
+        if start < len(messages):
+            return messages[:start], {
+                "role": "user",
+                "content": render_tool_results(messages[start:]),
+            }
+        return messages[: user_indexes[-1]], messages[user_indexes[-1]]
+
+    def _start_turn(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        kwargs: Dict[str, Any],
+        resume: bool = True,
+    ) -> ConversationTurn:
+        """Decide how to send the newest user message to claude-code
+
+        A conversation whose history is held by a known session resumes it with just the
+        new message; otherwise the history is inlined into the prompt.
+        """
+        output_format = self._get_output_format(kwargs)
+        model_args = tuple(self._get_model_options(model, kwargs).args)
+        if output_format is not None:
+            model_args += tuple(output_format.args)
+        history, message = self._split_conversation(messages)
+        system_parts = [
+            message_text(m.get("content")) for m in history if m.get("role") in SYSTEM_ROLES
+        ]
+        if output_format is not None and output_format.instructions:
+            system_parts.append(output_format.instructions)
+        system_prompt = "\n\n".join(system_parts)
+        turns = [m for m in history if m.get("role") not in SYSTEM_ROLES]
+        prompt = (
+            render_transcript(turns, message) if turns else message_text(message.get("content"))
+        )
+        attachments = self._get_attachments(messages)
+        note = f"\n\n{attachment_note(list(attachments))}" if attachments else ""
+
+        if self._sessions is None:
+            return ConversationTurn(
+                prompt + note, system_prompt or None, model_args=model_args, attachments=attachments
+            )
+
+        if resume and turns:
+            key = session_key(model, self._get_admission_key(kwargs), history)
+            session = self._sessions.claim(key)
+            if session is not None:
+                logger.info(f"Resuming claude-code session {session.session_id}")
+                return ConversationTurn(
+                    message_text(message.get("content")) + note,
+                    system_prompt or None,
+                    session.session_id,
+                    resume=True,
+                    profile=session.profile,
+                    model_args=model_args,
+                    workspace=session.workspace,
+                    attachments=attachments,
+                )
+
+        return ConversationTurn(
+            prompt + note,
+            system_prompt or None,
+            str(uuid.uuid4()),
+            model_args=model_args,
+            attachments=attachments,
+        )
+
+    def _remember_session(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        turn: ConversationTurn,
+        result: Optional[str],
+        kwargs: Dict[str, Any],
+    ) -> None:
+        """Index the session under the conversation as the client will send it next time"""
+        if self._sessions is None or turn.session_id is None:
+            return
+
+        history, message = self._split_conversation(messages)
+        conversation = [*history, message, {"role": "assistant", "content": result}]
+        key = session_key(model, self._get_admission_key(kwargs), conversation)
+        self._sessions.put(key, turn.session_id, turn.profile, turn.workspace)
+
+    def _restart_turn(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        kwargs: Dict[str, Any],
+        turn: ConversationTurn,
+    ) -> ConversationTurn:
+        """Start a fresh session for a turn whose session was lost, under the same profile and
+        in the same workspace"""
+        return self._start_turn(model, messages, kwargs, resume=False)._replace(
+            profile=turn.profile,
+            workspace=turn.workspace,
+            system_prompt_file=turn.system_prompt_file,
+        )
+
+    def _retry_turn(
+        self,
+        error: RuntimeError,
+        turn: ConversationTurn,
+        attempt: int,
+        deadline: Optional[float],
+        trace: RequestTrace,
+        model: str,
+        messages: List[Dict[str, Any]],
+        kwargs: Dict[str, Any],
+    ) -> Tuple[ConversationTurn, float]:
+        """Decide how to run a failed execution again, and after how many seconds
+
+        A lost session is restarted right away; a transient failure is retried with backoff.
+
+        Raises:
+            RuntimeError: ``error``, if the execution shouldn't be run again
+        """
+        if self._is_missing_session(turn, error):
+            return self._restart_turn(model, messages, kwargs, turn), 0.0
 
-        # Use asyncio.run_in_executor to run the synchronous completion method
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, completion_wrapper)
+        time_left = None if deadline is None else deadline - time.monotonic()
+        delay = self._retry.delay(error, attempt, time_left)
+        if delay is None:
+            raise error
 
-    async def astreaming(self, model: str, messages: List[Dict[str, Any]], **kwargs):
-        """Handle async streaming requests"""
-        # Get the response asynchronously
-        response = await self.acompletion(model, messages, **kwargs)
+        logger.warning(f"Retrying claude-code in {delay:.2f} seconds after: {error}")
+        trace.retried()
+        return turn, delay
 
-        # Create streaming chunks - split content into words for demonstration
-        content = response.choices[0].message.content
+    def _is_missing_session(self, turn: ConversationTurn, error: Exception) -> bool:
+        """Whether a resumed session no longer exists, so the turn must start afresh"""
+        return turn.resume and "No conversation found" in str(error)
 
-        # Since claude-code doesn't support streaming, return the full response as one chunk
-        # Return raw dict format that LiteLLM expects
-        chunk = {
-            "text": content,
+    def _build_model_response(self, model: str, outcome: Dict[str, Any]) -> ModelResponse:
+        """Create response in LiteLLM format"""
+        response_message = Message(
+            content=outcome["content"], role="assistant", tool_calls=outcome.get("tool_calls")
+        )
+        response_choice = Choices(
+            index=0, message=response_message, finish_reason=outcome.get("finish_reason", "stop")
+        )
+
+        response = ModelResponse(
+            id=str(uuid.uuid4()),
+            choices=[response_choice],
+            model=PROVIDER_PREFIX + model_name(model),
+            object="chat.completion",
+            created=int(datetime.now().timestamp()),
+            usage=outcome["usage"],
+        )
+
+        details = outcome.get("details")
+        if details:
+            response._hidden_params["claude_code"] = details
+        if details and details.get("total_cost_usd") is not None:
+            # LiteLLM uses a provider-reported cost instead of its own pricing table
+            response._hidden_params["additional_headers"] = {
+                "llm_provider-x-litellm-response-cost": details["total_cost_usd"]
+            }
+        return response
+
+    def _build_usage(
+        self, prompt: str, content: str, result_event: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Token usage reported by the CLI, or a local estimate if it reported none"""
+        usage = (result_event or {}).get("usage")
+        if not usage:
+            return self._estimate_usage(prompt, content)
+
+        input_tokens = usage.get("input_tokens") or 0
+        cache_read = usage.get("cache_read_input_tokens") or 0
+        cache_creation = usage.get("cache_creation_input_tokens") or 0
+        output_tokens = usage.get("output_tokens") or 0
+
+        # OpenAI counts cached input as part of the prompt
+        prompt_tokens = input_tokens + cache_read + cache_creation
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": output_tokens,
+            "total_tokens": prompt_tokens + output_tokens,
+            "prompt_tokens_details": {"cached_tokens": cache_read},
+            "cache_read_input_tokens": cache_read,
+            "cache_creation_input_tokens": cache_creation,
+        }
+
+    def _build_details(self, result_event: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Run statistics from the CLI result event, exposed through hidden params"""
+        return {key: result_event[key] for key in RESULT_DETAILS if key in (result_event or {})}
+
+    def _estimate_usage(self, prompt: str, result: str) -> Dict[str, int]:
+        """Estimate token usage from prompt and result text with a local tokenizer"""
+        prompt_tokens = litellm.token_counter(text=prompt) if prompt else 0
+        completion_tokens = litellm.token_counter(text=result) if result else 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    def _build_text_chunk(self, text: str) -> GenericStreamingChunk:
+        """Create an intermediate streaming chunk carrying a text delta"""
+        return {
+            "text": text,
+            "is_finished": False,
+            "finish_reason": "",
+            "usage": None,
+            "index": 0,
+        }
+
+    def _build_tool_call_chunk(
+        self, tool_call: Dict[str, Any], index: int
+    ) -> GenericStreamingChunk:
+        """Create an intermediate streaming chunk carrying one function call"""
+        return {**self._build_text_chunk(""), "tool_use": {**tool_call, "index": index}}
+
+    def _build_final_chunk(
+        self,
+        usage: Dict[str, Any],
+        details: Optional[Dict[str, Any]] = None,
+        finish_reason: str = "stop",
+    ) -> GenericStreamingChunk:
+        """Create the closing streaming chunk carrying finish reason and usage"""
+        chunk: GenericStreamingChunk = {
+            "text": "",
             "is_finished": True,
-            "finish_reason": "stop",
-            "usage": {
-                "prompt_tokens": response.usage.get("prompt_tokens", 0),
-                "completion_tokens": response.usage.get("completion_tokens", 0),
-                "total_tokens": response.usage.get("total_tokens", 0),
-            },
+            "finish_reason": finish_reason,
+            "usage": usage,  # type: ignore[typeddict-item]
+            "index": 0,
         }
-        yield chunk
+        if details:
+            chunk["provider_specific_fields"] = {"claude_code": details}
+        return chunk
+
+    def _build_closing_chunks(
+        self, outcome: Dict[str, Any], streamed: bool
+    ) -> List[GenericStreamingChunk]:
+        """Create the chunks ending a stream, with the whole text if no deltas were sent"""
+        chunks = []
+        if not streamed and outcome["content"]:
+            # Cached, shared with a non-streaming request or structured: the answer arrives in
+            # one piece
+            chunks.append(self._build_text_chunk(outcome["content"]))
+        for index, tool_call in enumerate(outcome.get("tool_calls") or []):
+            chunks.append(self._build_tool_call_chunk(tool_call, index))
+        chunks.append(
+            self._build_final_chunk(
+                outcome["usage"], outcome.get("details"), outcome.get("finish_reason", "stop")
+            )
+        )
+        return chunks
+
+    def _parse_result(self, stdout: str, stderr: str) -> Dict[str, Any]:
+        """Read the result event from --output-format json output
+
+        A CLI without JSON output support prints the answer as plain text, which becomes a
+        result event without usage.
+        """
+        result_event = _parse_json_result(stdout)
+        if result_event is None:
+            return {"result": stdout.strip()}
+        if result_event.get("is_error"):
+            self._raise_claude_code_error(self._get_error_message(stderr, stdout))
+
+        return {**result_event, "result": str(result_event.get("result") or "").strip()}
+
+    def _get_error_message(self, stderr: Optional[str], stdout: Optional[str]) -> str:
+        """Pick the most useful description of a failed claude-code execution"""
+        result_event = _parse_json_result(stdout or "") or {}
+        candidates = [stderr, result_event.get("result"), result_event.get("subtype"), stdout]
+        return next((c for c in candidates if c), "Unknown error")
+
+    def _check_stream_result(
+        self,
+        returncode: Optional[int],
+        parser: "_StreamJsonParser",
+        stderr: bytes,
+        require_result: bool = False,
+    ) -> None:
+        """Raise if a streaming claude-code execution failed
+
+        ``returncode`` is None for a warm worker that is still running after answering.
+        """
+        result_event = parser.result or {}
+        missing_result = require_result and parser.result is None
+        if returncode in (0, None) and not result_event.get("is_error") and not missing_result:
+            return
+
+        candidates = [
+            stderr.decode("utf-8", errors="replace"),
+            result_event.get("result"),
+            result_event.get("subtype"),
+            parser.text,
+        ]
+        error_msg = next((c for c in candidates if c), "Unknown error")
+        self._raise_claude_code_error(error_msg)
+
+    @contextmanager
+    def _guard(self, kwargs: Dict[str, Any]) -> Iterator[None]:
+        """Run an execution past the circuit breaker, if one is configured
+
+        A timeout the client chose says nothing about claude-code's health; it is tagged
+        DEADLINE, which the breaker ignores, so short client timeouts can't open the circuit.
+        """
+        if self._breaker is None:
+            yield
+            return
+
+        with self._breaker.guard():
+            try:
+                yield
+            except litellm.Timeout as e:
+                if self._is_client_timeout(kwargs):
+                    e.kind = DEADLINE
+                raise
+
+    @contextmanager
+    def _command_line_limit(self) -> Iterator[None]:
+        """Report a command line the OS refused as too long as an invalid request"""
+        try:
+            yield
+        except OSError as e:
+            if e.errno != errno.E2BIG:
+                raise
+            raise ClaudeCodeError(
+                "claude-code failed: the request is too large for the claude command line "
+                f"({e.strerror})",
+                INVALID_REQUEST,
+            ) from e
+
+    @contextmanager
+    def _preemptible(self, ticket: Optional[Ticket]) -> Iterator[None]:
+        """Report an execution that failed because a more urgent request preempted it
+
+        Inside the circuit breaker's guard, so preemptions aren't counted as failures.
+        """
+        try:
+            yield
+        except Exception as e:
+            if ticket is None or not ticket.preempted:
+                raise
+            raise self._admission.preempted_error() from e
+
+    @contextmanager
+    def _admit(self, kwargs: Dict[str, Any], trace: RequestTrace) -> Iterator[Optional[Ticket]]:
+        """Hold an admission slot for a request, if concurrency is limited"""
+        if self._admission is None:
+            yield None
+            return
+
+        started = time.monotonic()
+        with self._admission.slot(
+            self._get_admission_key(kwargs), self._get_timeout(kwargs), self._get_priority(kwargs)
+        ) as ticket:
+            trace.queued(time.monotonic() - started)
+            with watch_children(ticket.adopt):
+                yield ticket
+
+    @asynccontextmanager
+    async def _aadmit(
+        self, kwargs: Dict[str, Any], trace: RequestTrace
+    ) -> AsyncIterator[Optional[Ticket]]:
+        """Hold an admission slot for an async request, if concurrency is limited"""
+        if self._admission is None:
+            yield None
+            return
+
+        started = time.monotonic()
+        async with self._admission.aslot(
+            self._get_admission_key(kwargs), self._get_timeout(kwargs), self._get_priority(kwargs)
+        ) as ticket:
+            trace.queued(time.monotonic() - started)
+            with watch_children(ticket.adopt):
+                yield ticket
+
+    @contextmanager
+    def _lease(self, turn: ConversationTurn) -> Iterator[ConversationTurn]:
+        """Run a turn under a leased credential profile and in a leased workspace, where
+        several are configured
+
+        A resumed turn stays on the profile its session was created under while that
+        profile isn't cooling down, and in its workspace while that is free. Elsewhere the
+        CLI can't find the session, and the turn is restarted with the history inlined.
+        A system prompt too long for the command line is written to a file for the lease.
+        """
+        with ExitStack() as stack:
+            if len((turn.system_prompt or "").encode("utf-8")) > SYSTEM_PROMPT_ARG_LIMIT:
+                path = stack.enter_context(_system_prompt_file(turn.system_prompt))
+                turn = turn._replace(system_prompt_file=path)
+            if self._credentials is not None:
+                profile = stack.enter_context(self._credentials.lease(turn.profile))
+                turn = turn._replace(profile=profile.name)
+            if self._workspaces is not None:
+                workspace = stack.enter_context(self._workspaces.lease(turn.workspace))
+                self._workspaces.write_attachments(workspace, list(turn.attachments))
+                turn = turn._replace(workspace=workspace)
+            yield turn
+
+    @asynccontextmanager
+    async def _alease(self, turn: ConversationTurn) -> AsyncIterator[ConversationTurn]:
+        """Async counterpart of _lease; leasing never waits"""
+        with self._lease(turn) as leased:
+            yield leased
+
+    def _get_cwd(self, turn: ConversationTurn) -> Optional[str]:
+        """Working directory for a claude-code child: its workspace, or None to inherit ours"""
+        if self._workspaces is None or turn.workspace is None:
+            return None
+        return self._workspaces.path(turn.workspace)
+
+    def _get_attachments(self, messages: List[Dict[str, Any]]) -> Tuple[Attachment, ...]:
+        """Files sent with a conversation, to write into its workspace
+
+        Without workspaces there is nowhere to put them, and they are left out as before.
+        """
+        if self._workspaces is None:
+            return ()
+
+        attachments = {}
+        for message in messages:
+            content = message.get("content")
+            if not isinstance(content, list):
+                continue
+            for part in content:
+                attachment = parse_attachment(part) if isinstance(part, dict) else None
+                if attachment is not None:
+                    attachments[attachment.name] = attachment
+        return tuple(attachments.values())
+
+    def _get_env(self, turn: ConversationTurn) -> Optional[Dict[str, str]]:
+        """Environment for a claude-code child: its profile's, or None to inherit ours"""
+        profile = self._credentials.get(turn.profile) if self._credentials is not None else None
+        return profile.environ() if profile is not None else None
 
-    def _execute_claude_code(self, prompt: str) -> str:
-        """Execute claude-code CLI command"""
-        # Try to find claude-code command
-        import shutil
+    def _trace(self, model: str, kwargs: Dict[str, Any]) -> RequestTrace:
+        """Start recording metrics for an execution"""
+        return self._metrics.trace(model, self._get_admission_key(kwargs))
 
-        claude_cmd = shutil.which("claude")
+    def _get_admission_key(self, kwargs: Dict[str, Any]) -> str:
+        """Identify the LiteLLM API key a request is queued under"""
+        metadata = self._get_metadata(kwargs)
+        return metadata.get("user_api_key_alias") or metadata.get("user_api_key_hash") or "default"
 
-        if not claude_cmd:
-            raise RuntimeError("claude command not found. Please install claude-code CLI.")
+    def _get_priority(self, kwargs: Dict[str, Any]) -> str:
+        """The priority class a request is queued in
 
-        cmd = [claude_cmd, "-p", prompt]
-        logger.info(f"Executing command: {' '.join(cmd)}")
+        Named by the model alias's ``priority_class`` litellm_param, the API key's
+        ``priority_class`` metadata, or the PRIORITY_HEADER request header. The least urgent
+        one named wins, so a client can lower its own priority but not raise it.
 
+        Raises:
+            ValueError: one of them isn't a known priority class
+        """
+        metadata = self._get_metadata(kwargs)
+        headers = metadata.get("headers") or {}
+        named = [
+            parse_priority(self._get_deployment_params(kwargs).get("priority_class")),
+            parse_priority((metadata.get("user_api_key_metadata") or {}).get("priority_class")),
+            parse_priority(headers.get(PRIORITY_HEADER)),
+        ]
+        return max((p for p in named if p), key=PRIORITIES.index, default=INTERACTIVE)
+
+    def _get_request_key(
+        self, model: str, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]
+    ) -> Optional[str]:
+        """Key identifying identical requests, or None when neither caching nor sharing is on
+
+        Includes the routed deployment's CLI options: deployments sharing a model name may run
+        different models, tools or system prompts, and must not answer for one another.
+        """
+        if self._cache is None and self._flights is None:
+            return None
+        return make_cache_key(
+            model,
+            messages,
+            kwargs.get("optional_params") or {},
+            self._get_model_options(model, kwargs).args,
+        )
+
+    def _cache_get(self, request_key: Optional[str], kwargs: Dict[str, Any]) -> Optional[Dict]:
+        """Look up a cached response unless the request sent Cache-Control: no-cache"""
+        if self._cache is None or request_key is None:
+            return None
+        if self._get_cache_directives(kwargs).no_cache:
+            return None
+
+        cached = self._cache.get(request_key)
+        if cached is not None:
+            logger.info(f"Serving claude-code response from cache ({request_key[:12]})")
+        return cached
+
+    def _cache_set(
+        self, request_key: Optional[str], kwargs: Dict[str, Any], outcome: Dict[str, Any]
+    ) -> None:
+        """Store a response unless the request sent Cache-Control: no-store"""
+        if self._cache is None or request_key is None:
+            return
+        if self._get_cache_directives(kwargs).no_store:
+            return
+        self._cache.set(request_key, outcome)
+
+    def _can_share(self, request_key: Optional[str], kwargs: Dict[str, Any]) -> bool:
+        """Whether a request may attach to an identical one in flight
+
+        Cache-Control: no-cache asks for a fresh answer, so it also opts out of sharing.
+        """
+        if self._flights is None or request_key is None:
+            return False
+        return not self._get_cache_directives(kwargs).no_cache
+
+    def _flight_key(self, request_key: str, kwargs: Dict[str, Any]) -> str:
+        """Key of the execution a request may share: identical requests of its priority class
+
+        An interactive request never waits on batch work, which queues behind it and may be
+        preempted.
+        """
+        return f"{request_key}:{self._get_priority(kwargs)}"
+
+    def _share(self, request_key: Optional[str], kwargs: Dict[str, Any], fn: Callable) -> Dict:
+        """Run fn, or wait for the identical request already running it
+
+        Requests that wait get the outcome without its ``details``: like a cache hit, they
+        cost nothing, and the leader alone reports the execution's cost. They wait no longer
+        than their own timeout.
+        """
+        if not self._can_share(request_key, kwargs):
+            return fn()
+        return self._flights.run(
+            self._flight_key(request_key, kwargs),
+            fn,
+            shared=_without_details,
+            timeout=self._get_timeout(kwargs),
+        )
+
+    async def _ashare(
+        self, request_key: Optional[str], kwargs: Dict[str, Any], fn: Callable
+    ) -> Dict:
+        """Await fn, or wait for the identical request already awaiting it"""
+        if not self._can_share(request_key, kwargs):
+            return await fn()
+        return await self._flights.arun(
+            self._flight_key(request_key, kwargs),
+            fn,
+            shared=_without_details,
+            timeout=self._get_timeout(kwargs),
+        )
+
+    def _share_stream(
+        self, request_key: Optional[str], kwargs: Dict[str, Any], producer: Callable
+    ) -> Iterator[Any]:
+        """Iterate producer, or replay the identical stream already in flight"""
+        if not self._can_share(request_key, kwargs):
+            return producer()
+        return self._flights.stream(
+            self._flight_key(request_key, kwargs),
+            producer,
+            shared=_without_details,
+            timeout=self._get_timeout(kwargs),
+        )
+
+    def _ashare_stream(
+        self, request_key: Optional[str], kwargs: Dict[str, Any], producer: Callable
+    ) -> AsyncIterator[Any]:
+        """Iterate an async producer, or replay the identical stream already in flight"""
+        if not self._can_share(request_key, kwargs):
+            return producer()
+        return self._flights.astream(
+            self._flight_key(request_key, kwargs),
+            producer,
+            shared=_without_details,
+            timeout=self._get_timeout(kwargs),
+        )
+
+    def _get_cache_directives(self, kwargs: Dict[str, Any]) -> CacheDirectives:
+        """Parse the Cache-Control header the client sent through the proxy"""
+        headers = self._get_metadata(kwargs).get("headers") or {}
+        return parse_cache_control(headers.get("cache-control"))
+
+    def _get_model_options(self, model: str, kwargs: Dict[str, Any]) -> ModelOptions:
+        """CLI options of the deployment a request was routed to; the request can't set them"""
+        return ModelOptions.from_params(model, self._get_deployment_params(kwargs))
+
+    def _get_deployment_params(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """litellm_params of the model_list deployment a request was routed to"""
+        model_info = self._get_metadata(kwargs).get("model_info") or {}
+        return self._models.params(model_info.get("id"))
+
+    def _get_output_format(self, kwargs: Dict[str, Any]) -> Optional[OutputFormat]:
+        """The JSON or function calls a request asked for, or None for a text answer"""
+        return OutputFormat.from_params(kwargs.get("optional_params") or {})
+
+    def _get_metadata(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Request metadata LiteLLM passes through (API key info, request headers)"""
+        return (kwargs.get("litellm_params") or {}).get("metadata") or {}
+
+    def _is_client_timeout(self, kwargs: Dict[str, Any]) -> bool:
+        """Whether a request's timeout was the client's choice
+
+        That is, shorter than the server's own: the deployment's ``timeout`` litellm_param or
+        CLAUDE_CODE_TIMEOUT.
+        """
+        timeout = self._get_timeout(kwargs)
+        server_timeout = self._get_deployment_params(kwargs).get("timeout") or self._default_timeout
+        return timeout is not None and (server_timeout is None or timeout < float(server_timeout))
+
+    def _get_timeout(self, kwargs: Dict[str, Any]) -> Optional[float]:
+        """Resolve the per-request timeout (seconds) passed by LiteLLM
+
+        Falls back to CLAUDE_CODE_TIMEOUT for callers that don't pass one.
+        """
+        timeout = kwargs.get("timeout") or kwargs.get("request_timeout")
+        if isinstance(timeout, httpx.Timeout):
+            timeout = timeout.read
+        return float(timeout) if timeout else self._default_timeout
+
+    def _stream_parser(self, kwargs: Dict[str, Any]) -> "_StreamJsonParser":
+        """Parser for a request's stream-json output
+
+        A structured answer is only complete in the result event, so its text isn't streamed.
+        """
+        return _StreamJsonParser(
+            self._output_budget(kwargs), stream_text=self._get_output_format(kwargs) is None
+        )
+
+    def _output_budget(self, kwargs: Dict[str, Any]) -> "_OutputBudget":
+        """How much answer text a request may receive: CLAUDE_CODE_MAX_OUTPUT_BYTES and its
+        max_tokens / max_completion_tokens"""
+        optional_params = kwargs.get("optional_params") or {}
+        max_tokens = optional_params.get("max_completion_tokens") or optional_params.get(
+            "max_tokens"
+        )
+        return _OutputBudget(self._max_output, int(max_tokens) if max_tokens else None)
+
+    def _get_deadline(self, kwargs: Dict[str, Any]) -> Optional[float]:
+        """When a request must be answered by (monotonic clock), or None if it has no timeout"""
+        timeout = self._get_timeout(kwargs)
+        return time.monotonic() + timeout if timeout else None
+
+    def _time_left(self, deadline: Optional[float]) -> Optional[float]:
+        """Seconds claude-code may still run, after time already spent queueing
+
+        Raises:
+            litellm.Timeout: the deadline has already passed
+        """
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise self._build_timeout_error(0)
+        return remaining
+
+    def _find_claude_command(self) -> str:
+        """Find claude-code command, searching PATH only the first time"""
+        return self._claude.path
+
+    def _build_command(self, turn: ConversationTurn, streaming: bool = False) -> List[str]:
+        """Build claude-code CLI command; the prompt itself is written to its stdin"""
+        cmd = [self._find_claude_command(), "-p", *turn.args]
+        cmd.extend(STREAM_JSON_ARGS if streaming else JSON_OUTPUT_ARGS)
+        return cmd
+
+    def _build_pool_command(self) -> List[str]:
+        """Build the command for a warm worker that reads prompts from stdin"""
+        return [
+            self._find_claude_command(),
+            "-p",
+            "--input-format",
+            "stream-json",
+            *STREAM_JSON_ARGS,
+        ]
+
+    def _execute_claude_code(
+        self, turn: ConversationTurn, trace: RequestTrace, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Execute claude-code CLI command and return its result event"""
+        cmd = self._build_command(turn)
+        self._log_command(cmd, turn)
+
+        trace.process_started()
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            logger.info(f"Command output: {result.stdout[:100]}...")
-            return result.stdout.strip()
+            result = run_process(
+                cmd,
+                timeout=timeout,
+                env=self._get_env(turn),
+                cwd=self._get_cwd(turn),
+                grace=self._terminate_grace,
+                max_output=self._json_output_limit(),
+                stderr_limit=self._stderr_limit,
+                input=turn.prompt.encode("utf-8"),
+            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Command output: {result.stdout[:100]}...")
+            return self._parse_result(result.stdout, result.stderr)
+
+        except subprocess.TimeoutExpired:
+            raise self._build_timeout_error(timeout)
+
+        except OutputLimitExceeded as e:
+            self._raise_output_limit_error(e)
 
         except subprocess.CalledProcessError as e:
-            error_msg = e.stderr if e.stderr else e.stdout if e.stdout else "Unknown error"
-            logger.error(f"claude-code failed: {error_msg}")
-
-            # Check for common authentication issues
-            if "Invalid API key" in error_msg or "Please run /login" in error_msg:
-                raise RuntimeError(
-                    "claude-code authentication failed. Please set ANTHROPIC_API_KEY environment variable "
-                    "or run 'claude /login' to authenticate."
+            self._raise_claude_code_error(self._get_error_message(e.stderr, e.stdout))
+
+        finally:
+            trace.process_exited()
+
+    def _stream_claude_code(
+        self,
+        turn: ConversationTurn,
+        parser: "_StreamJsonParser",
+        trace: RequestTrace,
+        timeout: Optional[float] = None,
+    ) -> Iterator[str]:
+        """Run claude-code with stream-json output and yield text deltas as they arrive"""
+        cmd = self._build_command(turn, streaming=True)
+        self._log_command(cmd, turn)
+
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=child_env(self._get_env(turn)),
+            cwd=self._get_cwd(turn),
+            start_new_session=True,
+        )
+        track_child(process)
+        trace.process_started()
+
+        # Feed the prompt and drain stderr in the background, so neither a long prompt nor a
+        # chatty child can block on a full pipe while stdout is read
+        prompt = turn.prompt.encode("utf-8")
+        threading.Thread(target=feed, args=(process.stdin, prompt), daemon=True).start()
+        stderr = TailBuffer(self._stderr_limit)
+        stderr_thread = threading.Thread(target=drain, args=(process.stderr, stderr), daemon=True)
+        stderr_thread.start()
+
+        timed_out = threading.Event()
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, self._kill_on_timeout, args=(process, timed_out))
+            timer.daemon = True
+            timer.start()
+
+        try:
+            for line in process.stdout:
+                trace.process_ready()
+                text = parser.feed(line.decode("utf-8", errors="replace"))
+                if text:
+                    trace.output()
+                    yield text
+                if parser.truncated:
+                    # The rest of the answer would be thrown away, so stop claude-code now
+                    return
+
+            process.wait()
+            stderr_thread.join()
+            if timed_out.is_set():
+                raise self._build_timeout_error(timeout)
+
+            self._check_stream_result(process.returncode, parser, stderr.getvalue())
+
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if process.poll() is None:
+                terminate_process(process, self._terminate_grace)
+            trace.process_exited()
+
+    async def _aexecute_claude_code(
+        self, turn: ConversationTurn, trace: RequestTrace, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Execute claude-code CLI command with non-blocking pipe reads and return its result event"""
+        if self._can_use_pool(turn):
+            # Warm workers speak stream-json, so collect the result from the event stream
+            parser = _StreamJsonParser()
+            async for _ in self._astream_claude_code(turn, parser, trace, timeout):
+                pass
+            return {**(parser.result or {}), "result": parser.result_text}
+
+        cmd = self._build_command(turn)
+        self._log_command(cmd, turn)
+
+        # The prompt goes through stdin: argv is capped at a few hundred KB, stdin isn't
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=child_env(self._get_env(turn)),
+            cwd=self._get_cwd(turn),
+            start_new_session=True,
+        )
+        track_child(process)
+        trace.process_started()
+
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                acapture(
+                    process,
+                    cmd,
+                    self._json_output_limit(),
+                    self._stderr_limit,
+                    input=turn.prompt.encode("utf-8"),
+                ),
+                timeout=timeout,
+            )
+
+        except asyncio.TimeoutError:
+            await self._akill_process(process)
+            raise self._build_timeout_error(timeout)
+
+        except OutputLimitExceeded as e:
+            await self._akill_process(process)
+            self._raise_output_limit_error(e)
+
+        except asyncio.CancelledError:
+            # Client disconnected: don't leave the child running
+            await self._akill_process(process)
+            raise
+
+        finally:
+            trace.process_exited()
+
+        output = stdout.decode("utf-8", errors="replace")
+        error_output = stderr.decode("utf-8", errors="replace")
+        if process.returncode != 0:
+            self._raise_claude_code_error(self._get_error_message(error_output, output))
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Command output: {output[:100]}...")
+        return self._parse_result(output, error_output)
+
+    async def _astream_claude_code(
+        self,
+        turn: ConversationTurn,
+        parser: "_StreamJsonParser",
+        trace: RequestTrace,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """Run claude-code with stream-json output and yield text deltas as they arrive"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout else None
+
+        worker = self._pool.acquire() if self._can_use_pool(turn) else None
+        if worker is not None:
+            logger.info(f"Sending prompt to warm claude worker (pid {worker.process.pid})")
+            process = worker.process
+            # Tracked when it was spawned, before this request owned it
+            claim_child(process)
+            await self._pool.submit(worker, turn.prompt)
+        else:
+            cmd = self._build_command(turn, streaming=True)
+            self._log_command(cmd, turn)
+
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                limit=STREAM_LINE_LIMIT,
+                env=child_env(self._get_env(turn)),
+                cwd=self._get_cwd(turn),
+                start_new_session=True,
+            )
+            track_child(process)
+            trace.process_started()
+            input_task = asyncio.ensure_future(afeed(process.stdin, turn.prompt.encode("utf-8")))
+            stderr = TailBuffer(self._stderr_limit)
+            stderr_task = asyncio.ensure_future(adrain(process.stderr, stderr))
+
+        completed = False
+        try:
+            # A warm worker keeps running after answering, so stop at the result event
+            while parser.result is None:
+                remaining = None if deadline is None else deadline - loop.time()
+                try:
+                    line = await asyncio.wait_for(process.stdout.readline(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    raise self._build_timeout_error(timeout)
+
+                if not line:
+                    break
+
+                trace.process_ready()
+                text = parser.feed(line.decode("utf-8", errors="replace"))
+                if text:
+                    trace.output()
+                    yield text
+                if parser.truncated:
+                    # The rest of the answer would be thrown away, so stop claude-code now
+                    return
+
+            if worker is not None:
+                worker_stderr = worker.stderr.encode("utf-8")
+                self._check_stream_result(
+                    process.returncode, parser, worker_stderr, require_result=True
                 )
+            else:
+                await process.wait()
+                await stderr_task
+                self._check_stream_result(process.returncode, parser, stderr.getvalue())
+            completed = True
+
+        finally:
+            if worker is not None:
+                # Runs on client disconnect as well: a worker interrupted mid-answer is dropped
+                self._pool.release(worker, reusable=completed)
+            else:
+                if process.returncode is None:
+                    await self._akill_process(process)
+                input_task.cancel()
+                stderr_task.cancel()
+                trace.process_exited()
+
+    def _credential_envs(self) -> Optional[List[Dict[str, str]]]:
+        """Environments the startup checks verify credentials in, one per profile"""
+        if self._credentials is None:
+            return None
+        return [profile.environ() for profile in self._credentials.profiles]
+
+    def _health(self) -> Tuple[bool, Dict[str, Any]]:
+        """Readiness of the provider: whether claude-code passed its startup checks"""
+        status = self._claude.status()
+        if self._breaker is not None:
+            status["circuit"] = self._breaker.state
+        return status["ready"], status
+
+    def _log_command(self, cmd: List[str], turn: ConversationTurn) -> None:
+        """Log a claude-code execution without writing the prompt, which may be megabytes, out"""
+        logger.info(f"Executing claude-code with a {len(turn.prompt)}-character prompt on stdin")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Command: {' '.join(_truncate(arg) for arg in cmd)}; "
+                f"prompt: {_summarize_prompt(turn.prompt)}"
+            )
+
+    def _can_use_pool(self, turn: ConversationTurn) -> bool:
+        """Whether a turn can run on a warm worker, which is spawned without per-request options
+        in the proxy's working directory"""
+        return self._pool is not None and not turn.args and turn.workspace is None
+
+    def _kill_on_timeout(self, process: subprocess.Popen, timed_out: threading.Event) -> None:
+        """Terminate a claude-code child process whose deadline has passed"""
+        timed_out.set()
+        terminate_process(process, self._terminate_grace)
+
+    def _build_timeout_error(self, timeout: Optional[float]) -> litellm.Timeout:
+        """Create the error raised when claude-code exceeds its deadline"""
+        return litellm.Timeout(
+            message=f"claude-code timed out after {timeout} seconds",
+            model="claude-code-server/claude-code",
+            llm_provider="claude-code-server",
+        )
+
+    async def _akill_process(self, process: asyncio.subprocess.Process) -> None:
+        """Terminate a claude-code child process with everything it spawned, and reap it"""
+        await aterminate_process(process, self._terminate_grace)
+
+    def _json_output_limit(self) -> Optional[int]:
+        """Bytes of --output-format json output read at most before claude-code is stopped"""
+        if self._max_output is None:
+            return None
+        return 2 * self._max_output + JSON_OUTPUT_OVERHEAD
+
+    def _raise_output_limit_error(self, error: OutputLimitExceeded) -> NoReturn:
+        """Raise an error for a non-streaming answer too large to read in full"""
+        logger.error(f"claude-code output exceeded {error.limit} bytes; stopped it")
+        raise ClaudeCodeError(
+            f"claude-code failed: output exceeded {error.limit} bytes. "
+            "Stream the request to receive the answer up to CLAUDE_CODE_MAX_OUTPUT_BYTES.",
+            OUTPUT_LIMIT,
+        )
+
+    def _raise_claude_code_error(self, error_msg: str) -> NoReturn:
+        """Raise an error for a failed claude-code execution"""
+        logger.error(f"claude-code failed: {error_msg}")
+
+        kind = classify_message(error_msg)
+        if kind == AUTH:
+            raise ClaudeCodeError(
+                "claude-code authentication failed. Please set ANTHROPIC_API_KEY environment variable "
+                "or run 'claude /login' to authenticate.",
+                kind,
+            )
+
+        raise ClaudeCodeError(f"claude-code failed: {error_msg}", kind)
+
+
+@contextmanager
+def _system_prompt_file(text: str) -> Iterator[str]:
+    """A temporary file, readable only by us, holding a system prompt"""
+    fd, path = tempfile.mkstemp(prefix="claude-code-system-", suffix=".txt")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def _truncate(text: str, limit: int = LOGGED_PROMPT_CHARS) -> str:
+    """``text`` cut to ``limit`` characters for a log line"""
+    return text if len(text) <= limit else f"{text[:limit]}... ({len(text)} chars)"
+
+
+def _summarize_prompt(prompt: str) -> str:
+    """Hash, size and beginning of a prompt: enough to tell requests apart in a debug log"""
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    return f"sha256:{digest}, {len(prompt)} chars, {prompt[:LOGGED_PROMPT_CHARS]!r}"
+
+
+def _without_details(item: Any) -> Any:
+    """What a request sharing another's execution receives: its outcome without ``details``"""
+    if isinstance(item, dict) and "details" in item:
+        return {key: value for key, value in item.items() if key != "details"}
+    return item
+
+
+def _parse_json_result(output: str) -> Optional[Dict[str, Any]]:
+    """Find the result event in --output-format json output, or None if it isn't JSON"""
+    try:
+        data = json.loads(output)
+    except json.JSONDecodeError:
+        return None
+
+    if isinstance(data, list):
+        # With --verbose the CLI prints every event as a JSON array
+        data = next(
+            (e for e in reversed(data) if isinstance(e, dict) and e.get("type") == "result"), None
+        )
+    if isinstance(data, dict) and data.get("type") == "result":
+        return data
+    return None
+
+
+class _OutputBudget:
+    """What is left of the answer text a request may receive, in bytes and tokens"""
+
+    def __init__(self, max_bytes: Optional[int] = None, max_tokens: Optional[int] = None):
+        self.bytes_left = max_bytes
+        self.tokens_left = max_tokens
+        self.exhausted = False
+
+    def take(self, text: str) -> str:
+        """Cut ``text`` down to what is left, marking the budget exhausted if it was cut"""
+        if self.bytes_left is not None:
+            data = text.encode("utf-8")
+            if len(data) > self.bytes_left:
+                # Cutting may split a character; its leftover bytes are dropped
+                data = data[: self.bytes_left]
+                text = data.decode("utf-8", errors="ignore")
+                self.exhausted = True
+            self.bytes_left -= len(data)
+
+        if self.tokens_left is not None and text:
+            tokens = litellm.encode(model="", text=text)
+            if len(tokens) > self.tokens_left:
+                tokens = tokens[: self.tokens_left]
+                text = litellm.decode(model="", tokens=tokens) if tokens else ""
+                self.exhausted = True
+            self.tokens_left -= len(tokens)
+
+        return text
+
+
+class _StreamJsonParser:
+    """Incrementally parse claude-code stream-json output into text deltas"""
+
+    def __init__(self, budget: Optional[_OutputBudget] = None, stream_text: bool = True):
+        self.result: Optional[Dict[str, Any]] = None
+        self._budget = budget or _OutputBudget()
+        self._stream_text = stream_text
+        self._partial = False
+        self._parts: List[str] = []
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the answer ran past the output budget and was cut off"""
+        return self._budget.exhausted
+
+    @property
+    def text(self) -> str:
+        """Text streamed so far"""
+        return "".join(self._parts)
+
+    @property
+    def result_text(self) -> str:
+        """Final answer reported by the result event, falling back to the streamed text"""
+        if self.result is not None and isinstance(self.result.get("result"), str):
+            return self.result["result"].strip()
+        return self.text.strip()
+
+    def feed(self, line: str) -> Optional[str]:
+        """Consume one line of output and return the text delta it carries, if any"""
+        if not line.strip():
+            return None
+
+        try:
+            event = json.loads(line)
+        except json.JSONDecodeError:
+            event = None
+
+        if not isinstance(event, dict):
+            # Plain text output from a CLI without stream-json support
+            return self._append(line)
+
+        event_type = event.get("type")
+        if event_type == "stream_event":
+            delta = event.get("event", {}).get("delta", {})
+            if delta.get("type") == "text_delta":
+                self._partial = True
+                return self._append(delta.get("text", ""))
+
+        elif event_type == "assistant" and not self._partial:
+            # CLI without --include-partial-messages: one event per assistant message
+            content = event.get("message", {}).get("content", [])
+            return self._append(
+                "".join(block.get("text", "") for block in content if block.get("type") == "text")
+            )
+
+        elif event_type == "result":
+            self.result = event
+
+        return None
 
-            raise RuntimeError(f"claude-code failed: {error_msg}")
+    def _append(self, text: str) -> Optional[str]:
+        if not self._stream_text:
+            return None
+        text = self._budget.take(text)
+        if not text:
+            return None
+        self._parts.append(text)
+        return text
 
 
 # Create an instance of the provider to be used in config.yaml
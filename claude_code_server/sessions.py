@@ -0,0 +1,149 @@
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from claude_code_server.cache import make_cache_key
+from claude_code_server.config import get_env_int
+from claude_code_server.store import MemoryStore, StateStore
+from claude_code_server.workspace import Attachment
+
+logger = logging.getLogger(__name__)
+
+# Roles whose messages become the system prompt rather than conversation turns
+SYSTEM_ROLES = {"system", "developer"}
+
+# Namespace of the index's entries in the state store
+SESSIONS_NAMESPACE = "sessions"
+
+
+class ConversationTurn(NamedTuple):
+    """The newest user message of a conversation, ready to send to claude-code"""
+
+    prompt: str
+    system_prompt: Optional[str] = None
+    session_id: Optional[str] = None
+    resume: bool = False
+    # Credential profile the turn runs under; a session only exists in its own profile
+    profile: Optional[str] = None
+    # CLI options of the model alias the request was routed to and the output format it asked for
+    model_args: Tuple[str, ...] = ()
+    # Workspace the turn runs in; a session's transcript is kept under its own workspace
+    workspace: Optional[str] = None
+    # Files sent with the conversation, written into the workspace before the turn runs
+    attachments: Tuple[Attachment, ...] = ()
+    # File the system prompt was written to when it is too long for the command line
+    system_prompt_file: Optional[str] = None
+
+    @property
+    def args(self) -> List[str]:
+        """CLI options carrying the model's options, the system prompt and the session"""
+        args = list(self.model_args)
+        if self.system_prompt_file:
+            args.extend(["--append-system-prompt-file", self.system_prompt_file])
+        elif self.system_prompt:
+            args.extend(["--append-system-prompt", self.system_prompt])
+        if self.session_id:
+            args.extend(["--resume" if self.resume else "--session-id", self.session_id])
+        return args
+
+
+class SessionRef(NamedTuple):
+    """A claude-code session and the credential profile and workspace it was created in"""
+
+    session_id: str
+    profile: Optional[str] = None
+    workspace: Optional[str] = None
+
+
+def message_text(content: Any) -> str:
+    """Flatten OpenAI message content (a string or a list of parts) into text"""
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(
+            part.get("text", "")
+            for part in content
+            if isinstance(part, dict) and part.get("type") == "text"
+        )
+    return str(content)
+
+
+def render_transcript(history: List[Dict[str, Any]], message: Dict[str, Any]) -> str:
+    """Inline earlier turns ahead of the new message, for a conversation without a session"""
+    turns = "\n\n".join(_render_turn(m) for m in history)
+    new_message = message_text(message.get("content"))
+    return f"<conversation_history>\n{turns}\n</conversation_history>\n\n{new_message}"
+
+
+def render_tool_results(messages: List[Dict[str, Any]]) -> str:
+    """The results of the functions an answer called, sent back by the client as the next
+    message"""
+    results = "\n\n".join(
+        f'<tool_result tool_call_id="{m.get("tool_call_id", "")}">\n'
+        f"{message_text(m.get('content'))}\n</tool_result>"
+        for m in messages
+    )
+    return f"Results of the functions you called:\n\n{results}"
+
+
+def _render_turn(message: Dict[str, Any]) -> str:
+    role = message.get("role", "user")
+    text = message_text(message.get("content"))
+    if role == "tool":
+        return f"Tool result ({message.get('tool_call_id', '')}): {text}"
+
+    lines = [text] if text else []
+    for call in message.get("tool_calls") or []:
+        function = call.get("function") or {}
+        lines.append(
+            f"[Called {function.get('name')}({function.get('arguments')}) as {call.get('id')}]"
+        )
+    return f"{role.capitalize()}: " + "\n".join(lines)
+
+
+def session_key(model: str, owner: str, messages: List[Dict[str, Any]]) -> str:
+    """Hash a conversation prefix, scoped to the API key that owns the session"""
+    return make_cache_key(model, messages, {"owner": owner})
+
+
+class SessionIndex:
+    """Bounded LRU index of conversation prefixes to the claude-code sessions holding them
+
+    Resuming a session appends to it, so an entry is claimed (removed) when a request
+    resumes it and re-added under the longer prefix once the turn completes. Two requests
+    branching from the same prefix therefore never write to the same session, even when
+    they reach different proxy workers sharing the ``store``.
+    """
+
+    def __init__(self, max_sessions: int, store: Optional[StateStore] = None):
+        self.max_sessions = max_sessions
+        self._store = store or MemoryStore()
+
+    @classmethod
+    def from_env(cls, store: Optional[StateStore] = None) -> Optional["SessionIndex"]:
+        """Create an index if CLAUDE_CODE_MAX_SESSIONS is set, or None if disabled"""
+        max_sessions = get_env_int("CLAUDE_CODE_MAX_SESSIONS", 0)
+        if max_sessions <= 0:
+            return None
+        return cls(max_sessions, store)
+
+    def __len__(self) -> int:
+        return self._store.count(SESSIONS_NAMESPACE)
+
+    def claim(self, key: str) -> Optional[SessionRef]:
+        """Take the session holding a conversation prefix, or None if there is none"""
+        entry = self._store.pop(SESSIONS_NAMESPACE, key)
+        return None if entry is None else SessionRef(*entry.value)
+
+    def put(
+        self,
+        key: str,
+        session_id: str,
+        profile: Optional[str] = None,
+        workspace: Optional[str] = None,
+    ) -> None:
+        """Record the session holding a conversation prefix, evicting the oldest if full"""
+        self._store.set(SESSIONS_NAMESPACE, key, list(SessionRef(session_id, profile, workspace)))
+        for evicted in self._store.trim(SESSIONS_NAMESPACE, self.max_sessions):
+            logger.info(f"Evicted claude-code session index entry ({evicted[:12]})")
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+
+import litellm
+
+from claude_code_server.config import get_env_bool
+
+logger = logging.getLogger(__name__)
+
+
+class FlightAbandonedError(RuntimeError):
+    """Raised to followers when the request that started a shared execution went away"""
+
+
+class FlightTimeoutError(litellm.Timeout):
+    """Raised to a follower whose timeout passed before the shared execution finished"""
+
+    def __init__(self):
+        super().__init__(
+            message="shared claude-code execution did not finish before the request timed out",
+            model="claude-code-server/claude-code",
+            llm_provider="claude-code-server",
+        )
+
+
+class _Flight:
+    """One in-flight execution whose output is replayed to every identical request
+
+    The leader publishes items (text deltas, then the final outcome) and closes the
+    flight; followers iterate the items from the start, from threads or event loops.
+    """
+
+    def __init__(self):
+        self.followers = 0
+        self._cond = threading.Condition()
+        self._items: List[Any] = []
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def publish(self, item: Any) -> None:
+        with self._cond:
+            self._items.append(item)
+            self._notify()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        with self._cond:
+            self._closed = True
+            self._error = error
+            self._notify()
+
+    def iter(self, deadline: Optional[float] = None) -> Iterator[Any]:
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._items) and not self._closed:
+                    if not self._cond.wait(_time_left(deadline)):
+                        raise FlightTimeoutError()
+                batch = self._items[index:]
+                index += len(batch)
+                finished = self._closed and index >= len(self._items)
+
+            yield from batch
+            if finished:
+                self._raise_error()
+                return
+
+    async def aiter(self, deadline: Optional[float] = None) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            event = None
+            with self._cond:
+                batch = self._items[index:]
+                index += len(batch)
+                finished = self._closed and index >= len(self._items)
+                if not batch and not finished:
+                    event = asyncio.Event()
+                    self._async_waiters.append((asyncio.get_running_loop(), event))
+
+            for item in batch:
+                yield item
+            if finished:
+                self._raise_error()
+                return
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), _time_left(deadline))
+                except asyncio.TimeoutError:
+                    raise FlightTimeoutError() from None
+
+    def _notify(self) -> None:
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # the follower's event loop is gone
+        self._async_waiters.clear()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+
+class SingleFlight:
+    """Deduplicate identical concurrent requests
+
+    The first request for a key runs the execution; requests with the same key that
+    arrive while it is in flight attach to it and receive the same items, whether they
+    are sync or async, streaming or not. If the leader goes away before finishing,
+    followers that haven't received any output yet start over. ``shared`` converts what
+    the leader publishes into what its followers receive, and a follower waits at most
+    ``timeout`` seconds for the whole execution before FlightTimeoutError is raised.
+
+    Errors of the ``private_errors`` types concern the leader alone (it was rejected or
+    timed out, say); followers that haven't received any output start over instead of
+    raising them.
+    """
+
+    def __init__(self, private_errors: Tuple[Type[BaseException], ...] = ()):
+        self.private_errors = private_errors
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(
+        cls, private_errors: Tuple[Type[BaseException], ...] = ()
+    ) -> Optional["SingleFlight"]:
+        """Create a group if CLAUDE_CODE_SINGLE_FLIGHT is enabled, or None"""
+        if not get_env_bool("CLAUDE_CODE_SINGLE_FLIGHT", False):
+            return None
+        return cls(private_errors)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct executions currently shared"""
+        return len(self._flights)
+
+    def run(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        shared: Optional[Callable] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Run fn once for all concurrent callers with the same key and return its result"""
+        *_, result = self.stream(key, lambda: iter([fn()]), shared, timeout)
+        return result
+
+    async def arun(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        shared: Optional[Callable] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Await fn once for all concurrent callers with the same key and return its result"""
+
+        async def produce() -> AsyncIterator[Any]:
+            yield await fn()
+
+        result = None
+        async for item in self.astream(key, produce, shared, timeout):
+            result = item
+        return result
+
+    def stream(
+        self,
+        key: str,
+        producer: Callable[[], Iterator[Any]],
+        shared: Optional[Callable] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[Any]:
+        """Iterate producer once for all concurrent callers with the same key"""
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                yield from self._lead(key, flight, producer, shared)
+                return
+
+            received = False
+            try:
+                for item in flight.iter(deadline):
+                    received = True
+                    yield item
+                return
+            except FlightAbandonedError:
+                if received:
+                    raise
+                logger.info("Shared claude-code execution was abandoned, starting over")
+
+    async def astream(
+        self,
+        key: str,
+        producer: Callable[[], AsyncIterator[Any]],
+        shared: Optional[Callable] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Any]:
+        """Iterate an async producer once for all concurrent callers with the same key"""
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                try:
+                    async for item in producer():
+                        flight.publish(shared(item) if shared else item)
+                        yield item
+                    flight.close()
+                except Exception as e:
+                    flight.close(self._shared_error(e))
+                    raise
+                except BaseException:
+                    flight.close(FlightAbandonedError("shared claude-code execution was abandoned"))
+                    raise
+                finally:
+                    self._forget(key, flight)
+                return
+
+            received = False
+            try:
+                async for item in flight.aiter(deadline):
+                    received = True
+                    yield item
+                return
+            except FlightAbandonedError:
+                if received:
+                    raise
+                logger.info("Shared claude-code execution was abandoned, starting over")
+
+    def _lead(
+        self,
+        key: str,
+        flight: _Flight,
+        producer: Callable[[], Iterator[Any]],
+        shared: Optional[Callable],
+    ) -> Iterator[Any]:
+        try:
+            # Called in here so that a producer failing at once, as run's does, closes the flight
+            for item in producer():
+                flight.publish(shared(item) if shared else item)
+                yield item
+            flight.close()
+        except Exception as e:
+            flight.close(self._shared_error(e))
+            raise
+        except BaseException:
+            # GeneratorExit when the leading client disconnects mid-stream
+            flight.close(FlightAbandonedError("shared claude-code execution was abandoned"))
+            raise
+        finally:
+            self._forget(key, flight)
+
+    def _shared_error(self, error: Exception) -> Exception:
+        """What followers are told when the leader fails"""
+        if isinstance(error, self.private_errors):
+            return FlightAbandonedError(
+                f"shared claude-code execution failed for its leader: {error}"
+            )
+        return error
+
+    def _join(self, key: str) -> Tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.coalesced += 1
+                logger.info(f"Attaching to in-flight claude-code execution ({key[:12]})")
+                return flight, False
+
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+
+def _time_left(deadline: Optional[float]) -> Optional[float]:
+    """Seconds until ``deadline`` (monotonic clock), or None to wait without limit"""
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
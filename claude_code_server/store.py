@@ -0,0 +1,347 @@
+import collections
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Expired entries are purged once every this many writes
+PURGE_INTERVAL = 100
+
+# Seconds a worker waits for another one to finish writing to a shared store
+BUSY_TIMEOUT = 10.0
+
+
+class Entry(NamedTuple):
+    """A stored value and when it expires (epoch seconds), or None if it doesn't"""
+
+    value: Any
+    expires_at: Optional[float] = None
+
+
+def worker_id() -> str:
+    """Identity of this proxy worker among the ones sharing a store"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class MemoryStore:
+    """State kept in this process's memory, the default for a single proxy worker
+
+    Entries live in namespaces, each ordered by when its entries were last written, and
+    expire at an optional time. Slots are counters bounded by a limit the caller passes.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self.worker = worker_id()
+        self._lock = threading.Lock()
+        self._entries: Dict[str, "collections.OrderedDict[str, Entry]"] = collections.defaultdict(
+            collections.OrderedDict
+        )
+        self._slots: Dict[str, int] = collections.defaultdict(int)
+        self._writes = 0
+
+    def get(self, namespace: str, key: str) -> Optional[Entry]:
+        """The entry stored under a key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries[namespace].get(key)
+            if entry is not None and _expired(entry.expires_at, time.time()):
+                del self._entries[namespace][key]
+                return None
+            return entry
+
+    def set(self, namespace: str, key: str, value: Any, expires_at: Optional[float] = None) -> None:
+        """Store a value, making it the most recently written entry of its namespace"""
+        with self._lock:
+            entries = self._entries[namespace]
+            entries.pop(key, None)
+            entries[key] = Entry(value, expires_at)
+            self._writes += 1
+            if self._writes % PURGE_INTERVAL == 0:
+                self._purge(time.time())
+
+    def pop(self, namespace: str, key: str) -> Optional[Entry]:
+        """Remove and return the entry stored under a key; only one caller gets it"""
+        with self._lock:
+            entry = self._entries[namespace].pop(key, None)
+            if entry is not None and _expired(entry.expires_at, time.time()):
+                return None
+            return entry
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        """Every unexpired value of a namespace"""
+        now = time.time()
+        with self._lock:
+            return {
+                key: entry.value
+                for key, entry in self._entries[namespace].items()
+                if not _expired(entry.expires_at, now)
+            }
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return len(self._entries[namespace])
+
+    def trim(self, namespace: str, max_entries: int) -> List[str]:
+        """Remove the least recently written entries beyond ``max_entries``; returns their keys"""
+        evicted = []
+        with self._lock:
+            entries = self._entries[namespace]
+            while len(entries) > max_entries:
+                evicted.append(entries.popitem(last=False)[0])
+        return evicted
+
+    def clear(self, namespace: str) -> None:
+        with self._lock:
+            self._entries[namespace].clear()
+
+    def acquire_slot(self, name: str, limit: int) -> bool:
+        """Take one of ``limit`` slots, or return False if all are taken"""
+        with self._lock:
+            if self._slots[name] >= limit:
+                return False
+            self._slots[name] += 1
+            return True
+
+    def release_slot(self, name: str) -> None:
+        with self._lock:
+            self._slots[name] = max(0, self._slots[name] - 1)
+
+    def slots(self, name: str) -> int:
+        """Number of slots taken"""
+        return self._slots[name]
+
+    def close(self) -> None:
+        pass
+
+    def _purge(self, now: float) -> None:
+        for entries in self._entries.values():
+            for key in [k for k, e in entries.items() if _expired(e.expires_at, now)]:
+                del entries[key]
+
+
+class SqliteStore:
+    """State in a sqlite file shared by every proxy worker on a host
+
+    A stand-in for a distributed backend: workers started with ``litellm --num_workers``,
+    or containers mounting the same volume, see the same entries and slots. Read-modify-write
+    operations run in immediate transactions, so a slot or a claimed entry goes to exactly
+    one worker. Slots are counted per worker, and the slots of a worker that died without
+    releasing them are reclaimed.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.worker = worker_id()
+        self._host, self._pid = socket.gethostname(), os.getpid()
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            path, timeout=BUSY_TIMEOUT, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+            "value TEXT NOT NULL, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS slots (name TEXT NOT NULL, host TEXT NOT NULL, "
+            "pid INTEGER NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (name, host, pid))"
+        )
+        # Left over from an earlier worker with the same pid
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM slots WHERE host = ? AND pid = ?", (self._host, self._pid)
+            )
+
+    def get(self, namespace: str, key: str) -> Optional[Entry]:
+        """The entry stored under a key, or None if it is missing or expired"""
+        with self._lock:
+            return self._get(namespace, key)
+
+    def set(self, namespace: str, key: str, value: Any, expires_at: Optional[float] = None) -> None:
+        """Store a value, making it the most recently written entry of its namespace"""
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            # REPLACE deletes the old row, so rowid order is write order
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (namespace, key, data, expires_at),
+            )
+            self._writes += 1
+            if self._writes % PURGE_INTERVAL == 0:
+                self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+
+    def pop(self, namespace: str, key: str) -> Optional[Entry]:
+        """Remove and return the entry stored under a key; only one worker gets it"""
+        with self._lock, self._transaction():
+            entry = self._get(namespace, key)
+            self._db.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+        return entry
+
+    def items(self, namespace: str) -> Dict[str, Any]:
+        """Every unexpired value of a namespace"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, value FROM entries WHERE namespace = ? "
+                "AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time()),
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)
+            ).fetchone()
+        return row[0]
+
+    def trim(self, namespace: str, max_entries: int) -> List[str]:
+        """Remove the least recently written entries beyond ``max_entries``; returns their keys"""
+        with self._lock, self._transaction():
+            rows = self._db.execute(
+                "SELECT rowid, key FROM entries WHERE namespace = ? ORDER BY rowid "
+                "LIMIT max(0, (SELECT COUNT(*) FROM entries WHERE namespace = ?) - ?)",
+                (namespace, namespace, max_entries),
+            ).fetchall()
+            self._db.executemany("DELETE FROM entries WHERE rowid = ?", [(r[0],) for r in rows])
+        return [row[1] for row in rows]
+
+    def clear(self, namespace: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    def acquire_slot(self, name: str, limit: int) -> bool:
+        """Take one of ``limit`` slots shared by every worker, or return False if all are taken"""
+        with self._lock:
+            # Read-only check first, so waiters polling a full store don't take the write lock
+            if self._count_slots(name) >= limit and not self._dead_workers(name):
+                return False
+            with self._transaction():
+                for pid in self._dead_workers(name):
+                    logger.warning(f"Reclaiming {name} slots of worker {pid}, which has exited")
+                    self._db.execute(
+                        "DELETE FROM slots WHERE name = ? AND host = ? AND pid = ?",
+                        (name, self._host, pid),
+                    )
+                if self._count_slots(name) >= limit:
+                    return False
+                self._db.execute(
+                    "INSERT INTO slots (name, host, pid, count) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT (name, host, pid) DO UPDATE SET count = count + 1",
+                    (name, self._host, self._pid),
+                )
+        return True
+
+    def release_slot(self, name: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE slots SET count = max(0, count - 1) WHERE name = ? AND host = ? AND pid = ?",
+                (name, self._host, self._pid),
+            )
+
+    def slots(self, name: str) -> int:
+        """Number of slots taken by every worker"""
+        with self._lock:
+            return self._count_slots(name)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM slots WHERE host = ? AND pid = ?", (self._host, self._pid)
+            )
+            self._db.close()
+
+    def _get(self, namespace: str, key: str) -> Optional[Entry]:
+        row = self._db.execute(
+            "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time()),
+        ).fetchone()
+        return None if row is None else Entry(json.loads(row[0]), row[1])
+
+    def _count_slots(self, name: str) -> int:
+        row = self._db.execute("SELECT SUM(count) FROM slots WHERE name = ?", (name,)).fetchone()
+        return row[0] or 0
+
+    def _dead_workers(self, name: str) -> List[int]:
+        """Workers on this host holding slots that have exited without releasing them"""
+        # Only processes on this host can be checked; a distributed backend would use leases
+        rows = self._db.execute(
+            "SELECT pid FROM slots WHERE name = ? AND host = ? AND count > 0",
+            (name, self._host),
+        ).fetchall()
+        return [pid for (pid,) in rows if not _is_alive(pid)]
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # Immediate: other workers wait to write until it ends
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+
+StateStore = Union[MemoryStore, SqliteStore]
+
+# URL schemes of CLAUDE_CODE_STATE_STORE, each with a factory taking the rest of the URL
+STORE_BACKENDS: Dict[str, Callable[[str], StateStore]] = {
+    "memory": lambda _: MemoryStore(),
+    "sqlite": SqliteStore,
+}
+
+
+def open_store(url: Optional[str]) -> StateStore:
+    """Open the store a URL names: ``memory`` (or nothing) or ``sqlite:<path>``
+
+    Raises:
+        ValueError: the URL's scheme isn't one of STORE_BACKENDS
+    """
+    scheme, _, rest = (url or "memory").partition(":")
+    backend = STORE_BACKENDS.get(scheme)
+    if backend is None:
+        raise ValueError(
+            f"Unknown state store {url!r}; expected one of {', '.join(sorted(STORE_BACKENDS))}"
+        )
+    # sqlite:///abs/path and sqlite:relative/path both name a file
+    return backend(rest[2:] if rest.startswith("///") else rest)
+
+
+def store_from_env() -> StateStore:
+    """Open the store CLAUDE_CODE_STATE_STORE names, by default this process's memory"""
+    store = open_store(os.environ.get("CLAUDE_CODE_STATE_STORE"))
+    if store.shared:
+        logger.info(f"Sharing claude-code state with other workers through {store.path}")
+    return store
+
+
+def _expired(expires_at: Optional[float], now: float) -> bool:
+    return expires_at is not None and expires_at <= now
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
@@ -0,0 +1,198 @@
+import json
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import jsonschema
+
+from claude_code_server.errors import INVALID_OUTPUT, ClaudeCodeError
+
+# Properties of the structured output when the answer may call functions
+CONTENT = "content"
+TOOL_CALLS = "tool_calls"
+
+
+class OutputFormat(NamedTuple):
+    """The shape a request wants its answer in: JSON matching a schema, function calls, or both
+
+    Built from the OpenAI ``response_format``, ``tools`` and ``tool_choice`` params. The
+    claude CLI enforces ``schema`` through ``--json-schema`` and reports the value in the
+    result event's ``structured_output``, which ``parse`` maps back to the content and
+    ``tool_calls`` of an OpenAI message. claude-code never runs the functions itself: the
+    client does and sends the results back as ``tool`` messages.
+    """
+
+    # JSON Schema the content must match, or None for free text
+    content_schema: Optional[Dict[str, Any]] = None
+    # OpenAI function definitions the answer may call
+    tools: Tuple[Dict[str, Any], ...] = ()
+    # tool_choice "required" or a named function: the answer must call one
+    require_call: bool = False
+    # parallel_tool_calls false: the answer calls one function at most
+    single_call: bool = False
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any]) -> Optional["OutputFormat"]:
+        """Read the format from a request's optional_params, or None for a plain text answer
+
+        Raises:
+            ValueError: a tool isn't a function, tool_choice names an unknown function, or
+                response_format has no schema
+        """
+        content_schema = _content_schema(params.get("response_format"))
+        tools, require_call = _tools(params.get("tools"), params.get("tool_choice"))
+        if content_schema is None and not tools:
+            return None
+        return cls(
+            content_schema,
+            tools,
+            require_call,
+            single_call=params.get("parallel_tool_calls") is False,
+        )
+
+    @property
+    def schema(self) -> Dict[str, Any]:
+        """JSON Schema of the structured output claude-code is asked for"""
+        if not self.tools:
+            return self.content_schema
+
+        calls: Dict[str, Any] = {
+            "type": "array",
+            "items": {"anyOf": [_call_schema(tool["function"]) for tool in self.tools]},
+        }
+        if self.require_call:
+            calls["minItems"] = 1
+        if self.single_call:
+            calls["maxItems"] = 1
+        return {
+            "type": "object",
+            "properties": {
+                CONTENT: self.content_schema or {"type": "string"},
+                TOOL_CALLS: calls,
+            },
+            "required": [TOOL_CALLS] if self.require_call else [],
+            "additionalProperties": False,
+        }
+
+    @property
+    def args(self) -> List[str]:
+        return ["--json-schema", json.dumps(self.schema, ensure_ascii=False)]
+
+    @property
+    def instructions(self) -> Optional[str]:
+        """System prompt lines telling the model how to call the client's functions"""
+        if not self.tools:
+            return None
+        names = ", ".join(tool["function"]["name"] for tool in self.tools)
+        return (
+            f"The client application can run these functions for you: {names}. To call them, "
+            f"list the calls in {TOOL_CALLS} of your structured output instead of answering in "
+            f"{CONTENT}; don't try to run them yourself. Their results arrive in the next "
+            "message."
+        )
+
+    def parse(self, result_event: Dict[str, Any]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """The content and OpenAI tool_calls carried by a result event's structured output
+
+        Raises:
+            ClaudeCodeError: the answer isn't JSON or doesn't match the schema
+        """
+        if "structured_output" in result_event:
+            value = result_event["structured_output"]
+        else:
+            # The CLI reported the answer as text only
+            value = extract_json(str(result_event.get("result") or ""))
+        try:
+            jsonschema.validate(value, self.schema)
+        except jsonschema.ValidationError as e:
+            raise ClaudeCodeError(
+                f"claude-code answer doesn't match the requested schema: {e.message}",
+                INVALID_OUTPUT,
+            )
+
+        if not self.tools:
+            return _dump(value), []
+
+        content = value.get(CONTENT)
+        if content is not None and self.content_schema is not None:
+            content = _dump(content)
+        tool_calls = [
+            {
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": _dump(call["arguments"])},
+            }
+            for call in value.get(TOOL_CALLS) or []
+        ]
+        return content, tool_calls
+
+
+def extract_json(text: str) -> Any:
+    """The first JSON object or array in a text answer, which may wrap it in prose or a
+    code fence
+
+    Raises:
+        ClaudeCodeError: the text holds no JSON value
+    """
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    decoder = json.JSONDecoder()
+    for start, char in enumerate(text):
+        if char in "{[":
+            try:
+                return decoder.raw_decode(text, start)[0]
+            except json.JSONDecodeError:
+                continue
+    raise ClaudeCodeError("claude-code answer is not JSON", INVALID_OUTPUT)
+
+
+def _content_schema(response_format: Any) -> Optional[Dict[str, Any]]:
+    if not response_format or response_format.get("type") == "text":
+        return None
+    if response_format.get("type") == "json_object":
+        return {"type": "object"}
+    if response_format.get("type") == "json_schema":
+        schema = (response_format.get("json_schema") or {}).get("schema")
+        if not isinstance(schema, dict):
+            raise ValueError("response_format json_schema must carry a schema")
+        return schema
+    raise ValueError(f"Unsupported response_format type: {response_format.get('type')!r}")
+
+
+def _tools(tools: Any, tool_choice: Any) -> Tuple[Tuple[Dict[str, Any], ...], bool]:
+    """The function definitions an answer may call, and whether it must call one"""
+    if not tools or tool_choice == "none":
+        return (), False
+    if any(tool.get("type") != "function" for tool in tools):
+        raise ValueError("Only function tools are supported")
+
+    if isinstance(tool_choice, dict):
+        name = (tool_choice.get("function") or {}).get("name")
+        chosen = tuple(tool for tool in tools if tool["function"].get("name") == name)
+        if not chosen:
+            raise ValueError(f"tool_choice names a function that isn't in tools: {name!r}")
+        return chosen, True
+    return tuple(tools), tool_choice == "required"
+
+
+def _call_schema(function: Dict[str, Any]) -> Dict[str, Any]:
+    """Schema of one call to a function"""
+    schema = {
+        "type": "object",
+        "properties": {
+            "name": {"const": function["name"]},
+            "arguments": function.get("parameters") or {"type": "object"},
+        },
+        "required": ["name", "arguments"],
+        "additionalProperties": False,
+    }
+    if function.get("description"):
+        schema["description"] = function["description"]
+    return schema
+
+
+def _dump(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
@@ -0,0 +1,197 @@
+import atexit
+import base64
+import binascii
+import collections
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional
+
+from claude_code_server.config import get_env_int
+
+logger = logging.getLogger(__name__)
+
+# tmpfs on most Linux hosts and containers, so workspaces never touch a slow disk
+SHM_ROOT = "/dev/shm"
+
+# Directory inside a workspace that request attachments are written to
+ATTACHMENTS_DIR = "attachments"
+
+DATA_URL_PATTERN = re.compile(r"^data:(?P<type>[\w.+-]+/[\w.+-]+)?(?:;[^,]*)?;base64,", re.DOTALL)
+
+
+class Attachment(NamedTuple):
+    """A file sent with a request, written into the workspace claude-code runs in"""
+
+    name: str
+    data: bytes
+
+    @property
+    def path(self) -> str:
+        """Where the file is found, relative to the workspace"""
+        return f"{ATTACHMENTS_DIR}/{self.name}"
+
+
+def parse_attachment(part: Dict[str, Any]) -> Optional[Attachment]:
+    """The file carried by an OpenAI message content part, or None for a part without one
+
+    Handles ``file`` parts with inline ``file_data`` and ``image_url`` parts with a data URL.
+
+    Raises:
+        ValueError: the part refers to a file by id or URL, or its data isn't valid base64
+    """
+    if part.get("type") == "file":
+        file = part.get("file") or {}
+        if not file.get("file_data"):
+            raise ValueError("Only file parts with inline file_data are supported")
+        data_url, filename = file["file_data"], file.get("filename")
+    elif part.get("type") == "image_url":
+        image_url = part.get("image_url")
+        data_url = image_url.get("url", "") if isinstance(image_url, dict) else image_url or ""
+        if not data_url.startswith("data:"):
+            raise ValueError("Only image_url parts with a base64 data URL are supported")
+        filename = None
+    else:
+        return None
+
+    match = DATA_URL_PATTERN.match(data_url)
+    try:
+        data = base64.b64decode(data_url[match.end() :] if match else data_url, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError(f"Attachment {filename or part.get('type')} is not valid base64")
+
+    name = _safe_name(filename)
+    if name is None:
+        mime_type = match.group("type") if match else None
+        extension = mimetypes.guess_extension(mime_type or "") or ""
+        name = f"file-{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+    return Attachment(name, data)
+
+
+def attachment_note(attachments: List[Attachment]) -> str:
+    """Lines appended to a prompt telling claude-code where a request's files are"""
+    paths = "\n".join(f"- {attachment.path}" for attachment in attachments)
+    return f"Files attached to this conversation, relative to the working directory:\n{paths}"
+
+
+def _safe_name(filename: Optional[str]) -> Optional[str]:
+    """A client-supplied file name reduced to one path component, or None if nothing is left"""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name if name not in ("", ".", "..") else None
+
+
+class WorkspacePool:
+    """Scratch working directories for claude-code children, emptied and reused
+
+    Each execution runs in a workspace of its own, so concurrent jobs can't see or clobber
+    each other's files. ``size`` directories are created under ``root`` up front; when all
+    are in use another one is added. A released workspace is emptied and handed out again,
+    most recently used first.
+
+    claude-code keeps a session's transcript under the directory it ran in, so a resumed
+    session asks for the workspace it was created in.
+    """
+
+    def __init__(self, root: str, size: int):
+        self.root = root
+        self._lock = threading.Lock()
+        self._idle: Deque[str] = collections.deque()
+        self._created = 0
+        os.makedirs(root, mode=0o700, exist_ok=True)
+        for _ in range(size):
+            self._idle.append(self._create())
+
+    @classmethod
+    def from_env(cls) -> Optional["WorkspacePool"]:
+        """Create a pool if CLAUDE_CODE_WORKSPACE_POOL_SIZE is set, or return None
+
+        Workspaces live under CLAUDE_CODE_WORKSPACE_ROOT, by default on /dev/shm when it
+        exists and in the temp directory otherwise, in a directory per proxy process that is
+        removed when the process exits.
+        """
+        size = get_env_int("CLAUDE_CODE_WORKSPACE_POOL_SIZE", 0)
+        if size <= 0:
+            return None
+
+        base = os.environ.get("CLAUDE_CODE_WORKSPACE_ROOT") or (
+            SHM_ROOT if os.path.isdir(SHM_ROOT) else tempfile.gettempdir()
+        )
+        root = os.path.join(base, f"claude-code-workspaces-{os.getpid()}")
+        pool = cls(root, size)
+        atexit.register(pool.close)
+        logger.info(f"Running claude-code in {size} pooled workspaces under {root}")
+        return pool
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    def path(self, name: str) -> str:
+        """Absolute path of a workspace"""
+        return os.path.join(self.root, name)
+
+    def acquire(self, preferred: Optional[str] = None) -> str:
+        """Take a workspace: ``preferred`` if it is free, else the most recently used one"""
+        with self._lock:
+            if preferred is not None and preferred in self._idle:
+                self._idle.remove(preferred)
+                return preferred
+            if self._idle:
+                return self._idle.pop()
+            return self._create()
+
+    def release(self, name: str) -> None:
+        """Empty a workspace and return it to the pool"""
+        try:
+            self._reset(name)
+        except OSError as e:
+            # Leave it out of the pool rather than hand its leftovers to another request
+            logger.error(f"Failed to reset workspace {name}; dropping it: {e}")
+            return
+
+        with self._lock:
+            self._idle.append(name)
+
+    @contextmanager
+    def lease(self, preferred: Optional[str] = None) -> Iterator[str]:
+        name = self.acquire(preferred)
+        try:
+            yield name
+        finally:
+            self.release(name)
+
+    def write_attachments(self, name: str, attachments: List[Attachment]) -> None:
+        """Write a request's attachments into its workspace"""
+        if not attachments:
+            return
+        directory = os.path.join(self.path(name), ATTACHMENTS_DIR)
+        os.makedirs(directory, exist_ok=True)
+        for attachment in attachments:
+            with open(os.path.join(directory, attachment.name), "wb") as f:
+                f.write(attachment.data)
+
+    def close(self) -> None:
+        """Remove every workspace"""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _create(self) -> str:
+        name = f"ws-{self._created}"
+        self._created += 1
+        os.makedirs(self.path(name), mode=0o700, exist_ok=True)
+        # Left over from an earlier process with the same pid
+        self._reset(name)
+        return name
+
+    def _reset(self, name: str) -> None:
+        with os.scandir(self.path(name)) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
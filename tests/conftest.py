@@ -1,15 +1,39 @@
-from unittest.mock import MagicMock
+import json
+import os
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 
+from claude_code_server.store import SqliteStore
+
+
+@pytest.fixture(autouse=True)
+def no_startup_checks(monkeypatch):
+    """Keep providers created in tests from running the real claude CLI at startup"""
+    monkeypatch.setenv("CLAUDE_CODE_STARTUP_CHECKS", "false")
+
+
+@pytest.fixture
+def worker_stores(tmp_path, monkeypatch):
+    """Two SqliteStores on one file, as two proxy workers would open it"""
+    path = str(tmp_path / "state.sqlite3")
+    first = SqliteStore(path)
+    with monkeypatch.context() as m:
+        # The other worker needs a pid of its own that is alive
+        m.setattr(os, "getpid", os.getppid)
+        second = SqliteStore(path)
+    yield first, second
+    second.close()
+    first.close()
+
 
 @pytest.fixture
 def mock_subprocess_run(mocker):
-    """Mock subprocess.run for claude-code execution"""
+    """Mock run_process for claude-code execution"""
     # Also mock shutil.which to return a valid path
     mocker.patch("shutil.which", return_value="/usr/local/bin/claude")
     
-    mock = mocker.patch("subprocess.run")
+    mock = mocker.patch("claude_code_server.provider.run_process")
     result_mock = MagicMock()
     result_mock.stdout = "Hello from claude-code!"
     result_mock.stderr = ""
@@ -42,3 +66,97 @@ def sample_openai_request():
         "temperature": 0.7,
         "max_tokens": 100,
     }
+
+
+def mock_pipe_read(*chunks):
+    """Mock StreamReader.read returning ``chunks`` and then EOF, again for every execution"""
+    pending = []
+
+    def read(*args):
+        if not pending:
+            pending.extend([*chunks, b""])
+        return pending.pop(0)
+
+    return AsyncMock(side_effect=read)
+
+
+@pytest.fixture
+def mock_create_subprocess_exec(mocker):
+    """Mock asyncio.create_subprocess_exec for async claude-code execution"""
+    # Also mock shutil.which to return a valid path
+    mocker.patch("shutil.which", return_value="/usr/local/bin/claude")
+
+    process_mock = MagicMock()
+    process_mock.stdin.drain = AsyncMock()
+    process_mock.stdout.read = mock_pipe_read(b"Hello from claude-code!")
+    process_mock.stderr.read = mock_pipe_read()
+    process_mock.wait = AsyncMock(return_value=0)
+    process_mock.returncode = 0
+
+    mock = mocker.patch("asyncio.create_subprocess_exec", new=AsyncMock(return_value=process_mock))
+    return mock
+
+
+@pytest.fixture
+def stream_json_lines():
+    """Sample claude-code stream-json output"""
+    events = [
+        {"type": "system", "subtype": "init", "session_id": "session-1"},
+        {
+            "type": "stream_event",
+            "event": {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Hello "}},
+        },
+        {
+            "type": "stream_event",
+            "event": {
+                "type": "content_block_delta",
+                "delta": {"type": "text_delta", "text": "from claude-code!"},
+            },
+        },
+        {
+            "type": "assistant",
+            "message": {"content": [{"type": "text", "text": "Hello from claude-code!"}]},
+        },
+        {
+            "type": "result",
+            "subtype": "success",
+            "is_error": False,
+            "result": "Hello from claude-code!",
+            "session_id": "session-1",
+            "duration_ms": 1500,
+            "num_turns": 1,
+            "total_cost_usd": 0.0012,
+            "usage": {
+                "input_tokens": 3,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 12,
+                "output_tokens": 6,
+            },
+        },
+    ]
+    return [(json.dumps(event) + "\n").encode() for event in events]
+
+
+@pytest.fixture
+def mock_popen_stream(mocker, stream_json_lines):
+    """Mock subprocess.Popen for claude-code stream-json execution"""
+    # Also mock shutil.which to return a valid path
+    mocker.patch("shutil.which", return_value="/usr/local/bin/claude")
+
+    process_mock = MagicMock()
+    process_mock.stdout = iter(stream_json_lines)
+    process_mock.stderr.read.return_value = b""
+    process_mock.wait.return_value = 0
+    process_mock.poll.return_value = 0
+    process_mock.returncode = 0
+
+    return mocker.patch("subprocess.Popen", return_value=process_mock)
+
+
+@pytest.fixture
+def mock_create_subprocess_stream(mock_create_subprocess_exec, stream_json_lines):
+    """Mock asyncio.create_subprocess_exec for claude-code stream-json execution"""
+    process_mock = mock_create_subprocess_exec.return_value
+    process_mock.stdout.readline = AsyncMock(side_effect=stream_json_lines + [b""])
+    process_mock.stderr.read = mock_pipe_read()
+    return mock_create_subprocess_exec
@@ -0,0 +1,359 @@
+import asyncio
+import subprocess
+import threading
+import time
+
+import pytest
+
+from claude_code_server.admission import (
+    BATCH,
+    INTERACTIVE,
+    AdmissionController,
+    AdmissionRejectedError,
+    Ticket,
+    parse_priority,
+)
+from claude_code_server.process import run_process, watch_children
+
+
+class TestAdmissionController:
+    """AdmissionControllerクラスのユニットテスト"""
+
+    def test_acquire_同時実行数に空きがある場合_待たずにスロットが取得できること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        controller = AdmissionController(max_concurrency=2)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        controller.acquire("key-a")
+        controller.acquire("key-b")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert controller.active == 2
+        assert controller.queued == 0
+
+    def test_acquire_待ち行列が満杯の場合_Retry_After付きの429で即座に拒否されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        controller = AdmissionController(max_concurrency=1, max_queue=0)
+        controller.acquire("key-a")
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(AdmissionRejectedError) as exc_info:
+            controller.acquire("key-a")
+
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.headers["retry-after"] == str(exc_info.value.retry_after)
+        assert exc_info.value.retry_after >= 1
+
+    def test_acquire_待ち時間が期限を超えた場合_429で拒否され待ち行列から外れること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        controller = AdmissionController(max_concurrency=1, queue_timeout=0.05)
+        controller.acquire("key-a")
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(AdmissionRejectedError, match="timed out waiting in queue"):
+            controller.acquire("key-b")
+
+        assert controller.queued == 0
+
+    def test_release_別スレッドが待機している場合_スロットが引き渡されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        controller = AdmissionController(max_concurrency=1)
+        controller.acquire("key-a")
+
+        admitted = threading.Event()
+
+        def worker():
+            controller.acquire("key-b", timeout=5)
+            admitted.set()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        while controller.queued == 0:
+            pass
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        controller.release(duration=0.1)
+        thread.join(timeout=5)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert admitted.is_set()
+        assert controller.active == 1
+        assert controller.queued == 0
+
+    @pytest.mark.asyncio
+    async def test_release_複数キーが待機している場合_重み付きラウンドロビンで割り当てられること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        controller = AdmissionController(max_concurrency=1, key_weights={"heavy": 2})
+        await controller.aacquire("holder")
+
+        order = []
+
+        async def request(key, name):
+            await controller.aacquire(key, timeout=5)
+            order.append(name)
+
+        tasks = []
+        for key, name in [("heavy", "h1"), ("heavy", "h2"), ("heavy", "h3"), ("light", "l1"), ("light", "l2")]:
+            tasks.append(asyncio.create_task(request(key, name)))
+            await asyncio.sleep(0)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        for _ in tasks:
+            controller.release()
+            await asyncio.sleep(0.01)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert order == ["h1", "h2", "l1", "h3", "l2"]
+        await asyncio.gather(*tasks)
+
+    @pytest.mark.asyncio
+    async def test_aacquire_待機中にキャンセルされた場合_待ち行列から外れること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        controller = AdmissionController(max_concurrency=1)
+        await controller.aacquire("key-a")
+
+        task = asyncio.create_task(controller.aacquire("key-b"))
+        await asyncio.sleep(0)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert controller.queued == 0
+        controller.release()
+        assert controller.active == 0
+
+    def test_from_env_同時実行数が未設定の場合_Noneが返されること(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.delenv("CLAUDE_CODE_MAX_CONCURRENCY", raising=False)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert AdmissionController.from_env() is None
+
+    def test_from_env_環境変数が設定されている場合_設定値で作成されること(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.setenv("CLAUDE_CODE_MAX_CONCURRENCY", "8")
+        monkeypatch.setenv("CLAUDE_CODE_MAX_QUEUE", "50")
+        monkeypatch.setenv("CLAUDE_CODE_QUEUE_TIMEOUT", "15")
+        monkeypatch.setenv("CLAUDE_CODE_KEY_WEIGHTS", '{"batch": 1, "chat": 4}')
+        monkeypatch.setenv("CLAUDE_CODE_RESERVED_SLOTS", "2")
+        monkeypatch.setenv("CLAUDE_CODE_PREEMPT", "true")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        controller = AdmissionController.from_env()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert controller.max_concurrency == 8
+        assert controller.max_queue == 50
+        assert controller.queue_timeout == 15.0
+        assert controller.key_weights == {"batch": 1, "chat": 4}
+        assert controller.reserved_slots == 2
+        assert controller.preempt is True
+
+    def test_acquire_別のワーカーとストアを共有している場合_全体の同時実行数で制限されること(self, worker_stores):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        first = AdmissionController(max_concurrency=1, store=worker_stores[0])
+        second = AdmissionController(max_concurrency=1, store=worker_stores[1])
+        first.acquire("key-a")
+
+        admitted = threading.Event()
+
+        def worker():
+            second.acquire("key-b", timeout=5)
+            admitted.set()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        while second.queued == 0:
+            pass
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        held = admitted.wait(0.2)
+        first.release(duration=0.1)
+        thread.join(timeout=5)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert held is False
+        assert admitted.is_set()
+        assert first.active == 0
+        assert second.active == 1
+
+    def test_acquire_予約スロットがある場合_バッチは予約分を使わず対話的なリクエストは使えること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        controller = AdmissionController(max_concurrency=2, queue_timeout=0.05, reserved_slots=1)
+        controller.acquire("batch", priority=BATCH)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(AdmissionRejectedError, match="timed out waiting in queue"):
+            controller.acquire("batch", priority=BATCH)
+
+        controller.acquire("chat", priority=INTERACTIVE)
+        assert controller.active == 2
+
+    @pytest.mark.asyncio
+    async def test_release_両方の優先度が待機している場合_対話的なリクエストに先に引き渡されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        controller = AdmissionController(max_concurrency=1)
+        await controller.aacquire("holder")
+
+        order = []
+
+        async def request(key, priority):
+            await controller.aacquire(key, timeout=5, priority=priority)
+            order.append(key)
+
+        tasks = []
+        for key, priority in [("b1", BATCH), ("b2", BATCH), ("i1", INTERACTIVE)]:
+            tasks.append(asyncio.create_task(request(key, priority)))
+            await asyncio.sleep(0)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        for _ in tasks:
+            controller.release()
+            await asyncio.sleep(0.01)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert order == ["i1", "b1", "b2"]
+        await asyncio.gather(*tasks)
+
+    def test_acquire_プリエンプションが有効な場合_最後に実行を始めたバッチの子プロセスが停止されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        controller = AdmissionController(max_concurrency=2, preempt=True)
+        older = controller.acquire("batch", priority=BATCH)
+        newer = controller.acquire("batch", priority=BATCH)
+
+        failed = threading.Event()
+
+        def run_batch():
+            # 管理対象の子プロセスとして実行中のバッチ
+            with watch_children(newer.adopt):
+                try:
+                    run_process(["sleep", "30"])
+                except subprocess.CalledProcessError:
+                    failed.set()
+            controller.release(ticket=newer)
+
+        thread = threading.Thread(target=run_batch)
+        thread.start()
+        while not newer._children:
+            time.sleep(0.01)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        started = time.monotonic()
+        controller.acquire("chat", timeout=5, priority=INTERACTIVE)
+        thread.join(timeout=5)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert failed.is_set()
+        assert time.monotonic() - started < 5
+        assert newer.preempted is True
+        assert older.preempted is False
+        assert controller.active == 2
+
+
+class TestTicket:
+    """Ticketクラスのユニットテスト"""
+
+    def test_adopt_プリエンプション後に子プロセスを起動した場合_すぐに停止されること(self, mocker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        interrupt = mocker.patch("claude_code_server.admission.interrupt_child")
+        ticket = Ticket("batch", BATCH)
+        ticket.preempt()
+        process = mocker.MagicMock(returncode=None)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        ticket.adopt(process)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        interrupt.assert_called_once_with(process)
+
+
+class TestParsePriority:
+    """parse_priority関数のユニットテスト"""
+
+    def test_parse_priority_大文字や空白を含む場合_優先度クラスが返されること(self):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert parse_priority(" Batch ") == BATCH
+        assert parse_priority("") is None
+        assert parse_priority(None) is None
+
+    def test_parse_priority_未知の値の場合_ValueErrorが発生すること(self):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(ValueError, match="Unknown priority class"):
+            parse_priority("urgent")
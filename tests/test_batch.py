@@ -0,0 +1,295 @@
+import json
+import sys
+import time
+import types
+
+import pytest
+from litellm import Choices, Message, ModelResponse
+from openai import OpenAI
+
+from claude_code_server.batch import BatchRunner, BatchServer, BatchStore
+from claude_code_server.models import ModelRegistry
+
+# バッチの行のmodelはmodel_listのmodel_nameで指定される
+MODELS = ModelRegistry(
+    [
+        {
+            "model_name": "claude-sonnet-4",
+            "litellm_params": {"model": "claude-code-server/claude-code"},
+            "model_info": {"id": "sonnet-deployment"},
+        },
+        {
+            "model_name": "claude-haiku",
+            "litellm_params": {"model": "claude-code-server/haiku", "max_turns": 1},
+            "model_info": {"id": "haiku-deployment"},
+        },
+    ]
+)
+
+
+def echo_completion(model, messages, **kwargs):
+    """Stand-in for ClaudeCodeProvider.completion that echoes the last message"""
+    content = messages[-1]["content"]
+    if content == "fail":
+        raise RuntimeError("claude-code failed: boom")
+    message = Message(content=f"echo: {content}", role="assistant")
+    return ModelResponse(choices=[Choices(index=0, message=message, finish_reason="stop")])
+
+
+def batch_line(custom_id, content, model="claude-sonnet-4"):
+    body = {"model": model, "messages": [{"role": "user", "content": content}]}
+    request = {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions"}
+    return json.dumps({**request, "body": body}) + "\n"
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestBatchRunner:
+    """BatchRunnerクラスのユニットテスト"""
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        store = BatchStore(str(tmp_path))
+        yield store
+        store.close()
+
+    def test_submit_バッチを実行した場合_成功と失敗がそれぞれのファイルに書き出されること(self, store):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        content = batch_line("a", "hello") + batch_line("b", "fail") + "not json\n"
+        file = store.create_file("input.jsonl", "batch", content.encode("utf-8"))
+        batch = store.create_batch(file["id"], "/v1/chat/completions", "24h")
+        runner = BatchRunner(store, echo_completion, parallelism=2, models=MODELS)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        runner.submit(batch["id"])
+        runner.join(batch["id"], timeout=10)
+        runner.close()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        batch = store.get_batch(batch["id"])
+        assert batch["status"] == "completed"
+        assert batch["request_counts"] == {"total": 3, "completed": 1, "failed": 2}
+
+        output = read_jsonl(store.file_path(batch["output_file_id"]))
+        assert output[0]["custom_id"] == "a"
+        assert output[0]["response"]["status_code"] == 200
+        body = output[0]["response"]["body"]
+        assert body["choices"][0]["message"]["content"] == "echo: hello"
+        assert body["model"] == "claude-sonnet-4"
+
+        errors = {e["custom_id"]: e for e in read_jsonl(store.file_path(batch["error_file_id"]))}
+        assert errors["b"]["response"]["status_code"] == 500
+        assert errors["line-3"]["error"]["code"] == "invalid_request"
+
+    def test_resume_途中で停止したバッチの場合_結果のない行だけが実行されること(self, store, mocker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        content = batch_line("a", "first") + batch_line("b", "second") + batch_line("c", "third")
+        file = store.create_file("input.jsonl", "batch", content.encode("utf-8"))
+        batch = store.create_batch(file["id"], "/v1/chat/completions", "24h")
+        output = store.create_file("output.jsonl", "batch_output")
+        errors = store.create_file("error.jsonl", "batch_output")
+        store.update_batch(
+            batch["id"],
+            status="in_progress",
+            output_file_id=output["id"],
+            error_file_id=errors["id"],
+            request_counts={"total": 3, "completed": 1, "failed": 0},
+        )
+        # A crash left one finished result and one half-written line
+        with open(store.file_path(output["id"]), "w") as f:
+            f.write(json.dumps({"custom_id": "a", "response": {"status_code": 200}}) + "\n")
+            f.write('{"custom_id": "b", "resp')
+
+        completion = mocker.Mock(side_effect=echo_completion)
+        runner = BatchRunner(store, completion, parallelism=1, models=MODELS)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        runner.resume()
+        runner.join(batch["id"], timeout=10)
+        runner.close()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        sent = [c.kwargs["messages"][-1]["content"] for c in completion.call_args_list]
+        assert sent == ["second", "third"]
+        lines = read_jsonl(store.file_path(output["id"]))
+        assert [line["custom_id"] for line in lines] == ["a", "b", "c"]
+        assert store.get_batch(batch["id"])["request_counts"]["completed"] == 3
+
+    def test_resume_最後の行がJSONとして完結しているが改行がない場合_その行も実行し直されること(self, store, mocker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        content = batch_line("a", "first") + batch_line("b", "second")
+        file = store.create_file("input.jsonl", "batch", content.encode("utf-8"))
+        batch = store.create_batch(file["id"], "/v1/chat/completions", "24h")
+        output = store.create_file("output.jsonl", "batch_output")
+        errors = store.create_file("error.jsonl", "batch_output")
+        store.update_batch(
+            batch["id"],
+            status="in_progress",
+            output_file_id=output["id"],
+            error_file_id=errors["id"],
+            request_counts={"total": 2, "completed": 1, "failed": 0},
+        )
+        # The crash came after the JSON was written but before its newline
+        with open(store.file_path(output["id"]), "w") as f:
+            f.write(json.dumps({"custom_id": "a", "response": {"status_code": 200}}))
+
+        completion = mocker.Mock(side_effect=echo_completion)
+        runner = BatchRunner(store, completion, parallelism=1, models=MODELS)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        runner.resume()
+        runner.join(batch["id"], timeout=10)
+        runner.close()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        sent = [c.kwargs["messages"][-1]["content"] for c in completion.call_args_list]
+        assert sent == ["first", "second"]
+        lines = read_jsonl(store.file_path(output["id"]))
+        assert [line["custom_id"] for line in lines] == ["a", "b"]
+
+    def test_resume_プロキシのルーターがまだない場合_ルーターができてから実行されること(self, store, mocker, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        content = batch_line("a", "first") + batch_line("b", "second")
+        file = store.create_file("input.jsonl", "batch", content.encode("utf-8"))
+        batch = store.create_batch(file["id"], "/v1/chat/completions", "24h")
+        store.update_batch(batch["id"], status="in_progress")
+        # The proxy imports the provider before it creates llm_router
+        proxy = types.SimpleNamespace(llm_router=None)
+        monkeypatch.setitem(sys.modules, "litellm.proxy.proxy_server", proxy)
+        monkeypatch.setattr("claude_code_server.batch.MODELS_POLL_INTERVAL", 0.01)
+        completion = mocker.Mock(side_effect=echo_completion)
+        runner = BatchRunner(store, completion, parallelism=1, models=ModelRegistry())
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        runner.resume()
+        time.sleep(0.1)
+        called_before_router = completion.called
+        proxy.llm_router = types.SimpleNamespace(model_list=MODELS.model_list)
+        runner.join(batch["id"], timeout=10)
+        runner.close()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert called_before_router is False
+        batch = store.get_batch(batch["id"])
+        assert batch["status"] == "completed"
+        assert batch["request_counts"] == {"total": 2, "completed": 2, "failed": 0}
+
+    def test_submit_モデルの別名を指定した場合_デプロイメントのモデルで実行され未登録のモデルは失敗すること(self, store, mocker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        content = batch_line("a", "hello", model="claude-haiku") + batch_line("b", "hello", model="gpt-4o")
+        file = store.create_file("input.jsonl", "batch", content.encode("utf-8"))
+        batch = store.create_batch(file["id"], "/v1/chat/completions", "24h")
+        completion = mocker.Mock(side_effect=echo_completion)
+        runner = BatchRunner(store, completion, parallelism=1, models=MODELS)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        runner.submit(batch["id"])
+        runner.join(batch["id"], timeout=10)
+        runner.close()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        completion.assert_called_once()
+        call = completion.call_args.kwargs
+        assert call["model"] == "claude-code-server/haiku"
+        assert call["litellm_params"]["metadata"]["model_info"] == {"id": "haiku-deployment"}
+
+        batch = store.get_batch(batch["id"])
+        output = read_jsonl(store.file_path(batch["output_file_id"]))
+        assert output[0]["response"]["body"]["model"] == "claude-haiku"
+        errors = read_jsonl(store.file_path(batch["error_file_id"]))
+        assert errors[0]["custom_id"] == "b"
+        assert errors[0]["error"]["code"] == "model_not_found"
+
+
+class TestBatchServer:
+    """BatchServerクラスのユニットテスト"""
+
+    @pytest.fixture
+    def server(self, tmp_path):
+        runner = BatchRunner(
+            BatchStore(str(tmp_path)), echo_completion, parallelism=2, models=MODELS
+        )
+        server = BatchServer(runner, port=0, host="127.0.0.1", api_key="sk-1234")
+        server.start()
+        yield server
+        server.close()
+
+    def test_batches_OpenAIクライアントで投入した場合_完了後に結果ファイルを取得できること(self, server, tmp_path):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        client = OpenAI(api_key="sk-1234", base_url=f"http://127.0.0.1:{server.port}/v1")
+        input_path = tmp_path / "input.jsonl"
+        input_path.write_text(batch_line("req-1", "hello") + batch_line("req-2", "world"))
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with open(input_path, "rb") as f:
+            file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=file.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        deadline = time.monotonic() + 10
+        while batch.status not in ("completed", "failed") and time.monotonic() < deadline:
+            time.sleep(0.05)
+            batch = client.batches.retrieve(batch.id)
+        content = client.files.content(batch.output_file_id).text
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert batch.status == "completed"
+        assert batch.request_counts.completed == 2
+        results = {r["custom_id"]: r for r in map(json.loads, content.splitlines())}
+        answer = results["req-2"]["response"]["body"]["choices"][0]["message"]["content"]
+        assert answer == "echo: world"
+        assert client.batches.list().data[0].id == batch.id
+
+    def test_batches_APIキーが誤っている場合_401が返されること(self, server):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        client = OpenAI(
+            api_key="wrong", base_url=f"http://127.0.0.1:{server.port}/v1", max_retries=0
+        )
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(Exception) as exc_info:
+            client.batches.list()
+        assert exc_info.value.status_code == 401
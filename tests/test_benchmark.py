@@ -0,0 +1,111 @@
+import pytest
+
+from benchmarks.compare import compare
+from benchmarks.run_benchmark import percentile, write_claude_shim
+from claude_code_server.provider import ClaudeCodeProvider
+
+
+class TestFakeClaude:
+    """ベンチマーク用の偽claude CLIを使ったプロバイダーのテスト"""
+
+    @pytest.fixture
+    def fake_claude(self, tmp_path, monkeypatch):
+        write_claude_shim(tmp_path)
+        monkeypatch.setenv("PATH", str(tmp_path))
+        monkeypatch.setenv("FAKE_CLAUDE_OUTPUT_TOKENS", "3")
+        monkeypatch.setenv("FAKE_CLAUDE_FAILURE_RATE", "0")
+
+    def test_completion_偽CLIの場合_JSON出力から本文と使用量が返されること(self, fake_claude):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        provider = ClaudeCodeProvider()
+        messages = [{"role": "user", "content": "ping pong"}]
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        response = provider.completion("claude-code-server/claude-code", messages)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert response.choices[0].message.content == "ping pong ping"
+        assert response.usage.prompt_tokens == 2
+        assert response.usage.completion_tokens == 3
+
+    @pytest.mark.asyncio
+    async def test_astreaming_偽CLIの場合_トークンごとにチャンクが返されること(self, fake_claude):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        provider = ClaudeCodeProvider()
+        messages = [{"role": "user", "content": "ping pong"}]
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        chunks = [
+            chunk
+            async for chunk in provider.astreaming("claude-code-server/claude-code", messages)
+        ]
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert [chunk["text"] for chunk in chunks[:-1]] == ["ping ", "pong ", "ping "]
+        assert chunks[-1]["is_finished"] is True
+        assert chunks[-1]["usage"]["completion_tokens"] == 3
+
+    def test_completion_失敗率が1の場合_RuntimeErrorが発生すること(self, fake_claude, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.setenv("FAKE_CLAUDE_FAILURE_RATE", "1")
+        provider = ClaudeCodeProvider()
+        messages = [{"role": "user", "content": "ping"}]
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(RuntimeError, match="simulated failure"):
+            provider.completion("claude-code-server/claude-code", messages)
+
+
+class TestBenchmarkReport:
+    """ベンチマーク結果の集計と比較のユニットテスト"""
+
+    def test_percentile_値がある場合_線形補間したパーセンタイルが返されること(self):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert percentile([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+        assert percentile([1.0, 2.0, 3.0, 4.0, 5.0], 95) == pytest.approx(4.8)
+        assert percentile([], 99) is None
+
+    def test_compare_スループットが閾値を超えて低下した場合_リグレッションとして報告されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        base = {
+            "revision": "base",
+            "levels": [
+                {"concurrency": 4, "throughput_rps": 10.0, "latency_seconds": {"p95": 1.0}}
+            ],
+        }
+        head = {
+            "revision": "head",
+            "levels": [
+                {"concurrency": 4, "throughput_rps": 8.0, "latency_seconds": {"p95": 1.05}}
+            ],
+        }
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        _, regressions = compare(base, head, threshold=0.1)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert regressions == ["concurrency=4 throughput_rps -20.0%"]
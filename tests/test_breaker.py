@@ -0,0 +1,150 @@
+import time
+
+import litellm
+import pytest
+
+from claude_code_server.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from claude_code_server.errors import DEADLINE, NETWORK, RATE_LIMITED, ClaudeCodeError
+
+
+def _fail(breaker, error):
+    with pytest.raises(type(error)):
+        with breaker.guard():
+            raise error
+
+
+class TestCircuitBreaker:
+    """CircuitBreakerクラスのユニットテスト"""
+
+    @pytest.fixture
+    def breaker(self):
+        return CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+
+    @pytest.fixture
+    def failure(self):
+        return ClaudeCodeError("claude-code failed: fetch failed", NETWORK)
+
+    def test_guard_連続失敗が閾値に達した場合_開いて503で即座に失敗すること(self, breaker, failure):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        _fail(breaker, failure)
+        _fail(breaker, failure)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with pytest.raises(CircuitOpenError) as exc_info:
+            with breaker.guard():
+                pytest.fail("must not run while the circuit is open")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert breaker.state == OPEN
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers == {"retry-after": "1"}
+        assert isinstance(exc_info.value, litellm.ServiceUnavailableError)
+
+    def test_guard_途中で成功した場合_失敗数がリセットされること(self, breaker, failure):
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        _fail(breaker, failure)
+        with breaker.guard():
+            pass
+        _fail(breaker, failure)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert breaker.state == CLOSED
+
+    def test_guard_リクエスト起因のエラーの場合_失敗として数えられないこと(self, breaker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        error = ClaudeCodeError("claude-code failed: API Error: 429", RATE_LIMITED)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        for _ in range(3):
+            _fail(breaker, error)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert breaker.state == CLOSED
+
+    def test_guard_クライアントの期限によるタイムアウトの場合_失敗として数えられないこと(self, breaker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        error = litellm.Timeout(message="timed out", model="claude-code", llm_provider="claude-code-server")
+        error.kind = DEADLINE
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        for _ in range(3):
+            _fail(breaker, error)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert breaker.state == CLOSED
+
+    def test_guard_リセット時間の経過後_1件だけ試行され成功すると閉じること(self, breaker, failure):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        _fail(breaker, failure)
+        _fail(breaker, failure)
+        time.sleep(0.15)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with breaker.guard():
+            state_while_probing = breaker.state
+            with pytest.raises(CircuitOpenError):
+                breaker.acquire()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert state_while_probing == HALF_OPEN
+        assert breaker.state == CLOSED
+        assert breaker.failures == 0
+
+    def test_guard_試行が失敗した場合_再び開くこと(self, breaker, failure):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        _fail(breaker, failure)
+        _fail(breaker, failure)
+        time.sleep(0.15)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        _fail(breaker, failure)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire()
+
+    def test_from_env_閾値が0の場合_Noneが返されること(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.setenv("CLAUDE_CODE_BREAKER_THRESHOLD", "0")
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert CircuitBreaker.from_env() is None
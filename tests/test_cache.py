@@ -0,0 +1,207 @@
+import pytest
+
+from claude_code_server.cache import ResponseCache, make_cache_key, parse_cache_control
+
+
+class TestCacheKey:
+    """キャッシュキー生成のユニットテスト"""
+
+    def test_make_cache_key_前後の空白だけが異なるメッセージの場合_同じキーになること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        messages_a = [{"role": "user", "content": "Hello, Claude!"}]
+        messages_b = [{"role": "user", "content": "  Hello, Claude!\n", "name": None}]
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert make_cache_key("claude-code", messages_a, {}) == make_cache_key(
+            "claude-code", messages_b, {}
+        )
+
+    def test_make_cache_key_応答に影響するパラメータが異なる場合_別のキーになること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        messages = [{"role": "user", "content": "Hello, Claude!"}]
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert make_cache_key("claude-code", messages, {"max_tokens": 10}) != make_cache_key(
+            "claude-code", messages, {"max_tokens": 20}
+        )
+        assert make_cache_key("claude-code", messages, {"stream": True}) == make_cache_key(
+            "claude-code", messages, {}
+        )
+
+    def test_make_cache_key_デプロイメントのCLIオプションが異なる場合_別のキーになること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        messages = [{"role": "user", "content": "Hello, Claude!"}]
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert make_cache_key(
+            "claude-code", messages, {}, ["--allowedTools", "Read"]
+        ) != make_cache_key("claude-code", messages, {}, ["--allowedTools", "Bash"])
+
+    @pytest.mark.parametrize(
+        "field, value_a, value_b",
+        [
+            ("tool_call_id", "call_1", "call_2"),
+            ("name", "alice", "bob"),
+            (
+                "tool_calls",
+                [{"id": "call_1", "function": {"name": "get_weather", "arguments": "{}"}}],
+                [{"id": "call_1", "function": {"name": "get_time", "arguments": "{}"}}],
+            ),
+        ],
+    )
+    def test_make_cache_key_関数呼び出しや名前が異なるメッセージの場合_別のキーになること(self, field, value_a, value_b):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        messages_a = [{"role": "tool", "content": "sunny", field: value_a}]
+        messages_b = [{"role": "tool", "content": "sunny", field: value_b}]
+        messages_c = [{"role": "tool", "content": "sunny"}]
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        keys = {make_cache_key("claude-code", m, {}) for m in (messages_a, messages_b, messages_c)}
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert len(keys) == 3
+
+    @pytest.mark.parametrize(
+        "value, no_cache, no_store",
+        [
+            (None, False, False),
+            ("no-cache", True, False),
+            ("No-Store", False, True),
+            ("no-cache, no-store", True, True),
+            ("max-age=0", False, False),
+        ],
+    )
+    def test_parse_cache_control_ヘッダ値に応じて_バイパス指定が解釈されること(self, value, no_cache, no_store):
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        directives = parse_cache_control(value)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert directives.no_cache is no_cache
+        assert directives.no_store is no_store
+
+
+class TestResponseCache:
+    """ResponseCacheクラスのユニットテスト"""
+
+    def test_get_保存済みのキーの場合_メモリから返されヒット数が増えること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        cache = ResponseCache(max_bytes=1024)
+        cache.set("key", {"content": "hello"})
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        hit = cache.get("key")
+        miss = cache.get("other")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert hit == {"content": "hello"}
+        assert miss is None
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["memory_hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_set_バイト数の上限を超えた場合_最も古く使われたエントリが追い出されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        value = {"content": "x" * 20}  # 33 bytes serialized
+        cache = ResponseCache(max_bytes=70)
+        cache.set("a", value)
+        cache.set("b", value)
+        cache.get("a")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        cache.set("c", value)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert cache.get("a") == value
+        assert cache.get("b") is None
+        assert cache.get("c") == value
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["bytes"] <= 70
+
+    def test_get_TTLを過ぎたエントリの場合_Noneが返されること(self, mocker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        now = mocker.patch("claude_code_server.cache.time.time", return_value=1000.0)
+        cache = ResponseCache(max_bytes=1024, ttl=10)
+        cache.set("key", {"content": "hello"})
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        now.return_value = 1011.0
+        result = cache.get("key")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert result is None
+        assert cache.stats()["entries"] == 0
+
+    def test_get_ディスク層がある場合_再起動後もディスクから返されること(self, tmp_path):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        path = str(tmp_path / "cache.sqlite3")
+        ResponseCache(max_bytes=1024, disk_path=path).set("key", {"content": "こんにちは"})
+        restarted = ResponseCache(max_bytes=1024, disk_path=path)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        first = restarted.get("key")
+        second = restarted.get("key")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert first == second == {"content": "こんにちは"}
+        stats = restarted.stats()
+        assert stats["disk_hits"] == 1
+        assert stats["memory_hits"] == 1
+
+    def test_from_env_キャッシュ設定がない場合_Noneが返されること(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.delenv("CLAUDE_CODE_CACHE_MAX_BYTES", raising=False)
+        monkeypatch.delenv("CLAUDE_CODE_CACHE_PATH", raising=False)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert ResponseCache.from_env() is None
@@ -0,0 +1,122 @@
+import pytest
+
+from claude_code_server.admission import AdmissionRejectedError
+from claude_code_server.credentials import CredentialPool, CredentialProfile, is_rate_limited
+
+
+class TestCredentialPool:
+    """CredentialPoolクラスのユニットテスト"""
+
+    @pytest.fixture
+    def pool(self):
+        return CredentialPool(
+            [
+                CredentialProfile("a", {"ANTHROPIC_API_KEY": "sk-ant-a"}),
+                CredentialProfile("b", {"ANTHROPIC_API_KEY": "sk-ant-b"}),
+            ],
+            cooldown=30.0,
+        )
+
+    def test_acquire_実行中の数が異なる場合_最も少ないプロファイルが選ばれること(self, pool):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        first = pool.acquire()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        second = pool.acquire()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert (first.name, second.name) == ("a", "b")
+        assert [p.outstanding for p in pool.profiles] == [1, 1]
+
+    def test_acquire_希望するプロファイルが利用可能な場合_実行中の数に関わらず選ばれること(self, pool):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        pool.acquire("a")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        profile = pool.acquire("a")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert profile.name == "a"
+        assert profile.outstanding == 2
+
+    def test_lease_レート制限エラーの場合_クールダウン中は選ばれず全て使えなければ429になること(self, pool):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        for _ in pool.profiles:
+            with pytest.raises(RuntimeError):
+                with pool.lease():
+                    raise RuntimeError("claude-code failed: Claude AI usage limit reached")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with pytest.raises(AdmissionRejectedError) as exc_info:
+            pool.acquire("a")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert exc_info.value.retry_after == 30
+        assert [p.outstanding for p in pool.profiles] == [0, 0]
+
+    def test_lease_レート制限以外のエラーの場合_クールダウンしないこと(self, pool):
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with pytest.raises(RuntimeError):
+            with pool.lease("a"):
+                raise RuntimeError("claude-code failed: boom")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert pool.acquire("a").name == "a"
+
+    def test_from_env_APIキーと設定ディレクトリが指定された場合_それぞれがプロファイルになること(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-ant-proxy")
+        monkeypatch.setenv("CLAUDE_CODE_API_KEYS", "sk-ant-a, sk-ant-b")
+        monkeypatch.setenv("CLAUDE_CODE_CONFIG_DIRS", "/accounts/c")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        pool = CredentialPool.from_env()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert [p.name for p in pool.profiles] == ["api-key-1", "api-key-2", "config-dir-1"]
+        assert pool.profiles[1].environ()["ANTHROPIC_API_KEY"] == "sk-ant-b"
+        login_env = pool.profiles[2].environ()
+        assert login_env["CLAUDE_CONFIG_DIR"] == "/accounts/c"
+        assert "ANTHROPIC_API_KEY" not in login_env
+
+    @pytest.mark.parametrize(
+        "message, expected",
+        [
+            ("API Error: 429 {\"type\":\"rate_limit_error\"}", True),
+            ("Claude AI usage limit reached|1760000000", True),
+            ("Invalid API key", False),
+        ],
+    )
+    def test_is_rate_limited_エラーメッセージに応じて_レート制限かどうかが返されること(self, message, expected):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert is_rate_limited(message) is expected
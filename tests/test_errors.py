@@ -0,0 +1,83 @@
+import pytest
+
+from claude_code_server.errors import (
+    AUTH,
+    EXIT,
+    INVALID_REQUEST,
+    NETWORK,
+    OVERLOADED,
+    RATE_LIMITED,
+    SESSION_NOT_FOUND,
+    ClaudeCodeError,
+    RetryPolicy,
+    classify_message,
+)
+
+
+class TestClassifyMessage:
+    """classify_message関数のユニットテスト"""
+
+    @pytest.mark.parametrize(
+        "message, expected",
+        [
+            ("Invalid API key · Please run /login", AUTH),
+            ("API Error: 429 {\"type\":\"rate_limit_error\"}", RATE_LIMITED),
+            ("No conversation found with session ID: abc", SESSION_NOT_FOUND),
+            ("API Error: 400 {\"type\":\"invalid_request_error\"}", INVALID_REQUEST),
+            ("API Error: 529 {\"type\":\"overloaded_error\"}", OVERLOADED),
+            ("API Error: 503 Service Unavailable", OVERLOADED),
+            ("API Error: Connection error.", NETWORK),
+            ("request to https://api.anthropic.com failed, reason: socket hang up", NETWORK),
+            ("Error: something unexpected", EXIT),
+        ],
+    )
+    def test_classify_message_エラーメッセージに応じて_エラー分類が返されること(self, message, expected):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert classify_message(message) == expected
+
+
+class TestRetryPolicy:
+    """RetryPolicyクラスのユニットテスト"""
+
+    def test_delay_一時的な障害の場合_指数的に伸びる上限以下の待ち時間が返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        policy = RetryPolicy(attempts=3, base_delay=1.0, max_delay=3.0)
+        error = ClaudeCodeError("claude-code failed: overloaded", OVERLOADED)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        delays = [[policy.delay(error, attempt) for _ in range(50)] for attempt in range(3)]
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert all(0 <= d <= 1.0 for d in delays[0])
+        assert all(0 <= d <= 2.0 for d in delays[1])
+        assert all(0 <= d <= 3.0 for d in delays[2])
+        assert max(delays[2]) > 2.0
+
+    @pytest.mark.parametrize(
+        "error, attempt, time_left",
+        [
+            (ClaudeCodeError("claude-code failed: Error", EXIT), 0, None),
+            (ClaudeCodeError("claude-code authentication failed", AUTH), 0, None),
+            (ClaudeCodeError("claude-code failed: overloaded", OVERLOADED), 2, None),
+            (ClaudeCodeError("claude-code failed: overloaded", OVERLOADED), 0, 0.0),
+            (ValueError("No user messages found"), 0, None),
+        ],
+    )
+    def test_delay_再試行しない条件の場合_Noneが返されること(self, error, attempt, time_left):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        policy = RetryPolicy(attempts=2, base_delay=0.5)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert policy.delay(error, attempt, time_left) is None
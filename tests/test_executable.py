@@ -0,0 +1,186 @@
+import os
+import sys
+
+import pytest
+
+from claude_code_server.errors import AUTH, NOT_FOUND, ClaudeCodeError
+from claude_code_server.executable import FAILED, READY, ClaudeExecutable
+
+# Stand-in for the claude CLI: --version, `auth status` and -p reading the prompt from stdin
+FAKE_CLAUDE_SCRIPT = """#!{python}
+import json, os, sys, time
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("2.1.0 (Claude Code)")
+elif args[:2] == ["auth", "status"]:
+    if os.environ.get("FAKE_AUTH_HANG") == "1":
+        time.sleep(30)
+    print(json.dumps({{"loggedIn": os.environ.get("FAKE_LOGGED_IN") == "1"}}))
+elif args[0] == "-p":
+    prompt = sys.stdin.read()
+    print(json.dumps({{"type": "result", "is_error": False, "result": "echo: " + prompt}}))
+"""
+
+
+class TestClaudeExecutable:
+    """ClaudeExecutableクラスのユニットテスト"""
+
+    @pytest.fixture
+    def fake_claude(self, tmp_path):
+        path = tmp_path / "claude"
+        path.write_text(FAKE_CLAUDE_SCRIPT.format(python=sys.executable))
+        path.chmod(0o755)
+        return str(path)
+
+    def test_check_バージョンと認証状態が正常な場合_readyになること(self, fake_claude):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        env = {**os.environ, "FAKE_LOGGED_IN": "1"}
+        executable = ClaudeExecutable(fake_claude, warmup=True, envs=[env])
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        ready = executable.check()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert ready is True
+        assert executable.status() == {
+            "status": READY,
+            "ready": True,
+            "path": fake_claude,
+            "version": "2.1.0",
+        }
+
+    def test_check_ログインしていない場合_認証エラーで失敗状態になること(self, fake_claude):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        env = {**os.environ, "FAKE_LOGGED_IN": "0"}
+        executable = ClaudeExecutable(fake_claude, envs=[env])
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        ready = executable.check()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert ready is False
+        assert executable.state == FAILED
+        assert "not logged in" in executable.status()["error"]
+
+    def test_ready_失敗後にログインした場合_再チェックでreadyに戻ること(self, fake_claude):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        env = {**os.environ, "FAKE_LOGGED_IN": "0"}
+        executable = ClaudeExecutable(fake_claude, envs=[env], recheck_interval=0)
+        executable.check()
+        env["FAKE_LOGGED_IN"] = "1"
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        ready_before = executable.ready
+        ready_after = executable.wait(timeout=30)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert ready_before is False
+        assert ready_after is True
+        assert executable.error is None
+
+    def test_ready_再チェックの間隔が経っていない場合_チェックを実行しないこと(self, fake_claude):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        env = {**os.environ, "FAKE_LOGGED_IN": "0"}
+        executable = ClaudeExecutable(fake_claude, envs=[env], recheck_interval=3600)
+        executable.check()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        ready = executable.ready
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert ready is False
+        assert executable._thread is None
+
+    def test_check_認証状態の確認がタイムアウトした場合_認証チェックを飛ばしてreadyになること(self, fake_claude):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        env = {**os.environ, "FAKE_AUTH_HANG": "1"}
+        executable = ClaudeExecutable(fake_claude, envs=[env], timeout=1)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        ready = executable.check()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert ready is True
+        assert executable.state == READY
+
+    def test_path_指定したパスが実行可能ファイルでない場合_ClaudeCodeErrorが発生すること(self, tmp_path):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        executable = ClaudeExecutable(str(tmp_path / "missing"))
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(ClaudeCodeError) as exc_info:
+            executable.path
+
+        assert exc_info.value.kind == NOT_FOUND
+        assert executable.ready is False
+
+    def test_path_PATHから見つけた場合_2回目以降は検索しないこと(self, mocker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        which = mocker.patch("shutil.which", return_value="/usr/local/bin/claude")
+        executable = ClaudeExecutable()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        paths = [executable.path for _ in range(3)]
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert paths == ["/usr/local/bin/claude"] * 3
+        which.assert_called_once_with("claude")
+
+    def test_from_env_起動時チェックが有効な場合_バックグラウンドでチェックされること(self, fake_claude, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.setenv("CLAUDE_CODE_PATH", fake_claude)
+        monkeypatch.setenv("CLAUDE_CODE_STARTUP_CHECKS", "true")
+        monkeypatch.setenv("FAKE_LOGGED_IN", "1")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        executable = ClaudeExecutable.from_env()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert executable.wait(timeout=30) is True
+        assert executable.version == "2.1.0"
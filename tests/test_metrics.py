@@ -0,0 +1,202 @@
+import json
+import urllib.error
+import urllib.request
+
+import litellm
+import pytest
+
+from claude_code_server.errors import AUTH, EXIT, ClaudeCodeError
+from claude_code_server.metrics import (
+    Counter,
+    Histogram,
+    MetricsRegistry,
+    MetricsServer,
+    ProviderMetrics,
+    classify_error,
+)
+
+
+class TestMetricsRegistry:
+    """MetricsRegistryクラスのユニットテスト"""
+
+    def test_render_ヒストグラムの場合_累積バケットと合計と件数が出力されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        registry = MetricsRegistry()
+        histogram = registry.register(
+            Histogram("latency_seconds", "Latency", ("model",), buckets=(0.1, 1))
+        )
+        histogram.observe(0.05, model="claude-code")
+        histogram.observe(0.5, model="claude-code")
+        histogram.observe(3, model="claude-code")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        output = registry.render()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert output.splitlines() == [
+            "# HELP latency_seconds Latency",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{model="claude-code",le="0.1"} 1',
+            'latency_seconds_bucket{model="claude-code",le="1"} 2',
+            'latency_seconds_bucket{model="claude-code",le="+Inf"} 3',
+            'latency_seconds_sum{model="claude-code"} 3.55',
+            'latency_seconds_count{model="claude-code"} 3',
+        ]
+
+    def test_render_ラベル値に特殊文字を含む場合_エスケープされること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        registry = MetricsRegistry()
+        counter = registry.register(Counter("errors_total", "Errors", ("key",)))
+        counter.inc(key='team "a"\\b')
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        output = registry.render()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert 'errors_total{key="team \\"a\\"\\\\b"} 1' in output
+
+    def test_render_ストアを共有するワーカーがある場合_全ワーカーの合計が出力されること(self, worker_stores):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        registries = []
+        for store in worker_stores:
+            registry = MetricsRegistry()
+            registry.register(Counter("errors_total", "Errors", ("key",)))
+            registry.register(Histogram("latency_seconds", "Latency", buckets=(1,)))
+            registry.share(store, interval=3600)
+            registries.append(registry)
+
+        for registry, latency in zip(registries, (0.5, 2)):
+            counter, histogram = registry._metrics
+            counter.inc(key="a")
+            histogram.observe(latency)
+        registries[1].publish()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        output = registries[0].render()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert 'errors_total{key="a"} 2' in output
+        assert 'latency_seconds_bucket{le="1"} 1' in output
+        assert "latency_seconds_count 2" in output
+        assert "latency_seconds_sum 2.5" in output
+
+
+class TestProviderMetrics:
+    """ProviderMetricsクラスのユニットテスト"""
+
+    @pytest.mark.parametrize(
+        "error, expected",
+        [
+            (litellm.Timeout(message="timed out", model="m", llm_provider="p"), "timeout"),
+            (ClaudeCodeError("claude-code authentication failed. Please ...", AUTH), "auth"),
+            (ClaudeCodeError("claude-code failed: boom", EXIT), "exit"),
+            (RuntimeError("claude-code authentication failed. Please ..."), "other"),
+            (GeneratorExit(), "cancelled"),
+            (ValueError("bad"), "other"),
+        ],
+    )
+    def test_classify_error_例外の種類に応じて_エラー分類が返されること(self, error, expected):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert classify_error(error) == expected
+
+    def test_trace_実行が失敗した場合_所要時間とエラー分類が記録されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        metrics = ProviderMetrics()
+        labels = {"model": "claude-code", "key": "default"}
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with pytest.raises(ClaudeCodeError):
+            with metrics.trace("claude-code", "default") as trace:
+                trace.process_started()
+                trace.process_ready()
+                trace.process_exited()
+                raise ClaudeCodeError("claude-code failed: boom", EXIT)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert metrics.duration.count(**labels) == 1
+        assert metrics.spawn.count(**labels) == 1
+        assert metrics.live_children.value(**labels) == 0
+        assert metrics.errors.value(**labels, error="exit") == 1
+
+
+class TestMetricsServer:
+    """MetricsServerクラスのユニットテスト"""
+
+    def test_metrics_GETした場合_Prometheus形式で出力されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        metrics = ProviderMetrics()
+        metrics.errors.inc(model="claude-code", key="default", error="timeout")
+        server = MetricsServer(metrics.registry, port=0, host="127.0.0.1")
+        server.start()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+                content_type = response.headers["Content-Type"]
+                body = response.read().decode("utf-8")
+        finally:
+            server.close()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert content_type.startswith("text/plain; version=0.0.4")
+        assert 'claude_code_errors_total{model="claude-code",key="default",error="timeout"} 1' in body
+
+    def test_health_readiness_チェックが通らない場合_503が返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        metrics = ProviderMetrics()
+        health = lambda: (False, {"status": "starting", "ready": False})
+        server = MetricsServer(metrics.registry, port=0, host="127.0.0.1", health=health)
+        server.start()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        try:
+            with pytest.raises(urllib.error.HTTPError) as exc_info:
+                urllib.request.urlopen(f"http://127.0.0.1:{server.port}/health/readiness")
+            body = json.loads(exc_info.value.read())
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/health/liveliness") as response:
+                liveliness_status = response.status
+        finally:
+            server.close()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert exc_info.value.code == 503
+        assert body == {"status": "starting", "ready": False}
+        assert liveliness_status == 200
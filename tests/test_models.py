@@ -0,0 +1,136 @@
+import sys
+import types
+
+import pytest
+
+from claude_code_server.models import ModelOptions, ModelRegistry
+
+
+class TestModelOptions:
+    """ModelOptionsクラスのユニットテスト"""
+
+    def test_from_params_litellm_paramsに設定がある場合_対応するCLIオプションが返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        params = {
+            "max_tokens": 100,
+            "max_turns": 3,
+            "allowed_tools": ["Read", "Bash(git *)"],
+            "disallowed_tools": "Edit, Write",
+            "system_prompt": "Answer briefly.",
+            "permission_mode": "plan",
+        }
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        options = ModelOptions.from_params("claude-code-server/haiku", params)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert options.args == [
+            "--model",
+            "haiku",
+            "--max-turns",
+            "3",
+            "--allowedTools",
+            "Read,Bash(git *)",
+            "--disallowedTools",
+            "Edit,Write",
+            "--system-prompt",
+            "Answer briefly.",
+            "--permission-mode",
+            "plan",
+        ]
+
+    @pytest.mark.parametrize("model", ["claude-code-server/claude-code", "claude-code"])
+    def test_from_params_既定のモデル名で設定がない場合_オプションが空であること(self, model):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert ModelOptions.from_params(model, {}).args == []
+
+    @pytest.mark.parametrize("max_turns", [0, -1, "many"])
+    def test_from_params_max_turnsが正の整数でない場合_ValueErrorが発生すること(self, max_turns):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(ValueError, match="max_turns"):
+            ModelOptions.from_params("claude-code", {"max_turns": max_turns})
+
+
+class TestModelRegistry:
+    """ModelRegistryクラスのユニットテスト"""
+
+    MODEL_LIST = [
+        {
+            "model_name": "claude-haiku",
+            "litellm_params": {"model": "openai/gpt-4o-mini"},
+            "model_info": {"id": "other"},
+        },
+        {
+            "model_name": "claude-haiku",
+            "litellm_params": {"model": "claude-code-server/haiku", "max_turns": 1},
+            "model_info": {"id": "haiku"},
+        },
+    ]
+
+    def test_params_登録済みのidの場合_そのデプロイメントのlitellm_paramsが返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        registry = ModelRegistry(self.MODEL_LIST)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert registry.params("haiku") == {"model": "claude-code-server/haiku", "max_turns": 1}
+        assert registry.params("unknown") == {}
+        assert registry.params(None) == {}
+
+    def test_resolve_モデル名の場合_claude_codeのデプロイメントが返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        registry = ModelRegistry(self.MODEL_LIST)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert registry.resolve("claude-haiku")["model_info"]["id"] == "haiku"
+        assert registry.resolve("claude-sonnet-4") is None
+
+    def test_model_list_プロキシの外で実行した場合_空のリストが返されること(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.delitem(sys.modules, "litellm.proxy.proxy_server", raising=False)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert ModelRegistry().model_list == []
+        assert ModelRegistry().loaded is True
+
+    def test_loaded_プロキシのルーターがまだ作成されていない場合_Falseが返されること(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        proxy = types.SimpleNamespace(llm_router=None)
+        monkeypatch.setitem(sys.modules, "litellm.proxy.proxy_server", proxy)
+        registry = ModelRegistry()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        before = registry.loaded
+        proxy.llm_router = types.SimpleNamespace(model_list=[])
+        after = registry.loaded
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert before is False
+        assert after is True
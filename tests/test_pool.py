@@ -0,0 +1,262 @@
+import asyncio
+import gc
+import json
+import sys
+import time
+
+import pytest
+
+from claude_code_server.pool import WorkerPool
+
+# Stand-in for `claude -p --input-format stream-json`: answers each stdin line with a result event
+FAKE_WORKER_SCRIPT = """
+import json, sys
+for line in sys.stdin:
+    prompt = json.loads(line)["message"]["content"][0]["text"]
+    print(json.dumps({"type": "result", "is_error": False, "result": "echo: " + prompt}), flush=True)
+"""
+
+
+async def wait_for_idle(pool, count):
+    for _ in range(100):
+        if pool.idle_count == count:
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"pool did not reach {count} idle workers")
+
+
+def wait_for_exit(pid):
+    # A killed child stays a zombie until asyncio's child watcher reaps it
+    for _ in range(100):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] == "Z":
+                    return
+        except FileNotFoundError:
+            return
+        time.sleep(0.05)
+    raise AssertionError(f"process {pid} is still running")
+
+
+async def ask(pool, worker, prompt):
+    await pool.submit(worker, prompt)
+    line = await asyncio.wait_for(worker.process.stdout.readline(), timeout=5)
+    return json.loads(line)["result"]
+
+
+class TestWorkerPool:
+    """WorkerPoolクラスのユニットテスト"""
+
+    @pytest.fixture
+    async def pool_factory(self):
+        pools = []
+
+        def factory(**kwargs):
+            pool = WorkerPool(lambda: [sys.executable, "-c", FAKE_WORKER_SCRIPT], **kwargs)
+            pools.append(pool)
+            return pool
+
+        yield factory
+
+        for pool in pools:
+            await pool.close()
+
+    @pytest.mark.asyncio
+    async def test_start_起動した場合_指定数のワーカーが事前に起動されること(self, pool_factory):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        pool = pool_factory(size=2)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        pool.start()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        await wait_for_idle(pool, 2)
+
+    @pytest.mark.asyncio
+    async def test_acquire_単発利用のワーカーの場合_応答後に新しいワーカーへ置き換えられること(self, pool_factory):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        pool = pool_factory(size=1)
+        pool.start()
+        await wait_for_idle(pool, 1)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        worker = pool.acquire()
+        result = await ask(pool, worker, "hello")
+        pool.release(worker)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert result == "echo: hello"
+        await asyncio.wait_for(worker.process.wait(), timeout=5)
+        await wait_for_idle(pool, 1)
+        replacement = pool.acquire()
+        assert replacement is not worker
+        pool.release(replacement)
+
+    @pytest.mark.asyncio
+    async def test_release_最大リクエスト数に達していない場合_同じワーカーが再利用されること(self, pool_factory):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        pool = pool_factory(size=1, max_requests_per_worker=2)
+        pool.start()
+        await wait_for_idle(pool, 1)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        worker = pool.acquire()
+        await ask(pool, worker, "first")
+        pool.release(worker)
+        reused = pool.acquire()
+        result = await ask(pool, reused, "second")
+        pool.release(reused)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert reused is worker
+        assert result == "echo: second"
+        await asyncio.wait_for(worker.process.wait(), timeout=5)
+
+    @pytest.mark.asyncio
+    async def test_acquire_アイドル中のワーカーが終了していた場合_破棄して補充されること(self, pool_factory):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        pool = pool_factory(size=1)
+        pool.start()
+        await wait_for_idle(pool, 1)
+
+        crashed = pool._idle[0]
+        await crashed.kill()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        worker = pool.acquire()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert worker is None
+        await wait_for_idle(pool, 1)
+        replacement = pool.acquire()
+        assert replacement is not crashed
+        pool.release(replacement)
+
+    @pytest.mark.asyncio
+    async def test_release_リクエストが中断された場合_ワーカーがkillされること(self, pool_factory):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        pool = pool_factory(size=1, max_requests_per_worker=5)
+        pool.start()
+        await wait_for_idle(pool, 1)
+        worker = pool.acquire()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        pool.release(worker, reusable=False)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        await asyncio.wait_for(worker.process.wait(), timeout=5)
+        assert worker.process.returncode != 0
+        await wait_for_idle(pool, 1)
+
+    @pytest.mark.asyncio
+    async def test_shutdown_起動中のワーカーがある場合_起動がキャンセルされワーカーが残らないこと(self, pool_factory):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        pool = pool_factory(size=2)
+        pool.start()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        pool.shutdown()
+        await asyncio.gather(*pool._tasks, return_exceptions=True)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert pool.idle_count == 0
+        assert pool._spawning == 0
+        assert pool.acquire() is None
+
+    # The dead workers' transports outlive their loop, as they would at interpreter exit
+    @pytest.mark.filterwarnings("ignore::ResourceWarning")
+    @pytest.mark.filterwarnings("ignore::pytest.PytestUnraisableExceptionWarning")
+    def test_from_env_イベントループの終了後にプロセスが終了する場合_ワーカーがkillされること(self, monkeypatch, mocker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.setenv("CLAUDE_CODE_POOL_SIZE", "2")
+        register = mocker.patch("atexit.register")
+        pool = WorkerPool.from_env(lambda: [sys.executable, "-c", FAKE_WORKER_SCRIPT])
+
+        async def serve():
+            pool.start()
+            await wait_for_idle(pool, 2)
+            return [worker.process.pid for worker in pool._idle]
+
+        pids = asyncio.run(serve())
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        register.call_args.args[0]()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        for pid in pids:
+            wait_for_exit(pid)
+        assert pool.idle_count == 0
+        # Collect the transports here, where their warnings are ignored
+        del pool, register
+        gc.collect()
+
+    def test_from_env_プールサイズが未設定の場合_Noneが返されること(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.delenv("CLAUDE_CODE_POOL_SIZE", raising=False)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert WorkerPool.from_env(lambda: ["claude"]) is None
+
+    def test_from_env_環境変数が設定されている場合_設定値でプールが作成されること(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.setenv("CLAUDE_CODE_POOL_SIZE", "4")
+        monkeypatch.setenv("CLAUDE_CODE_POOL_MAX_REQUESTS", "10")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        pool = WorkerPool.from_env(lambda: ["claude"])
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert pool.size == 4
+        assert pool.max_requests_per_worker == 10
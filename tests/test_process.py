@@ -0,0 +1,266 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from claude_code_server import process as process_module
+from claude_code_server.process import (
+    MARKER_ENV,
+    OutputLimitExceeded,
+    TailBuffer,
+    find_orphans,
+    reap_orphans,
+    run_process,
+)
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="requires /proc")
+
+# SIGTERMを無視し続ける子プロセス
+IGNORE_SIGTERM = (
+    "import signal, time\n"
+    "signal.signal(signal.SIGTERM, signal.SIG_IGN)\n"
+    "print('ready', flush=True)\n"
+    "time.sleep(60)\n"
+)
+
+
+def _is_running(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # ゾンビ (Z) は終了済みとみなす
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+class TestRunProcess:
+    """run_process関数のユニットテスト"""
+
+    def test_run_process_正常終了した場合_標準出力が返されること(self):
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        result = run_process([sys.executable, "-c", "import os; print(os.environ['%s'])" % MARKER_ENV])
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert result.stdout.strip() == str(os.getpid())
+
+    def test_run_process_引数の上限を超える入力を渡した場合_標準入力ですべて渡されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        # 読みながら書き出す子プロセス: 入力と出力を並行して扱わないと詰まる
+        script = "import shutil, sys\nshutil.copyfileobj(sys.stdin.buffer, sys.stdout.buffer)\n"
+        data = "プロンプト".encode("utf-8") * 300000
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        result = run_process([sys.executable, "-c", script], timeout=30, input=data)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert result.stdout.encode("utf-8") == data
+
+    def test_run_process_入力を読まずに終了した場合_標準入力のエラーが発生しないこと(self):
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        result = run_process([sys.executable, "-c", "print('done')"], input=b"x" * 1000000)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert result.stdout.strip() == "done"
+
+    def test_run_process_非ゼロで終了した場合_CalledProcessErrorが発生すること(self):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(subprocess.CalledProcessError) as exc_info:
+            run_process([sys.executable, "-c", "import sys; sys.stderr.write('boom'); sys.exit(3)"])
+
+        assert exc_info.value.returncode == 3
+        assert exc_info.value.stderr == "boom"
+
+    def test_run_process_SIGTERMを無視する子がタイムアウトした場合_SIGKILLで終了されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        cmd = [sys.executable, "-c", IGNORE_SIGTERM]
+        started = time.monotonic()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with pytest.raises(subprocess.TimeoutExpired):
+            run_process(cmd, timeout=0.5, grace=0.2)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert time.monotonic() - started < 10
+
+    def test_run_process_タイムアウトした場合_孫プロセスもまとめて終了されること(self, tmp_path):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        pid_file = tmp_path / "grandchild.pid"
+        script = (
+            "import subprocess, sys, time\n"
+            f"child = subprocess.Popen([sys.executable, '-c', {IGNORE_SIGTERM!r}])\n"
+            f"open({str(pid_file)!r}, 'w').write(str(child.pid))\n"
+            "time.sleep(60)\n"
+        )
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with pytest.raises(subprocess.TimeoutExpired):
+            run_process([sys.executable, "-c", script], timeout=1.0, grace=0.2)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        grandchild = int(pid_file.read_text())
+        assert _wait_until(lambda: not _is_running(grandchild))
+
+    def test_run_process_標準出力が上限を超えた場合_OutputLimitExceededが発生すること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        script = "import sys, time\nsys.stdout.write('x' * 100000)\nsys.stdout.flush()\ntime.sleep(60)\n"
+        started = time.monotonic()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with pytest.raises(OutputLimitExceeded) as exc_info:
+            run_process([sys.executable, "-c", script], max_output=1000, grace=0.2)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert exc_info.value.limit == 1000
+        assert time.monotonic() - started < 10
+
+    def test_run_process_標準エラー出力が多い場合_末尾だけが保持されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        script = "import sys\nsys.stderr.write('x' * 200000 + 'END')\nsys.exit(1)\n"
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        with pytest.raises(subprocess.CalledProcessError) as exc_info:
+            run_process([sys.executable, "-c", script], stderr_limit=1000)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert len(exc_info.value.stderr) == 1000
+        assert exc_info.value.stderr.endswith("xxxEND")
+
+
+class TestTailBuffer:
+    """TailBufferクラスのユニットテスト"""
+
+    def test_write_上限を超えて書き込んだ場合_最後の上限バイトだけが残ること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        buffer = TailBuffer(limit=10)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        for chunk in (b"0123456789", b"abcdef", b"ghij", b"k"):
+            buffer.write(chunk)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert buffer.getvalue() == b"bcdefghijk"
+        assert len(buffer._chunks) == 3
+
+
+class TestOrphanReaper:
+    """孤児プロセスの検出と回収のユニットテスト"""
+
+    @pytest.fixture
+    def orphan(self, monkeypatch):
+        """起動元のプロキシが終了済みのマーカーを持つプロセス"""
+        monkeypatch.setattr(process_module, "MIN_ORPHAN_AGE", 0.0)
+        env = {**os.environ, MARKER_ENV: "999999999"}
+        child = subprocess.Popen([sys.executable, "-c", IGNORE_SIGTERM], env=env, stdout=subprocess.PIPE)
+        child.stdout.readline()
+        yield child
+        child.kill()
+        child.wait()
+        child.stdout.close()
+
+    def test_find_orphans_起動元が存在しない場合_孤児として検出されること(self, orphan):
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        orphans = find_orphans()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert orphan.pid in orphans
+
+    def test_find_orphans_管理中の子プロセスの場合_孤児として検出されないこと(self, monkeypatch):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.setattr(process_module, "MIN_ORPHAN_AGE", 0.0)
+        child = subprocess.Popen(
+            [sys.executable, "-c", IGNORE_SIGTERM],
+            env=process_module.child_env(),
+            stdout=subprocess.PIPE,
+        )
+        process_module.track_child(child)
+        child.stdout.readline()
+
+        try:
+            #------------------------------
+            # 実行 (Act)
+            #------------------------------
+            orphans = find_orphans()
+        finally:
+            child.kill()
+            child.wait()
+            child.stdout.close()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert child.pid not in orphans
+
+    def test_reap_orphans_孤児がSIGTERMを無視する場合_SIGKILLで終了されること(self, orphan):
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        reaped = reap_orphans(grace=0.2)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert reaped >= 1
+        assert orphan.wait(timeout=5) == -9
@@ -0,0 +1,208 @@
+from claude_code_server.sessions import (
+    ConversationTurn,
+    SessionIndex,
+    SessionRef,
+    message_text,
+    render_tool_results,
+    render_transcript,
+    session_key,
+)
+
+
+class TestConversation:
+    """会話の変換処理のユニットテスト"""
+
+    def test_message_text_パーツのリストの場合_テキストパーツだけが連結されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        content = [
+            {"type": "text", "text": "first"},
+            {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}},
+            {"type": "text", "text": "second"},
+        ]
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert message_text(content) == "first\nsecond"
+        assert message_text(None) == ""
+
+    def test_render_transcript_履歴がある場合_履歴の後に新しいメッセージが続くこと(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        history = [
+            {"role": "user", "content": "What is 2 + 2?"},
+            {"role": "assistant", "content": "4"},
+        ]
+        message = {"role": "user", "content": "And times 3?"}
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        prompt = render_transcript(history, message)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert prompt == (
+            "<conversation_history>\n"
+            "User: What is 2 + 2?\n\n"
+            "Assistant: 4\n"
+            "</conversation_history>\n\n"
+            "And times 3?"
+        )
+
+    def test_render_transcript_関数呼び出しがある場合_呼び出しと結果が履歴に含まれること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        history = [
+            {"role": "user", "content": "Weather in Tokyo?"},
+            {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": "call_1",
+                        "type": "function",
+                        "function": {"name": "get_weather", "arguments": '{"city": "Tokyo"}'},
+                    }
+                ],
+            },
+            {"role": "tool", "tool_call_id": "call_1", "content": "Sunny"},
+            {"role": "assistant", "content": "It is sunny."},
+        ]
+        message = {"role": "user", "content": "And Osaka?"}
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        prompt = render_transcript(history, message)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert 'Assistant: [Called get_weather({"city": "Tokyo"}) as call_1]' in prompt
+        assert "Tool result (call_1): Sunny" in prompt
+        assert prompt.endswith("And Osaka?")
+
+    def test_render_tool_results_複数の結果がある場合_呼び出しごとにタグで囲まれること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        messages = [
+            {"role": "tool", "tool_call_id": "call_1", "content": "Sunny"},
+            {"role": "tool", "tool_call_id": "call_2", "content": [{"type": "text", "text": "Rain"}]},
+        ]
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        prompt = render_tool_results(messages)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert prompt == (
+            "Results of the functions you called:\n\n"
+            '<tool_result tool_call_id="call_1">\nSunny\n</tool_result>\n\n'
+            '<tool_result tool_call_id="call_2">\nRain\n</tool_result>'
+        )
+
+    def test_args_システムプロンプトと再開するセッションがある場合_対応するCLIオプションが返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        new_turn = ConversationTurn("hi", session_id="session-1")
+        resumed_turn = ConversationTurn("hi", "Be brief.", "session-1", resume=True)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert ConversationTurn("hi").args == []
+        assert new_turn.args == ["--session-id", "session-1"]
+        assert resumed_turn.args == [
+            "--append-system-prompt",
+            "Be brief.",
+            "--resume",
+            "session-1",
+        ]
+
+    def test_session_key_APIキーが異なる場合_別のキーになること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        messages = [{"role": "user", "content": "Hello"}]
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert session_key("claude-code", "key-a", messages) != session_key(
+            "claude-code", "key-b", messages
+        )
+
+
+class TestSessionIndex:
+    """SessionIndexクラスのユニットテスト"""
+
+    def test_claim_登録済みのキーの場合_セッションIDが返され索引から取り除かれること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        index = SessionIndex(max_sessions=10)
+        index.put("prefix", "session-1")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        first = index.claim("prefix")
+        second = index.claim("prefix")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert first.session_id == "session-1"
+        assert second is None
+        assert len(index) == 0
+
+    def test_put_上限を超えた場合_最も古いエントリが追い出されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        index = SessionIndex(max_sessions=2)
+        index.put("a", "session-a")
+        index.put("b", "session-b")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        index.put("c", "session-c")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert index.claim("a") is None
+        assert index.claim("b").session_id == "session-b"
+        assert index.claim("c").session_id == "session-c"
+
+    def test_claim_別のワーカーが登録したセッションの場合_一方のワーカーだけが取得できること(self, worker_stores):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        first = SessionIndex(max_sessions=10, store=worker_stores[0])
+        second = SessionIndex(max_sessions=10, store=worker_stores[1])
+        first.put("prefix", "session-1", workspace="ws-0")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        claimed = second.claim("prefix")
+        again = first.claim("prefix")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert claimed == SessionRef("session-1", None, "ws-0")
+        assert again is None
@@ -0,0 +1,265 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from claude_code_server.singleflight import FlightTimeoutError, SingleFlight
+
+
+class TestSingleFlight:
+    """SingleFlightクラスのユニットテスト"""
+
+    def test_run_同じキーで同時に呼ばれた場合_関数は一度だけ実行され全員に同じ結果が返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        flights = SingleFlight()
+        started = threading.Event()
+        finish = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            started.set()
+            finish.wait(5)
+            return {"content": "shared"}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.run("key", fn)))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(flights.run("key", fn)))
+            for _ in range(2)
+        ]
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        for thread in followers:
+            thread.start()
+        while flights.coalesced < 2:
+            time.sleep(0.001)
+        finish.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert len(calls) == 1
+        assert results == [{"content": "shared"}] * 3
+        assert flights.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_arun_先行リクエストが失敗した場合_待機中のリクエストにも同じエラーが発生すること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        flights = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.05)
+            raise RuntimeError("claude-code failed: boom")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        results = await asyncio.gather(
+            flights.arun("key", fn), flights.arun("key", fn), return_exceptions=True
+        )
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert [str(r) for r in results] == ["claude-code failed: boom"] * 2
+        assert flights.coalesced == 1
+
+    @pytest.mark.asyncio
+    async def test_astream_途中から参加した場合_それまでの出力も先頭から再生されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        flights = SingleFlight()
+        proceed = asyncio.Event()
+
+        async def producer():
+            yield "Hello "
+            await proceed.wait()
+            yield "world"
+            yield {"content": "Hello world"}
+
+        async def collect():
+            return [item async for item in flights.astream("key", producer)]
+
+        leader = asyncio.ensure_future(collect())
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(collect())
+        await asyncio.sleep(0.01)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        proceed.set()
+        results = await asyncio.gather(leader, follower)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        expected = ["Hello ", "world", {"content": "Hello world"}]
+        assert results == [expected, expected]
+
+    @pytest.mark.asyncio
+    async def test_arun_先行リクエストが出力前にキャンセルされた場合_待機中のリクエストが実行し直すこと(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        flights = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flights.arun("key", fn))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flights.arun("key", fn))
+        await asyncio.sleep(0.01)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        leader.cancel()
+        result = await follower
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert result == "done"
+        assert len(calls) == 2
+        assert leader.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_run_非同期の先行リクエストに別スレッドから参加した場合_同じ結果が返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        flights = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.1)
+            return "from loop"
+
+        leader = asyncio.ensure_future(flights.arun("key", fn))
+        await asyncio.sleep(0.01)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        follower = asyncio.to_thread(flights.run, "key", lambda: "not shared")
+        results = await asyncio.gather(leader, follower)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert results == ["from loop", "from loop"]
+
+    def test_run_先行リクエストがタイムアウトまでに終わらない場合_待機中のリクエストはFlightTimeoutErrorになること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        flights = SingleFlight()
+        started = threading.Event()
+        finish = threading.Event()
+
+        def fn():
+            started.set()
+            finish.wait(5)
+            return "late"
+
+        leader = threading.Thread(target=lambda: flights.run("key", fn))
+        leader.start()
+        started.wait(5)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        try:
+            with pytest.raises(FlightTimeoutError):
+                flights.run("key", fn, timeout=0.05)
+        finally:
+            finish.set()
+            leader.join(5)
+
+    @pytest.mark.asyncio
+    async def test_astream_先行リクエストがタイムアウトまでに終わらない場合_待機中のリクエストはFlightTimeoutErrorになること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        flights = SingleFlight()
+        proceed = asyncio.Event()
+
+        async def producer():
+            yield "Hello "
+            await proceed.wait()
+            yield "world"
+
+        async def collect(timeout=None):
+            return [item async for item in flights.astream("key", producer, timeout=timeout)]
+
+        leader = asyncio.ensure_future(collect())
+        await asyncio.sleep(0.01)
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(FlightTimeoutError):
+            await collect(timeout=0.05)
+        proceed.set()
+        assert await leader == ["Hello ", "world"]
+
+    def test_run_先行リクエストが自分だけのエラーで失敗した場合_待機中のリクエストが実行し直すこと(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        flights = SingleFlight(private_errors=(PermissionError,))
+        started = threading.Event()
+        finish = threading.Event()
+
+        def rejected():
+            started.set()
+            finish.wait(5)
+            raise PermissionError("rejected")
+
+        errors = []
+
+        def lead():
+            try:
+                flights.run("key", rejected)
+            except PermissionError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait(5)
+        results = []
+        follower = threading.Thread(target=lambda: results.append(flights.run("key", lambda: "own")))
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        follower.start()
+        while flights.coalesced < 1:
+            time.sleep(0.001)
+        finish.set()
+        for thread in [leader, follower]:
+            thread.join(5)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert len(errors) == 1
+        assert results == ["own"]
+        assert flights.in_flight == 0
@@ -0,0 +1,202 @@
+import time
+
+import pytest
+
+from claude_code_server.store import MemoryStore, SqliteStore, open_store
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    """どちらのバックエンドでも同じ振る舞いになることを確かめるためのストア"""
+    store = MemoryStore() if request.param == "memory" else SqliteStore(str(tmp_path / "s.db"))
+    yield store
+    store.close()
+
+
+class TestStateStore:
+    """MemoryStore・SqliteStoreクラスのユニットテスト"""
+
+    def test_pop_保存済みのキーの場合_一度だけ値が返されること(self, store):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        store.set("sessions", "prefix", ["session-1", None])
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        first = store.pop("sessions", "prefix")
+        second = store.pop("sessions", "prefix")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert first.value == ["session-1", None]
+        assert second is None
+
+    def test_get_有効期限を過ぎたエントリの場合_Noneが返されること(self, store):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        store.set("responses", "old", {"content": "a"}, expires_at=time.time() - 1)
+        store.set("responses", "new", {"content": "b"}, expires_at=time.time() + 60)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        old = store.get("responses", "old")
+        new = store.get("responses", "new")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert old is None
+        assert new.value == {"content": "b"}
+        assert store.items("responses") == {"new": {"content": "b"}}
+
+    def test_trim_上限を超えた場合_最も古く書き込まれたエントリから削除されること(self, store):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        for key in ("a", "b", "c"):
+            store.set("sessions", key, key)
+        # 書き直したエントリは最も新しい扱いになる
+        store.set("sessions", "a", "a2")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        evicted = store.trim("sessions", 2)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert evicted == ["b"]
+        assert store.items("sessions") == {"c": "c", "a": "a2"}
+
+    def test_acquire_slot_上限まで取得済みの場合_解放されるまで取得できないこと(self, store):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        assert store.acquire_slot("admission", 2)
+        assert store.acquire_slot("admission", 2)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        full = store.acquire_slot("admission", 2)
+        store.release_slot("admission")
+        freed = store.acquire_slot("admission", 2)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert full is False
+        assert freed is True
+        assert store.slots("admission") == 2
+
+
+class TestSqliteStore:
+    """SqliteStoreクラスを複数ワーカーで共有した場合のユニットテスト"""
+
+    def test_acquire_slot_別のワーカーが上限まで取得済みの場合_取得できないこと(self, worker_stores):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        first, second = worker_stores
+        assert first.acquire_slot("admission", 1)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        while_held = second.acquire_slot("admission", 1)
+        first.release_slot("admission")
+        after_release = second.acquire_slot("admission", 1)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert while_held is False
+        assert after_release is True
+
+    def test_acquire_slot_終了したワーカーのスロットの場合_回収されて取得できること(self, tmp_path):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        store = SqliteStore(str(tmp_path / "s.db"))
+        store._db.execute(
+            "INSERT INTO slots (name, host, pid, count) VALUES ('admission', ?, 999999999, 1)",
+            (store._host,),
+        )
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        acquired = store.acquire_slot("admission", 1)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert acquired is True
+        assert store.slots("admission") == 1
+        store.close()
+
+    def test_pop_別のワーカーが保存したエントリの場合_取り出せること(self, worker_stores):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        first, second = worker_stores
+        first.set("sessions", "prefix", ["session-1", None, None])
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        claimed = second.pop("sessions", "prefix")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert claimed.value == ["session-1", None, None]
+        assert first.get("sessions", "prefix") is None
+
+
+class TestOpenStore:
+    """open_store関数のユニットテスト"""
+
+    def test_open_store_URLを指定しない場合_プロセス内のストアが返されること(self):
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        store = open_store(None)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert isinstance(store, MemoryStore)
+        assert store.shared is False
+
+    def test_open_store_sqliteのURLの場合_そのパスのファイルが使われること(self, tmp_path):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        path = tmp_path / "state" / "state.db"
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        store = open_store(f"sqlite://{path}")
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert store.shared is True
+        assert store.path == str(path)
+        assert path.exists()
+        store.close()
+
+    def test_open_store_未知のスキームの場合_ValueErrorが発生すること(self):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(ValueError, match="Unknown state store"):
+            open_store("redis://localhost:6379")
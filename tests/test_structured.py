@@ -0,0 +1,151 @@
+import json
+
+import pytest
+
+from claude_code_server.errors import INVALID_OUTPUT, ClaudeCodeError
+from claude_code_server.structured import OutputFormat, extract_json
+
+WEATHER_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_weather",
+        "description": "Current weather of a city",
+        "parameters": {
+            "type": "object",
+            "properties": {"city": {"type": "string"}},
+            "required": ["city"],
+        },
+    },
+}
+
+
+class TestOutputFormat:
+    """OutputFormatクラスのユニットテスト"""
+
+    def test_from_params_形式の指定がない場合_Noneが返されること(self):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert OutputFormat.from_params({}) is None
+        assert OutputFormat.from_params({"response_format": {"type": "text"}}) is None
+        assert OutputFormat.from_params({"tools": [WEATHER_TOOL], "tool_choice": "none"}) is None
+
+    def test_args_json_schemaを指定した場合_そのスキーマがCLIオプションで渡されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        schema = {"type": "object", "properties": {"answer": {"type": "integer"}}}
+        params = {"response_format": {"type": "json_schema", "json_schema": {"name": "a", "schema": schema}}}
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        output_format = OutputFormat.from_params(params)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert output_format.args[0] == "--json-schema"
+        assert json.loads(output_format.args[1]) == schema
+        assert output_format.instructions is None
+
+    def test_schema_関数の呼び出しが必須の場合_一つ以上の呼び出しが要求されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        params = {"tools": [WEATHER_TOOL], "tool_choice": "required", "parallel_tool_calls": False}
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        schema = OutputFormat.from_params(params).schema
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        calls = schema["properties"]["tool_calls"]
+        assert schema["required"] == ["tool_calls"]
+        assert calls["minItems"] == 1
+        assert calls["maxItems"] == 1
+        call = calls["items"]["anyOf"][0]
+        assert call["properties"]["name"] == {"const": "get_weather"}
+        assert call["properties"]["arguments"] == WEATHER_TOOL["function"]["parameters"]
+
+    def test_from_params_tool_choiceが未知の関数を指定する場合_ValueErrorが発生すること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        params = {
+            "tools": [WEATHER_TOOL],
+            "tool_choice": {"type": "function", "function": {"name": "get_time"}},
+        }
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(ValueError, match="get_time"):
+            OutputFormat.from_params(params)
+
+    def test_parse_関数を呼び出す回答の場合_OpenAI形式のtool_callsが返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        output_format = OutputFormat.from_params({"tools": [WEATHER_TOOL]})
+        result_event = {
+            "type": "result",
+            "result": "",
+            "structured_output": {
+                "tool_calls": [{"name": "get_weather", "arguments": {"city": "Tokyo"}}]
+            },
+        }
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        content, tool_calls = output_format.parse(result_event)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert content is None
+        assert len(tool_calls) == 1
+        assert tool_calls[0]["id"].startswith("call_")
+        assert tool_calls[0]["type"] == "function"
+        assert tool_calls[0]["function"]["name"] == "get_weather"
+        assert json.loads(tool_calls[0]["function"]["arguments"]) == {"city": "Tokyo"}
+
+    def test_parse_スキーマに合わない回答の場合_ClaudeCodeErrorが発生すること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        output_format = OutputFormat.from_params({"response_format": {"type": "json_object"}})
+        result_event = {"type": "result", "structured_output": ["not", "an", "object"]}
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(ClaudeCodeError) as excinfo:
+            output_format.parse(result_event)
+        assert excinfo.value.kind == INVALID_OUTPUT
+
+
+class TestExtractJson:
+    """extract_json関数のユニットテスト"""
+
+    def test_extract_json_コードブロックで囲まれている場合_中のJSONが返されること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        text = 'Here it is:\n```json\n{"answer": 4}\n```'
+
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert extract_json(text) == {"answer": 4}
+
+    def test_extract_json_JSONを含まない場合_ClaudeCodeErrorが発生すること(self):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(ClaudeCodeError, match="not JSON"):
+            extract_json("four")
@@ -0,0 +1,169 @@
+import base64
+import os
+
+import pytest
+
+from claude_code_server.workspace import Attachment, WorkspacePool, parse_attachment
+
+
+class TestWorkspacePool:
+    """WorkspacePoolクラスのユニットテスト"""
+
+    @pytest.fixture
+    def pool(self, tmp_path):
+        return WorkspacePool(str(tmp_path / "workspaces"), size=2)
+
+    def test_release_作業ディレクトリを返却した場合_空にされて再利用されること(self, pool):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        name = pool.acquire()
+        os.makedirs(os.path.join(pool.path(name), "build"))
+        open(os.path.join(pool.path(name), "build", "out.txt"), "w").close()
+        open(os.path.join(pool.path(name), "notes.md"), "w").close()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        pool.release(name)
+        reused = pool.acquire()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert reused == name
+        assert os.listdir(pool.path(reused)) == []
+
+    def test_acquire_希望した作業ディレクトリが空いている場合_それが返されること(self, pool):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        name = pool.acquire(preferred=first)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert name == first
+
+    def test_acquire_すべて使用中の場合_新しい作業ディレクトリが追加されること(self, pool):
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        names = {pool.acquire() for _ in range(3)}
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert len(names) == 3
+        assert all(os.path.isdir(pool.path(name)) for name in names)
+
+    def test_write_attachments_添付ファイルがある場合_attachmentsディレクトリに書き込まれること(self, pool):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        name = pool.acquire()
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        pool.write_attachments(name, [Attachment("data.csv", b"a,b\n1,2\n")])
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        with open(os.path.join(pool.path(name), "attachments", "data.csv"), "rb") as f:
+            assert f.read() == b"a,b\n1,2\n"
+
+    def test_from_env_プロセスが終了する場合_作業ディレクトリのルートが削除されること(self, tmp_path, monkeypatch, mocker):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        monkeypatch.setenv("CLAUDE_CODE_WORKSPACE_POOL_SIZE", "2")
+        monkeypatch.setenv("CLAUDE_CODE_WORKSPACE_ROOT", str(tmp_path))
+        register = mocker.patch("atexit.register")
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        pool = WorkspacePool.from_env()
+        created = os.path.isdir(pool.root)
+        register.call_args.args[0]()
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert created
+        assert pool.root == str(tmp_path / f"claude-code-workspaces-{os.getpid()}")
+        assert not os.path.exists(pool.root)
+
+
+class TestParseAttachment:
+    """parse_attachment関数のユニットテスト"""
+
+    def test_parse_attachment_ファイル名にパスが含まれる場合_ファイル名だけが使われること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        data = base64.b64encode(b"%PDF-1.7").decode()
+        part = {
+            "type": "file",
+            "file": {"filename": "../../etc/report.pdf", "file_data": f"data:application/pdf;base64,{data}"},
+        }
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        attachment = parse_attachment(part)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert attachment == Attachment("report.pdf", b"%PDF-1.7")
+        assert attachment.path == "attachments/report.pdf"
+
+    def test_parse_attachment_データURLの画像の場合_内容のハッシュから名前が付けられること(self):
+        #------------------------------
+        # 準備 (Arrange)
+        #------------------------------
+        data = base64.b64encode(b"\x89PNG").decode()
+        part = {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{data}"}}
+
+        #------------------------------
+        # 実行 (Act)
+        #------------------------------
+        attachment = parse_attachment(part)
+
+        #------------------------------
+        # 検証 (Assert)
+        #------------------------------
+        assert attachment.name.startswith("file-")
+        assert attachment.name.endswith(".png")
+        assert attachment.data == b"\x89PNG"
+
+    @pytest.mark.parametrize(
+        "part",
+        [
+            {"type": "file", "file": {"file_id": "file-abc"}},
+            {"type": "image_url", "image_url": {"url": "https://example.com/cat.png"}},
+            {"type": "file", "file": {"file_data": "data:text/plain;base64,not base64!"}},
+        ],
+    )
+    def test_parse_attachment_扱えない添付の場合_ValueErrorが発生すること(self, part):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        with pytest.raises(ValueError):
+            parse_attachment(part)
+
+    def test_parse_attachment_テキストの場合_Noneが返されること(self):
+        #------------------------------
+        # 実行 & 検証 (Act & Assert)
+        #------------------------------
+        assert parse_attachment({"type": "text", "text": "hello"}) is None